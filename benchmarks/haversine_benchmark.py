@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for batch distance ranking
+
+Compares the old per-candidate haversine loop + full sort with the batch
+API in geo.py (NumPy and pure-Python paths), at 100, 1k and 10k candidates.
+
+Usage:
+    python benchmarks/haversine_benchmark.py [--repeat 50] [--top 20]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+from math import radians, cos, sin, asin, sqrt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from quickfix_common import geo  # noqa: E402
+
+
+def legacy_haversine(lon1, lat1, lon2, lat2):
+    """The per-call version previously duplicated in both service_routes.py"""
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    r = 6371
+    return c * r * 1000
+
+
+def legacy_rank(lng, lat, candidates, top):
+    results = [(legacy_haversine(lng, lat, c_lng, c_lat), i) for i, (c_lng, c_lat) in enumerate(candidates)]
+    results.sort()
+    return [i for _, i in results[:top]]
+
+
+def batch_rank(lng, lat, lngs, lats, top, use_numpy):
+    saved = geo.np
+    if not use_numpy:
+        geo.np = None
+    try:
+        distances = geo.haversine_many(lng, lat, lngs, lats)
+        return geo.nearest_indices(distances, top)
+    finally:
+        geo.np = saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(42)
+    lat, lng = 12.9716, 77.5946
+
+    print(f"NumPy available: {geo.np is not None}")
+    print(f"{'candidates':>10}  {'legacy loop':>12}  {'batch (py)':>12}  {'batch (numpy)':>14}  {'speedup':>8}")
+
+    for n in (100, 1000, 10000):
+        candidates = [(lng + random.uniform(-0.5, 0.5), lat + random.uniform(-0.5, 0.5)) for _ in range(n)]
+        lngs = [c[0] for c in candidates]
+        lats = [c[1] for c in candidates]
+
+        expected = legacy_rank(lng, lat, candidates, args.top)
+        assert batch_rank(lng, lat, lngs, lats, args.top, False) == expected
+
+        legacy = min(timeit.repeat(lambda: legacy_rank(lng, lat, candidates, args.top), number=1, repeat=args.repeat))
+        python = min(timeit.repeat(lambda: batch_rank(lng, lat, lngs, lats, args.top, False), number=1, repeat=args.repeat))
+
+        if geo.np is not None:
+            assert batch_rank(lng, lat, lngs, lats, args.top, True) == expected
+            vectorized = min(timeit.repeat(lambda: batch_rank(lng, lat, lngs, lats, args.top, True), number=1, repeat=args.repeat))
+            speedup = f"{legacy / vectorized:7.1f}x"
+            vectorized = f"{vectorized * 1000:11.3f}ms"
+        else:
+            speedup = f"{legacy / python:7.1f}x"
+            vectorized = f"{'n/a':>13}"
+
+        print(f"{n:>10}  {legacy * 1000:10.3f}ms  {python * 1000:10.3f}ms  {vectorized:>14}  {speedup:>8}")
+
+
+if __name__ == "__main__":
+    main()
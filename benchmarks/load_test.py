@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Load test for both backends, end to end
+
+Serves the users and providers backends from local threads, on one shared
+database, with Overpass replaced by its synthetic stand-in (see
+quickfix_common/overpass_adapters.py), and drives concurrent scenarios
+through the real HTTP endpoints:
+
+- nearby:      GET  /api/services/nearby (users -> Overpass + providers)
+- send:        POST /api/requests/send
+- accept_race: PUT  /api/providers/requests/<id>/accept, --race-size
+               providers at a time on each pending request; exactly one may win
+- polling:     GET  /api/providers/requests/pending-requests and
+               /provider-requests, as provider dashboards do
+- stats:       GET  /api/providers/requests/stats
+
+Reports count, errors, throughput and p50/p95/p99 latency per endpoint.
+--save writes the results as a JSON baseline; --compare checks a run against
+one and exits non-zero when an endpoint got slower (p95) or handles less
+throughput than --threshold percent allows.
+
+Needs a MongoDB server; the data goes into MONGO_URI's database (default
+quickfix_loadtest), which is dropped afterwards. --mongomock runs against an
+in-memory database instead: no geo queries (providers are scanned), and
+mongomock isn't thread-safe, so expect the odd error under concurrency and
+treat the accept race check as meaningful only on a real server. Both apps
+share this process (and its GIL), so compare numbers between runs of this
+script rather than with a deployment.
+
+Usage:
+    python benchmarks/load_test.py [--mongomock] [--scenarios nearby,send,...]
+        [--requests 200] [--concurrency 8] [--race-size 4] [--providers 200]
+        [--overpass synthetic|replay|live] [--overpass-pois 200]
+        [--overpass-latency-ms 0] [--overpass-error-rate 0]
+        [--save baseline.json] [--compare baseline.json] [--threshold 20]
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SCENARIOS = ("nearby", "send", "accept_race", "polling", "stats")
+SERVICE_TYPES = ("fuel", "garage", "towing")
+CENTER_LAT, CENTER_LNG = 12.9716, 77.5946
+
+
+# --- Servers ---
+
+def serve(app):
+    """Serve a WSGI app on a free local port; returns (server, base url)"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def load_backend(name):
+    """Import one backend's app and config modules.
+
+    Both backends use the same module names (app, config, routes, ...), so
+    after importing one its modules are taken out of sys.modules again; the
+    app keeps working through the references it already holds. quickfix_common
+    stays loaded and is shared by both, as it is one package.
+    """
+    path = os.path.join(ROOT, f"quickfix_{name}", "backend")
+    sys.path.insert(0, path)
+    try:
+        app_module = importlib.import_module("app")
+        config = importlib.import_module("config")
+    finally:
+        sys.path.remove(path)
+        for module_name, module in list(sys.modules.items()):
+            if (getattr(module, '__file__', None) or '').startswith(path + os.sep):
+                del sys.modules[module_name]
+    return app_module, config
+
+
+def start_backends(args):
+    """Both apps on one database; returns (db, providers url, users url, servers)"""
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/quickfix_loadtest")
+    os.environ["MONGO_ENSURE_INDEXES"] = "false"
+    os.environ["OVERPASS_MODE"] = args.overpass
+    os.environ["OVERPASS_SYNTHETIC_POIS"] = str(args.overpass_pois)
+    os.environ["OVERPASS_SYNTHETIC_LATENCY_MS"] = str(args.overpass_latency_ms)
+    os.environ["OVERPASS_SYNTHETIC_ERROR_RATE"] = str(args.overpass_error_rate)
+    os.environ["OVERPASS_SYNTHETIC_SEED"] = str(args.seed)
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    if args.mongomock:
+        os.environ["PROVIDER_LOOKUP"] = "scan"
+
+    client = None
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+
+    def build(name):
+        app_module, config = load_backend(name)
+        app = app_module.create_app(ensure_indexes=False)
+        if client is not None:
+            config.mongo.cx = client
+            config.mongo.db = client["quickfix_loadtest"]
+        return app, config
+
+    providers_app, providers_config = build("providers")
+    providers_server, providers_url = serve(providers_app)
+    # The users backend calls the providers backend for /nearby
+    os.environ["PROVIDERS_API_URL"] = providers_url
+    users_app, _ = build("users")
+    users_server, users_url = serve(users_app)
+
+    if client is None:
+        providers_config.bootstrap_indexes()
+    return providers_config.mongo.db, providers_url, users_url, [providers_server, users_server]
+
+
+def seed(db, count):
+    """Registered providers around the center; returns their ids"""
+    providers = []
+    for i in range(count):
+        lat = CENTER_LAT + random.uniform(-0.2, 0.2)
+        lng = CENTER_LNG + random.uniform(-0.2, 0.2)
+        providers.append({
+            "name": f"Provider {i}",
+            "business_name": f"Load Test Services {i}",
+            "email": f"provider{i}@loadtest.local",
+            "provider_type": SERVICE_TYPES[i % len(SERVICE_TYPES)],
+            "location": {"lat": lat, "lng": lng, "address": f"{i} Load Test Road"},
+            "geo": {"type": "Point", "coordinates": [lng, lat]},
+            "services": "Load test",
+            "working_hours": "24/7"
+        })
+    return [str(oid) for oid in db.providers.insert_many(providers).inserted_ids]
+
+
+# --- Scenarios ---
+# Each returns a list of calls: (endpoint, method, url, request kwargs, ok statuses)
+
+def nearby_calls(ctx, n):
+    return [
+        ("GET /api/services/nearby", "GET", f"{ctx['users']}/api/services/nearby", {"params": {
+            "service_type": random.choice(SERVICE_TYPES),
+            "lat": CENTER_LAT + random.uniform(-0.05, 0.05),
+            "lng": CENTER_LNG + random.uniform(-0.05, 0.05)
+        }}, (200,))
+        for _ in range(n)
+    ]
+
+
+def request_body(i):
+    return {
+        "service_type": random.choice(SERVICE_TYPES),
+        "customer_name": f"Load Test Customer {i}",
+        "emergency_contact": "+91 99999 00000",
+        "user_email": f"user{i % 50}@loadtest.local",
+        "vehicle_type": "car",
+        "issue_description": "Load test",
+        "location": {
+            "lat": CENTER_LAT + random.uniform(-0.1, 0.1),
+            "lng": CENTER_LNG + random.uniform(-0.1, 0.1)
+        }
+    }
+
+
+def send_calls(ctx, n):
+    return [
+        ("POST /api/requests/send", "POST", f"{ctx['users']}/api/requests/send", {"json": request_body(i)}, (201,))
+        for i in range(n)
+    ]
+
+
+def accept_race_calls(ctx, n):
+    """n accepts, --race-size providers in a row on each new pending request"""
+    race_size = ctx['race_size']
+    pending = ctx['db'].service_requests.insert_many([
+        dict(request_body(i), provider_id=None, status="pending",
+             created_at=datetime.datetime.utcnow(), updated_at=datetime.datetime.utcnow())
+        for i in range(math.ceil(n / race_size))
+    ]).inserted_ids
+    calls = []
+    for i in range(n):
+        request_id = pending[i // race_size]
+        calls.append((
+            "PUT /api/providers/requests/<id>/accept", "PUT",
+            f"{ctx['providers']}/api/providers/requests/{request_id}/accept",
+            {"json": {"provider_id": ctx['provider_ids'][i % race_size]}}, (200, 409)
+        ))
+    return calls
+
+
+def polling_calls(ctx, n):
+    calls = []
+    for i in range(n):
+        if i % 2:
+            calls.append(("GET /api/providers/requests/pending-requests", "GET",
+                          f"{ctx['providers']}/api/providers/requests/pending-requests",
+                          {"params": {"limit": 20}}, (200,)))
+        else:
+            calls.append(("GET /api/providers/requests/provider-requests", "GET",
+                          f"{ctx['providers']}/api/providers/requests/provider-requests",
+                          {"params": {"provider_id": random.choice(ctx['provider_ids'][:ctx['race_size']]),
+                                      "limit": 20}}, (200,)))
+    return calls
+
+
+def stats_calls(ctx, n):
+    return [
+        ("GET /api/providers/requests/stats", "GET", f"{ctx['providers']}/api/providers/requests/stats",
+         {"params": {"provider_id": random.choice(ctx['provider_ids'][:ctx['race_size']])}}, (200,))
+        for _ in range(n)
+    ]
+
+
+SCENARIO_CALLS = {
+    "nearby": nearby_calls,
+    "send": send_calls,
+    "accept_race": accept_race_calls,
+    "polling": polling_calls,
+    "stats": stats_calls,
+}
+
+
+# --- Running and reporting ---
+
+_sessions = threading.local()
+
+
+def run_call(call):
+    """(endpoint, status or None, latency ms, call)"""
+    endpoint, method, url, kwargs, _ = call
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    started = time.perf_counter()
+    try:
+        status = session.request(method, url, timeout=60, **kwargs).status_code
+    except requests.RequestException:
+        status = None
+    return endpoint, status, (time.perf_counter() - started) * 1000, call
+
+
+def run_scenario(calls, concurrency):
+    """Run calls on `concurrency` threads; returns (records, wall seconds)"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        records = list(pool.map(run_call, calls))
+    return records, time.perf_counter() - started
+
+
+def percentile(ordered, p):
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(records, seconds):
+    """Per-endpoint numbers for one scenario's records"""
+    by_endpoint = {}
+    for endpoint, status, latency, call in records:
+        entry = by_endpoint.setdefault(endpoint, {"latencies": [], "errors": 0})
+        entry["latencies"].append(latency)
+        if status not in call[4]:
+            entry["errors"] += 1
+
+    summary = {}
+    for endpoint, entry in by_endpoint.items():
+        ordered = sorted(entry["latencies"])
+        summary[endpoint] = {
+            "count": len(ordered),
+            "errors": entry["errors"],
+            "throughput": round(len(ordered) / seconds, 2),
+            "mean_ms": round(statistics.mean(ordered), 3),
+            "p50_ms": round(percentile(ordered, 50), 3),
+            "p95_ms": round(percentile(ordered, 95), 3),
+            "p99_ms": round(percentile(ordered, 99), 3)
+        }
+    return summary
+
+
+def race_winners(records):
+    """{request url: number of 200s} for the accept race"""
+    winners = {}
+    for _, status, _, call in records:
+        winners.setdefault(call[2], 0)
+        if status == 200:
+            winners[call[2]] += 1
+    return winners
+
+
+def print_results(results):
+    print(f"{'endpoint':<48} {'count':>6} {'errors':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for scenario, endpoints in results["scenarios"].items():
+        for endpoint, s in endpoints.items():
+            print(f"{scenario + ' ' + endpoint:<48.48} {s['count']:>6} {s['errors']:>6} {s['throughput']:>8.1f} "
+                  f"{s['p50_ms']:>7.2f}ms {s['p95_ms']:>7.2f}ms {s['p99_ms']:>7.2f}ms")
+    for check, value in results["checks"].items():
+        print(f"{check}: {value}")
+
+
+def compare(results, baseline, threshold):
+    """Regression messages for endpoints slower or slower-moving than the baseline"""
+    regressions = []
+    limit = 1 + threshold / 100
+    for scenario, endpoints in results["scenarios"].items():
+        for endpoint, current in endpoints.items():
+            before = baseline.get("scenarios", {}).get(scenario, {}).get(endpoint)
+            if not before:
+                continue
+            name = f"{scenario} {endpoint}"
+            # Ignore sub-millisecond wobble on very fast endpoints
+            if current["p95_ms"] > before["p95_ms"] * limit and current["p95_ms"] - before["p95_ms"] > 1:
+                regressions.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+            if current["throughput"] * limit < before["throughput"]:
+                regressions.append(f"{name}: throughput {before['throughput']:.1f}/s -> {current['throughput']:.1f}/s")
+            if current["errors"] > before["errors"]:
+                regressions.append(f"{name}: errors {before['errors']} -> {current['errors']}")
+    for check, value in results["checks"].items():
+        if value > baseline.get("checks", {}).get(check, 0):
+            regressions.append(f"{check}: {baseline.get('checks', {}).get(check, 0)} -> {value}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongomock', action='store_true')
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200, help="calls per scenario")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--race-size', type=int, default=4, help="providers racing for each request")
+    parser.add_argument('--providers', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10, help="untimed calls per scenario")
+    parser.add_argument('--overpass', choices=("synthetic", "replay", "live"), default="synthetic")
+    parser.add_argument('--overpass-pois', type=int, default=200, help="places per synthetic answer")
+    parser.add_argument('--overpass-latency-ms', type=float, default=0)
+    parser.add_argument('--overpass-error-rate', type=float, default=0, help="share of failing calls (0-1)")
+    parser.add_argument('--save', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--threshold', type=float, default=20, help="allowed change in percent")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    random.seed(args.seed)
+
+    db, providers_url, users_url, servers = start_backends(args)
+
+    for collection in ("providers", "service_requests", "provider_stats"):
+        db[collection].drop()
+    ctx = {
+        "db": db,
+        "users": users_url,
+        "providers": providers_url,
+        "provider_ids": seed(db, max(args.providers, args.race_size)),
+        "race_size": args.race_size
+    }
+
+    results = {
+        "created_at": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "race_size": args.race_size,
+            "providers": args.providers,
+            "database": "mongomock" if args.mongomock else "mongodb",
+            "overpass": args.overpass,
+            "overpass_latency_ms": args.overpass_latency_ms,
+            "overpass_error_rate": args.overpass_error_rate
+        },
+        "scenarios": {},
+        "checks": {}
+    }
+    try:
+        for scenario in scenarios:
+            if args.warmup:
+                run_scenario(SCENARIO_CALLS[scenario](ctx, args.warmup), args.concurrency)
+            records, seconds = run_scenario(SCENARIO_CALLS[scenario](ctx, args.requests), args.concurrency)
+            results["scenarios"][scenario] = summarize(records, seconds)
+            if scenario == "accept_race":
+                winners = race_winners(records)
+                results["checks"]["accept_race_double_wins"] = sum(1 for n in winners.values() if n > 1)
+                results["checks"]["accept_race_no_winner"] = sum(1 for n in winners.values() if n == 0)
+    finally:
+        for server in servers:
+            server.shutdown()
+        if not args.mongomock:
+            db.client.drop_database(db.name)
+
+    print(f"{args.requests} calls per scenario, concurrency {args.concurrency}, {results['settings']['database']}")
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions against {args.compare} (threshold {args.threshold:g}%):")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark for our own share of a /nearby search, without the network
+
+Overpass is replaced by its synthetic stand-in (OVERPASS_MODE=synthetic, see
+overpass_adapters.py), which answers from memory after the first call, so
+what's timed is the providers backend's code:
+
+- fetch: load_osm_tile(), i.e. the pooled client call, JSON decoding and
+         turning elements into places
+- rank:  batch distances for every place and nearest-first selection
+
+at 100, 1k and 10k places per tile.
+
+Usage:
+    python benchmarks/nearby_pipeline_benchmark.py [--repeat 50] [--latency-ms 0]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'quickfix_providers', 'backend'))
+
+CENTER_LAT, CENTER_LNG = 12.9716, 77.5946
+SIZES = (100, 1000, 10000)
+
+
+def timed(fn, repeat):
+    """Per-call times in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=0, help="simulated Overpass latency")
+    args = parser.parse_args()
+
+    os.environ["OVERPASS_MODE"] = "synthetic"
+    os.environ["OVERPASS_SYNTHETIC_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["MONGO_ENSURE_INDEXES"] = "false"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    import config
+    from quickfix_common.geo import haversine_many, nearest_indices
+    from quickfix_common.overpass_cache import tile_for
+    from routes import service_routes
+
+    tile = tile_for(CENTER_LAT, CENTER_LNG, service_routes.TILE_DEGREES)
+    adapter = config.overpass_api.session.get_adapter(config.settings["OVERPASS_URL"])
+
+    print(f"{'places':>7}  {'fetch p50':>10}  {'fetch p95':>10}  {'rank p50':>10}  {'rank p95':>10}")
+    for size in SIZES:
+        adapter.pois = size
+        adapter._bodies.clear()
+        places, lngs, lats = service_routes.load_osm_tile("fuel", tile)  # warm up
+
+        def rank():
+            distances = haversine_many(CENTER_LNG, CENTER_LAT, lngs, lats)
+            return [places[i] for i in nearest_indices(distances, max_distance=service_routes.SEARCH_RADIUS_M)]
+
+        fetch_times = sorted(timed(lambda: service_routes.load_osm_tile("fuel", tile), args.repeat))
+        rank_times = sorted(timed(rank, args.repeat))
+        p95 = max(0, int(args.repeat * 0.95) - 1)
+        print(f"{size:>7}  {statistics.median(fetch_times):8.3f}ms  {fetch_times[p95]:8.3f}ms  "
+              f"{statistics.median(rank_times):8.3f}ms  {rank_times[p95]:8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
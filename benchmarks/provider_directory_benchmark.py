@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the users backend's two provider-directory modes
+
+Seeds a throwaway database with registered providers, serves the providers
+backend from a local thread, and times the same nearest-provider lookup:
+
+- local: ProviderDirectory.find() in-process (PROVIDER_DIRECTORY_MODE=local)
+- http:  GET /api/providers/services/providers through the pooled upstream
+         client (PROVIDER_DIRECTORY_MODE=http, the default)
+
+Both return identical results, which the benchmark checks before timing.
+
+Needs a MongoDB server; the seeded data goes into MONGO_URI's database
+(default quickfix_benchmark) and is dropped afterwards. --mongomock runs
+against an in-memory mongomock database instead (no geo lookup there).
+
+Usage:
+    python benchmarks/provider_directory_benchmark.py [--providers 2000]
+        [--requests 500] [--lookup geo|memory|scan] [--mongomock]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'quickfix_providers', 'backend'))
+
+SERVICE_TYPES = ("fuel", "garage", "towing")
+CENTER_LAT, CENTER_LNG = 12.9716, 77.5946
+
+
+def seed_providers(db, count):
+    """Random providers of every service type within ~50 km of the center"""
+    from quickfix_common.provider_geo import geo_point
+
+    providers = []
+    for i in range(count):
+        location = {
+            "lat": CENTER_LAT + random.uniform(-0.45, 0.45),
+            "lng": CENTER_LNG + random.uniform(-0.45, 0.45),
+            "address": f"{i} Benchmark Road"
+        }
+        providers.append({
+            "name": f"Provider {i}",
+            "business_name": f"Benchmark Services {i}",
+            "email": f"provider{i}@benchmark.local",
+            "phone": f"+91 90000 {i:05d}",
+            "provider_type": SERVICE_TYPES[i % len(SERVICE_TYPES)],
+            "location": location,
+            "geo": geo_point(location),
+            "services": "Benchmark",
+            "working_hours": "24/7"
+        })
+    db.providers.insert_many(providers)
+
+
+def timed(fn, queries):
+    """Per-call latencies in milliseconds"""
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(*query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def report(name, latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{name:>6}  {statistics.mean(ordered):9.3f}ms  {statistics.median(ordered):9.3f}ms  "
+          f"{p95:9.3f}ms  {len(ordered) / (sum(ordered) / 1000):9.0f}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--providers', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--lookup', choices=("geo", "memory", "scan"))
+    parser.add_argument('--mongomock', action='store_true')
+    args = parser.parse_args()
+    lookup = args.lookup or ("scan" if args.mongomock else "geo")
+
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/quickfix_benchmark")
+    os.environ["MONGO_ENSURE_INDEXES"] = "false"
+    os.environ["PROVIDER_LOOKUP"] = lookup
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app import create_app
+    import config
+    from quickfix_common.http_client import UpstreamClient
+    from quickfix_common.provider_directory import ProviderDirectory
+    from quickfix_common.provider_geo import ensure_geo_index
+    from quickfix_common.provider_index import ProviderIndex
+
+    app = create_app(ensure_indexes=False)
+    if args.mongomock:
+        import mongomock
+        config.mongo.cx = mongomock.MongoClient()
+        config.mongo.db = config.mongo.cx["quickfix_benchmark"]
+    db = config.mongo.db
+
+    random.seed(42)
+    db.providers.drop()
+    seed_providers(db, args.providers)
+    if lookup == "geo":
+        ensure_geo_index(db)
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/providers/services/providers"
+
+    # What the users backend builds for each mode (see its config.py)
+    directory = ProviderDirectory(config.mongo, ProviderIndex(), lookup)
+    client = UpstreamClient("providers_api")
+
+    def local(service_type, lat, lng):
+        return directory.find(service_type, lat, lng)
+
+    def http(service_type, lat, lng):
+        response = client.get(url, params={'service_type': service_type, 'lat': lat, 'lng': lng}, timeout=10)
+        response.raise_for_status()
+        return response.json()['services']
+
+    queries = [
+        (random.choice(SERVICE_TYPES),
+         CENTER_LAT + random.uniform(-0.3, 0.3),
+         CENTER_LNG + random.uniform(-0.3, 0.3))
+        for _ in range(args.requests)
+    ]
+
+    try:
+        # Same answers either way (ids and order; HTTP rounds floats through JSON)
+        for query in queries[:5]:
+            assert [s['id'] for s in local(*query)] == [s['id'] for s in http(*query)]
+
+        # Warm up the keep-alive connection, index and caches
+        timed(local, queries[:20])
+        timed(http, queries[:20])
+
+        print(f"{args.providers} providers, {args.requests} lookups, lookup={lookup}"
+              f"{' (mongomock)' if args.mongomock else ''}")
+        print(f"{'mode':>6}  {'mean':>11}  {'median':>11}  {'p95':>11}  {'throughput':>11}")
+        report("local", timed(local, queries))
+        report("http", timed(http, queries))
+    finally:
+        server.shutdown()
+        db.providers.drop()
+
+
+if __name__ == "__main__":
+    main()
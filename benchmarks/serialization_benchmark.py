@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark for encoding a request listing as a JSON response
+
+Encodes 10k service_requests-shaped documents (ObjectId ids, datetimes)
+three ways:
+
+- patched:  what the request routes used to do, str() on every id in a
+            loop, then Flask-PyMongo's encoder (bson.json_util)
+- stdlib:   serialization.dumps_bytes() on the documents as they come from
+            MongoDB, with the standard library encoder
+- orjson:   the same with orjson, if it's installed
+
+Usage:
+    python benchmarks/serialization_benchmark.py [--documents 10000] [--repeat 20]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bson import ObjectId, json_util
+
+from quickfix_common import serialization
+
+SERVICE_TYPES = ("fuel", "towing", "garage")
+STATUSES = ("pending", "accepted", "completed", "rejected", "cancelled")
+
+
+def make_documents(count, seed=0):
+    """count documents shaped like service_requests"""
+    rng = random.Random(seed)
+    started = datetime.datetime(2026, 1, 1)
+    documents = []
+    for i in range(count):
+        created_at = started + datetime.timedelta(seconds=rng.randrange(90 * 86400), microseconds=rng.randrange(10 ** 6))
+        status = rng.choice(STATUSES)
+        documents.append({
+            "_id": ObjectId(),
+            "provider_id": ObjectId() if status != "pending" else None,
+            "service_type": rng.choice(SERVICE_TYPES),
+            "customer_name": f"Customer {i}",
+            "emergency_contact": f"+91 98{rng.randrange(10 ** 8):08d}",
+            "user_email": f"user{i}@example.com",
+            "vehicle_type": rng.choice(("car", "bike", "truck")),
+            "vehicle_model": "Model X",
+            "issue_description": "Stuck on the highway, needs help",
+            "urgency_level": rng.choice(("normal", "urgent", "emergency")),
+            "location": {"lat": 12.9 + rng.random() / 10, "lng": 77.5 + rng.random() / 10},
+            "status": status,
+            "created_at": created_at,
+            "updated_at": created_at + datetime.timedelta(minutes=rng.randrange(600))
+        })
+    return documents
+
+
+def patched(documents):
+    # The per-document conversion the routes did before serialization.py,
+    # on copies since the routes patched fresh documents from each query
+    copies = [dict(doc) for doc in documents]
+    for req in copies:
+        req['_id'] = str(req['_id'])
+        if 'provider_id' in req:
+            req['provider_id'] = str(req['provider_id'])
+    return json_util.dumps({"requests": copies}).encode()
+
+
+def timed(fn, repeat):
+    """Per-call times in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    documents = make_documents(args.documents)
+    orjson = serialization.orjson
+
+    def stdlib(documents):
+        serialization.orjson = None
+        try:
+            return serialization.dumps_bytes({"requests": documents})
+        finally:
+            serialization.orjson = orjson
+
+    candidates = [("patched", patched), ("stdlib", stdlib)]
+    if orjson is not None:
+        candidates.append(("orjson", lambda documents: serialization.dumps_bytes({"requests": documents})))
+    else:
+        print("orjson is not installed, skipping it")
+
+    print(f"{args.documents} documents, {args.repeat} runs each")
+    print(f"{'encoder':>8}  {'p50':>10}  {'p95':>10}  {'size':>10}  {'vs patched':>10}")
+    p95 = max(0, int(args.repeat * 0.95) - 1)
+    baseline = None
+    for name, fn in candidates:
+        size = len(fn(documents))  # warm up
+        times = sorted(timed(lambda: fn(documents), args.repeat))
+        median = statistics.median(times)
+        baseline = baseline or median
+        print(f"{name:>8}  {median:8.2f}ms  {times[p95]:8.2f}ms  {size / 1024:8.0f}KB  {baseline / median:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""
+Code shared by the users and providers backends
+
+Each backend's config.py puts the repository root on sys.path, so both
+import these modules as quickfix_common.<module> from their one copy here.
+Nothing in this package imports a backend's own modules, apart from the
+command-line entry points of db_indexes and provider_stats, which are run
+from a backend directory:
+
+    cd quickfix_providers/backend
+    PYTHONPATH=../.. python -m quickfix_common.provider_stats --fix
+"""
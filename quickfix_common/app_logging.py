@@ -0,0 +1,199 @@
+"""
+Structured logging for both backends
+
+configure_logging() sets up the root logger once per process:
+
+- records go through a QueueHandler onto a bounded in-memory queue and a
+  QueueListener thread formats and writes them, so request threads never
+  wait on stdout; when the queue is full records are dropped and counted
+- LOG_FORMAT=json writes one JSON object per line, LOG_FORMAT=text a plain
+  line for local development
+- LOG_LEVEL sets the level; DEBUG records are additionally sampled at
+  LOG_DEBUG_SAMPLE_RATE (0-1), so turning on debug logging in production
+  doesn't flood the output
+
+init_request_logging(app) gives every request a correlation id: the
+incoming X-Request-ID header, or a new one. It is attached to every log
+record made while handling the request, returned in the response's
+X-Request-ID header, and forwarded on calls to the other backend (see
+http_client.py), so one search can be followed across both services.
+
+Modules log with logging.getLogger(__name__) as usual. Never log passwords,
+tokens or whole request documents.
+"""
+
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from flask import g, request
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Incoming ids are reused only if they look like ids, not arbitrary text
+VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Correlation id of the request being handled on this thread (or in this
+# copied context, for work handed to a thread pool)
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# LogRecord attributes that aren't user-supplied `extra` fields
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_lock = threading.Lock()
+_listener = None
+_handler = None
+
+
+def current_request_id():
+    return request_id_var.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp each record with the current correlation id"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Let through only a fraction of DEBUG records; other levels always pass"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, request id,
+    any `extra` fields, and the traceback if there is one"""
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only the args are merged here, while they can't change under us;
+        # all formatting, tracebacks included, happens on the listener thread
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(settings, service):
+    """Route the root logger through the queue; safe to call again (e.g.
+    after a fork, when the listener thread has to be restarted)"""
+    global _listener, _handler
+
+    with _lock:
+        if _listener is not None and _listener._thread is not None and _listener._thread.is_alive():
+            return _handler
+
+        if settings["LOG_FORMAT"] == "json":
+            formatter = JsonFormatter(service)
+        else:
+            formatter = logging.Formatter(f"%(asctime)s %(levelname)s [{service}] %(name)s "
+                                          "[%(request_id)s] %(message)s")
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(formatter)
+
+        root = logging.getLogger()
+        if _handler is not None:
+            root.removeHandler(_handler)
+
+        _handler = DroppingQueueHandler(queue.Queue(maxsize=settings["LOG_QUEUE_SIZE"]))
+        _handler.addFilter(RequestIdFilter())
+        _handler.addFilter(DebugSampler(settings["LOG_DEBUG_SAMPLE_RATE"]))
+        root.addHandler(_handler)
+        root.setLevel(settings["LOG_LEVEL"].upper())
+
+        _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+        _listener.start()
+        return _handler
+
+
+def stop_logging():
+    """Flush whatever is queued and stop the listener thread"""
+    with _lock:
+        if _listener is not None and _listener._thread is not None:
+            _listener.stop()
+
+
+def logging_stats():
+    handler = _handler
+    return {
+        "queued": handler.queue.qsize() if handler else 0,
+        "dropped": handler.dropped if handler else 0
+    }
+
+
+def init_request_logging(app):
+    """Correlation ids for every request handled by app"""
+    logger = logging.getLogger("request")
+
+    @app.before_request
+    def assign_request_id():
+        incoming = request.headers.get(REQUEST_ID_HEADER, "")
+        g.request_id = incoming if VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        request_id_var.set(g.request_id)
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def return_request_id(response):
+        request_id = g.get("request_id")
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+            logger.debug("%s %s %s", request.method, request.path, response.status_code, extra={
+                "status": response.status_code,
+                "duration_ms": round(1000 * (time.perf_counter() - g.request_started), 3)
+            })
+        return response
+
+    @app.teardown_request
+    def clear_request_id(error=None):
+        # Server threads are reused; don't let the id leak into the next request
+        request_id_var.set(None)
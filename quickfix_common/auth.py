@@ -0,0 +1,131 @@
+"""
+Cached JWT verification and principal lookup
+
+Authenticated routes used to decode the token and load the user or provider
+on every call, and then the handler loaded the same document again.
+PrincipalCache keeps both in memory for a short time:
+
+- verified tokens: token -> principal id, until the token's own expiry or
+  the cache TTL, whichever is sooner
+- principals: id -> document (without the password), for the cache TTL
+
+so a repeat call with the same token costs no Mongo round trip at all, and a
+first call costs one. Routes that change a principal call invalidate(); other
+server processes see the change once their copy expires (AUTH_CACHE_TTL_SECONDS).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from bson import ObjectId
+
+
+class PrincipalCache:
+    """Bounded TTL cache of verified tokens and the documents they belong to"""
+
+    def __init__(self, mongo, collection, claim, secret_key, ttl_seconds=60, max_entries=10000):
+        self.mongo = mongo
+        self.collection = collection
+        self.claim = claim
+        self.secret_key = secret_key
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._tokens = OrderedDict()      # token -> (principal_id, expires_at)
+        self._principals = OrderedDict()  # principal_id -> (document, expires_at)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, entries, key):
+        """Fresh value for key or None; caller holds the lock"""
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return value
+
+    def _put(self, entries, key, value, expires_at):
+        """Store a value, evicting the least recently used; caller holds the lock"""
+        entries[key] = (value, expires_at)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def verify(self, token):
+        """Principal id a token was issued for.
+
+        Raises jwt.ExpiredSignatureError / jwt.InvalidTokenError like jwt.decode.
+        """
+        with self._lock:
+            principal_id = self._get(self._tokens, token)
+        if principal_id is not None:
+            return principal_id
+
+        payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+        principal_id = payload.get(self.claim)
+        if not principal_id:
+            raise jwt.InvalidTokenError(f"Token has no {self.claim}")
+
+        # Never keep a token past its own expiry
+        expires_at = time.monotonic() + self.ttl_seconds
+        if payload.get('exp'):
+            expires_at = min(expires_at, time.monotonic() + payload['exp'] - time.time())
+
+        with self._lock:
+            self._put(self._tokens, token, principal_id, expires_at)
+        return principal_id
+
+    def load(self, principal_id):
+        """Principal document without its password, or None if it doesn't exist"""
+        with self._lock:
+            document = self._get(self._principals, principal_id)
+            if document is not None:
+                self.hits += 1
+                return dict(document)
+            self.misses += 1
+
+        try:
+            object_id = ObjectId(principal_id)
+        except Exception:
+            return None
+
+        document = self.mongo.db[self.collection].find_one({"_id": object_id}, {"password": 0})
+        if document is None:
+            return None
+
+        with self._lock:
+            self._put(self._principals, principal_id, document, time.monotonic() + self.ttl_seconds)
+        return dict(document)
+
+    def authenticate(self, token):
+        """Document of the principal a token belongs to, or None if it's gone"""
+        return self.load(self.verify(token))
+
+    def invalidate(self, principal_id):
+        """Forget a principal's cached document after it changes"""
+        with self._lock:
+            self._principals.pop(str(principal_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self._principals.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tokens": len(self._tokens),
+                "principals": len(self._principals),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries
+            }
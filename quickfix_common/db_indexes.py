@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Index management for the shared quickfix database
+
+Both backends run ensure_indexes() at startup. Run this file directly to
+create the indexes, list any that are missing and check that none of the
+hot queries falls back to a collection scan, from either backend's
+directory (it builds that backend's app):
+
+    PYTHONPATH=../.. python -m quickfix_common.db_indexes
+"""
+
+import datetime
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE
+from pymongo.errors import OperationFailure
+
+# collection -> [(keys, options)], matched to the access paths in routes/
+INDEXES = {
+    "service_requests": [
+        # pending-requests: status + unassigned provider, newest first
+        # (list endpoints page on (created_at, _id), see pagination.py)
+        ([("status", ASCENDING), ("provider_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+         {"name": "status_provider_created_id"}),
+        # user-requests / my-requests
+        ([("user_email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+         {"name": "user_email_created_id"}),
+        # provider-requests
+        ([("provider_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+         {"name": "provider_created_id"}),
+        # live request feed: polling and Last-Event-ID replay
+        ([("updated_at", ASCENDING), ("_id", ASCENDING)],
+         {"name": "updated_id"}),
+        # stats counts by provider and status
+        ([("provider_id", ASCENDING), ("status", ASCENDING)],
+         {"name": "provider_status"}),
+    ],
+    "users": [
+        ([("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+    ],
+    "providers": [
+        ([("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+        ([("provider_type", ASCENDING), ("geo", GEOSPHERE)],
+         {"name": "provider_type_1_geo_2dsphere"}),
+    ],
+    # background task outbox: due tasks, oldest first, and dead ones
+    # dropped a week after their last attempt (see background_tasks.py)
+    "task_outbox": [
+        ([("available_at", ASCENDING)], {"name": "available_at"}),
+        ([("dead_at", ASCENDING)], {"name": "dead_at_ttl", "expireAfterSeconds": 7 * 24 * 3600}),
+    ],
+    "request_audit": [
+        ([("request_id", ASCENDING), ("action", ASCENDING)], {"name": "request_action_unique", "unique": True}),
+    ],
+}
+
+# (collection, filter, sort) for every query that runs on a hot path
+NEWEST_FIRST = [("created_at", DESCENDING), ("_id", DESCENDING)]
+HOT_QUERIES = [
+    ("service_requests", {"user_email": "user@example.com"}, NEWEST_FIRST),
+    ("service_requests", {"provider_id": "000000000000000000000000"}, NEWEST_FIRST),
+    ("service_requests", {"status": "pending", "provider_id": {"$in": [None, ""]}}, NEWEST_FIRST),
+    ("service_requests", {"provider_id": "000000000000000000000000", "status": "accepted"}, None),
+    ("service_requests", {"updated_at": {"$gte": datetime.datetime(1970, 1, 1)}}, [("updated_at", ASCENDING), ("_id", ASCENDING)]),
+    ("users", {"email": "user@example.com"}, None),
+    ("providers", {"email": "provider@example.com"}, None),
+]
+
+
+def ensure_indexes(db):
+    """Create every index in INDEXES (a no-op for ones that already exist).
+
+    Returns (collection, name, error) for each index the server refused to
+    build, e.g. a unique email index blocked by existing duplicates.
+    Connection errors are raised.
+    """
+    failures = []
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                db[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                failures.append((collection, options["name"], str(e)))
+    return failures
+
+
+def missing_indexes(db):
+    """(collection, name) for every index in INDEXES that doesn't exist yet"""
+    missing = []
+    for collection, indexes in INDEXES.items():
+        existing = {
+            tuple(index["key"].items())
+            for index in db[collection].list_indexes()
+        }
+        for keys, options in indexes:
+            if tuple(keys) not in existing:
+                missing.append((collection, options["name"]))
+    return missing
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def collection_scans(db):
+    """Hot queries whose winning plan includes a COLLSCAN"""
+    scans = []
+    for collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(plan):
+            scans.append((collection, query, sort))
+    return scans
+
+
+def check_query_plans(db):
+    """Raise RuntimeError if any hot query does a collection scan"""
+    scans = collection_scans(db)
+    if scans:
+        details = "\n".join(f"  {c}.find({q}).sort({s})" for c, q, s in scans)
+        raise RuntimeError(f"Hot queries doing a COLLSCAN:\n{details}")
+
+
+if __name__ == "__main__":
+    import sys
+    from app import create_app
+    from config import mongo
+
+    create_app(ensure_indexes=False)
+
+    print("Ensuring indexes...")
+    for collection, name, error in ensure_indexes(mongo.db):
+        print(f"❌ {collection}.{name}: {error}")
+
+    missing = missing_indexes(mongo.db)
+    for collection, name in missing:
+        print(f"❌ Missing index {collection}.{name}")
+
+    try:
+        check_query_plans(mongo.db)
+        print("✅ No hot query does a COLLSCAN")
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    sys.exit(1 if missing else 0)
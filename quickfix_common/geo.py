@@ -0,0 +1,102 @@
+import heapq
+from math import radians, cos, sin, asin, sqrt, pi
+
+# NumPy is optional: batch distances fall back to plain Python without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_M = 6371 * 1000
+# Length of one degree of latitude on the same sphere haversine uses
+METERS_PER_DEGREE = EARTH_RADIUS_M * pi / 180
+
+# Below this many points the NumPy call overhead outweighs the speedup
+NUMPY_MIN_BATCH = 32
+
+
+# Haversine formula to calculate distance in meters
+def haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1 
+    dlat = lat2 - lat1 
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a)) 
+    return c * EARTH_RADIUS_M
+
+
+def _haversine_many_py(lon, lat, lons, lats):
+    lon, lat = radians(lon), radians(lat)
+    cos_lat = cos(lat)
+    distances = []
+    for lon2, lat2 in zip(lons, lats):
+        lon2, lat2 = radians(lon2), radians(lat2)
+        a = sin((lat2 - lat) / 2) ** 2 + cos_lat * cos(lat2) * sin((lon2 - lon) / 2) ** 2
+        distances.append(2 * asin(sqrt(a)) * EARTH_RADIUS_M)
+    return distances
+
+
+def _haversine_many_np(lon, lat, lons, lats):
+    lon, lat = np.radians(lon), np.radians(lat)
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(a)) * EARTH_RADIUS_M
+
+
+def haversine_many(lon, lat, lons, lats, use_numpy=None):
+    """Distances in meters from (lon, lat) to every (lons[i], lats[i]).
+
+    Returns a list of floats. Uses one vectorized NumPy pass when NumPy is
+    installed and the batch is big enough, plain Python otherwise.
+    """
+    if use_numpy is None:
+        use_numpy = np is not None and len(lons) >= NUMPY_MIN_BATCH
+    if use_numpy:
+        return _haversine_many_np(lon, lat, lons, lats).tolist()
+    return _haversine_many_py(lon, lat, lons, lats)
+
+
+def bounding_box(lat, lng, radius):
+    """(min_lat, max_lat, min_lng, max_lng) around every point within
+    `radius` meters of (lat, lng).
+
+    A cheap prefilter before exact distances: nothing outside the box can be
+    in range. The longitude bounds are None when the box reaches a pole or
+    crosses the antimeridian, where longitude says nothing useful.
+    """
+    lat_span = radius / METERS_PER_DEGREE
+    min_lat, max_lat = lat - lat_span, lat + lat_span
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90), min(max_lat, 90), None, None
+
+    # Longitude degrees are shortest at the box's edge farthest from the equator
+    lng_span = radius / (METERS_PER_DEGREE * cos(radians(max(abs(min_lat), abs(max_lat)))))
+    if lng - lng_span < -180 or lng + lng_span > 180:
+        return min_lat, max_lat, None, None
+    return min_lat, max_lat, lng - lng_span, lng + lng_span
+
+
+def nearest_indices(distances, k=None, max_distance=None):
+    """Indices of the k smallest distances (all if k is None), nearest first.
+
+    Distances above max_distance are dropped. Uses a partial sort rather
+    than sorting everything when only the top k are needed.
+    """
+    n = len(distances)
+    if np is not None and n >= NUMPY_MIN_BATCH:
+        values = np.asarray(distances, dtype=np.float64)
+        candidates = np.arange(n)
+        if max_distance is not None:
+            candidates = candidates[values <= max_distance]
+        if k is not None and k < len(candidates):
+            top = np.argpartition(values[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        return candidates[np.argsort(values[candidates], kind='stable')].tolist()
+
+    candidates = range(n)
+    if max_distance is not None:
+        candidates = [i for i in candidates if distances[i] <= max_distance]
+    if k is not None and k < len(candidates):
+        return heapq.nsmallest(k, candidates, key=distances.__getitem__)
+    return sorted(candidates, key=distances.__getitem__)
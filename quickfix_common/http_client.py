@@ -0,0 +1,210 @@
+"""
+Pooled HTTP client for upstream services (Overpass, the providers backend)
+
+One UpstreamClient per upstream, created once per process:
+
+- a requests.Session with its own keep-alive connection pool
+- a concurrency limit, so a slow upstream can tie up at most
+  `max_concurrent` of our threads; callers beyond that are turned away
+- retries with full-jitter exponential backoff for connection errors,
+  timeouts and 429/502/503/504, within the caller's overall timeout
+- a circuit breaker: after `failure_threshold` failed calls in a row (a
+  connection error, a timeout, a 429 or any 5xx; other 4xx answers are the
+  caller's problem, not the upstream's) the upstream is skipped for
+  `reset_seconds`, then one trial call decides whether to close it again
+
+Calls that are turned away raise UpstreamUnavailable right away instead of
+waiting on a host that is known to be down or saturated.
+
+Clients for our own services pass forward_request_id=True so the current
+request's correlation id (see app_logging.py) travels with the call.
+
+A transport adapter can be passed to replace the network altogether, e.g.
+the Overpass stand-ins in overpass_adapters.py.
+"""
+
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .app_logging import REQUEST_ID_HEADER, current_request_id
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+def is_failure(status):
+    """True for statuses that count against the upstream's circuit"""
+    return status == 429 or status >= 500
+
+
+class UpstreamUnavailable(RuntimeError):
+    """The circuit is open or the upstream is at its concurrency limit"""
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open after a pause"""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+
+    def allow(self):
+        """True if a call may go ahead now"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                # Let exactly one trial call through
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class UpstreamClient:
+    """Keep-alive session plus concurrency limit, retries and circuit breaker"""
+
+    def __init__(self, name, max_connections=20, max_concurrent=20, retries=2,
+                 backoff_seconds=0.2, failure_threshold=5, reset_seconds=30,
+                 acquire_timeout=0.5, user_agent='QuickFix/1.0', forward_request_id=False,
+                 adapter=None):
+        self.name = name
+        self.forward_request_id = forward_request_id
+        self.max_concurrent = max_concurrent
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.acquire_timeout = acquire_timeout
+
+        self.session = requests.Session()
+        if adapter is None:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = user_agent
+
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+        self.in_flight = 0
+
+    def _count(self, field, amount=1):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def request(self, method, url, timeout, idempotent=None, **kwargs):
+        """Send a request; timeout (seconds) bounds the whole call, retries included.
+
+        Returns the final response, whatever its status. Raises
+        UpstreamUnavailable without calling out when the circuit is open or
+        every slot is busy, and the last requests exception if every
+        attempt failed to get a response.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in ('GET', 'HEAD', 'OPTIONS')
+        if self.forward_request_id and current_request_id():
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), REQUEST_ID_HEADER: current_request_id()}
+
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._count('rejected')
+            raise UpstreamUnavailable(f"{self.name}: too many concurrent calls")
+        if not self.breaker.allow():
+            self._slots.release()
+            self._count('rejected')
+            raise UpstreamUnavailable(f"{self.name}: circuit open")
+
+        self._count('calls')
+        self._count('in_flight')
+        deadline = time.monotonic() + timeout
+        attempts = 1 + (self.retries if idempotent else 0)
+        try:
+            for attempt in range(attempts):
+                last_attempt = attempt == attempts - 1
+                remaining = deadline - time.monotonic()
+                try:
+                    response = self.session.request(method, url, timeout=remaining, **kwargs)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    if last_attempt or not self._backoff(attempt, deadline):
+                        self.breaker.record_failure()
+                        self._count('failed')
+                        raise
+                    continue
+
+                if response.status_code in RETRY_STATUSES:
+                    if last_attempt or not self._backoff(attempt, deadline):
+                        self.breaker.record_failure()
+                        self._count('failed')
+                        return response
+                    response.close()
+                    continue
+
+                if is_failure(response.status_code):
+                    # e.g. a 500: not worth retrying, but the upstream is unwell
+                    self.breaker.record_failure()
+                    self._count('failed')
+                else:
+                    self.breaker.record_success()
+                return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            raise
+        except Exception:
+            # Anything unexpected still settles a half-open circuit
+            self.breaker.record_failure()
+            self._count('failed')
+            raise
+        finally:
+            self._count('in_flight', -1)
+            self._slots.release()
+
+    def _backoff(self, attempt, deadline):
+        """Sleep before the next attempt; False if there's no time left for it"""
+        delay = random.uniform(0, self.backoff_seconds * (2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            return False
+        self._count('retried')
+        time.sleep(delay)
+        return True
+
+    def get(self, url, timeout, **kwargs):
+        return self.request('GET', url, timeout, **kwargs)
+
+    def post(self, url, timeout, **kwargs):
+        return self.request('POST', url, timeout, **kwargs)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "circuit": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "times_opened": self.breaker.times_opened,
+                "in_flight": self.in_flight,
+                "max_concurrent": self.max_concurrent,
+                "calls": self.calls,
+                "retried": self.retried,
+                "failed": self.failed,
+                "rejected": self.rejected
+            }
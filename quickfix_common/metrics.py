@@ -0,0 +1,299 @@
+"""
+Request, span and MongoDB command metrics in Prometheus text format
+
+One Metrics registry per process (see config.py), fed by:
+
+- init_metrics(app): request count and latency per route, method and
+  status, recorded in after_request, and the GET /metrics endpoint
+- metrics.span(name): a `with` block timing a named step inside a handler,
+  e.g. an upstream call or the distance ranking in /nearby
+- CommandMetrics: a pymongo command listener timing every command per
+  collection and operation
+
+Recording is a dict lookup and a few additions under one lock, so it stays
+in the microseconds. Each server process keeps its own numbers. Under
+gunicorn set METRICS_DIR to a directory shared by the workers: each worker
+then writes a snapshot there every METRICS_FLUSH_SECONDS and /metrics sums
+all of them, so it doesn't matter which worker answers the scrape. A worker
+that exits folds its numbers into one exited-workers file and removes its
+own, and the master empties the directory before forking the first workers.
+"""
+
+import bisect
+import contextlib
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import Response, g, request
+from pymongo import monitoring
+
+# Latency buckets in seconds, upper bounds (+Inf is implied)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (help text, label names)
+HISTOGRAMS = {
+    "quickfix_http_request_duration_seconds": ("Request latency by route", ("route", "method")),
+    "quickfix_span_duration_seconds": ("Named steps inside handlers", ("span",)),
+    "quickfix_mongo_command_duration_seconds": ("MongoDB command latency", ("collection", "command")),
+}
+COUNTERS = {
+    "quickfix_http_requests_total": ("Requests by route, method and status", ("route", "method", "status")),
+    "quickfix_span_errors_total": ("Named steps that raised", ("span",)),
+    "quickfix_mongo_command_failures_total": ("Failed MongoDB commands", ("collection", "command")),
+}
+
+
+class Metrics:
+    """Counters and fixed-bucket histograms, keyed by label values"""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop_flusher = threading.Event()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {name: {} for name in COUNTERS}
+            # labels -> [bucket counts..., +Inf count, sum]
+            self._histograms = {name: {} for name in HISTOGRAMS}
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            series = self._counters[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, seconds):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            values = self._histograms[name].get(labels)
+            if values is None:
+                values = self._histograms[name][labels] = [0] * (len(BUCKETS) + 2)
+            values[index] += 1
+            values[-1] += seconds
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """Time a block as quickfix_span_duration_seconds{span=name}"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("quickfix_span_errors_total", (name,))
+            raise
+        finally:
+            self.observe("quickfix_span_duration_seconds", (name,), time.perf_counter() - started)
+
+    # --- Snapshots and exposition ---
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": {name: [[list(labels), value] for labels, value in series.items()]
+                             for name, series in self._counters.items()},
+                "histograms": {name: [[list(labels), list(values)] for labels, values in series.items()]
+                               for name, series in self._histograms.items()},
+            }
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+
+    def _exited_path(self):
+        return os.path.join(self.directory, "metrics-exited.json")
+
+    def flush(self):
+        """Write this process's snapshot to METRICS_DIR"""
+        path = self._snapshot_path()
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    def start_flusher(self, interval):
+        """Write a snapshot every `interval` seconds from a daemon thread
+        (call after forking; threads don't survive it)"""
+        if not self.directory or (self._flusher and self._flusher.is_alive()):
+            return
+
+        def run():
+            while not self._stop_flusher.wait(interval):
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop_flusher.clear()
+        self._flusher = threading.Thread(target=run, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def retire(self):
+        """Fold this process's numbers into the exited-workers file and
+        remove its snapshot (gunicorn worker_exit), so METRICS_DIR holds one
+        file per live worker and counters still don't go backwards"""
+        self._stop_flusher.set()
+        if self._flusher is not None:
+            self._flusher.join(1)
+
+        # Workers can exit at the same time; one at a time rewrites the total
+        with open(os.path.join(self.directory, "metrics-exited.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots = [self.snapshot()]
+            try:
+                with open(self._exited_path()) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                pass
+            counters, histograms = _merge(snapshots)
+            total = {
+                "counters": {name: [[list(labels), value] for labels, value in series.items()]
+                             for name, series in counters.items()},
+                "histograms": {name: [[list(labels), values] for labels, values in series.items()]
+                               for name, series in histograms.items()},
+            }
+            with open(self._exited_path() + ".tmp", "w") as f:
+                json.dump(total, f)
+            os.replace(self._exited_path() + ".tmp", self._exited_path())
+
+        try:
+            os.remove(self._snapshot_path())
+        except FileNotFoundError:
+            pass
+
+    def clear_directory(self):
+        """Delete every snapshot in METRICS_DIR, including the exited-workers
+        total. Call in the gunicorn master before it forks, so numbers from
+        an earlier run aren't added to this one."""
+        if not self.directory:
+            return
+        for path in glob.glob(os.path.join(self.directory, "metrics-*")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _collect(self):
+        """Snapshots of every process to report: this one live, plus the
+        files the other workers and the exited-workers total left in
+        METRICS_DIR"""
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own = self._snapshot_path()
+            for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+                if path == own:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+    def render(self, gauges=None):
+        """Prometheus text exposition of every process's metrics, plus
+        `gauges` ({name: (help, value)}) for this process"""
+        counters, histograms = _merge(self._collect())
+
+        lines = []
+        for name, series in counters.items():
+            help_text, label_names = COUNTERS[name]
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_labels(label_names, labels)} {value}")
+
+        for name, series in histograms.items():
+            help_text, label_names = HISTOGRAMS[name]
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for labels, values in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), values[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(label_names + ('le',), labels + (str(bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(label_names, labels)} {values[-1]:.6f}")
+                lines.append(f"{name}_count{_labels(label_names, labels)} {cumulative}")
+
+        for name, (help_text, value) in (gauges or {}).items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+        return "\n".join(lines) + "\n"
+
+
+def _merge(snapshots):
+    """Sum snapshots into ({name: {labels: value}}, {name: {labels: values}})"""
+    counters = {name: {} for name in COUNTERS}
+    histograms = {name: {} for name in HISTOGRAMS}
+    for snapshot in snapshots:
+        for name, series in snapshot["counters"].items():
+            for labels, value in series:
+                key = tuple(labels)
+                counters[name][key] = counters[name].get(key, 0) + value
+        for name, series in snapshot["histograms"].items():
+            for labels, values in series:
+                total = histograms[name].setdefault(tuple(labels), [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+    return counters, histograms
+
+
+def _labels(names, values):
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Time every MongoDB command by collection and command name"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._collections = {}  # (connection_id, request_id) -> collection
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.metrics.observe("quickfix_mongo_command_duration_seconds",
+                             (collection, event.command_name), event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        labels = (collection, event.command_name)
+        self.metrics.observe("quickfix_mongo_command_duration_seconds", labels, event.duration_micros / 1e6)
+        self.metrics.inc("quickfix_mongo_command_failures_total", labels)
+
+
+def init_metrics(app, metrics, gauges=None):
+    """Per-route request metrics for app, and GET /metrics.
+
+    gauges is an optional callable returning {name: (help, value)} read at
+    scrape time, e.g. connection pool counters.
+    """
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get("metrics_started")
+        if started is not None:
+            # The route pattern, not the path, so ids don't explode the labels
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            metrics.observe("quickfix_http_request_duration_seconds", (route, request.method),
+                            time.perf_counter() - started)
+            metrics.inc("quickfix_http_requests_total", (route, request.method, str(response.status_code)))
+        return response
+
+    @app.route('/metrics')
+    def get_metrics():
+        return Response(metrics.render(gauges() if gauges else None),
+                        mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,155 @@
+"""
+MongoDB client settings and connection pool metrics
+
+Both backends build their client the same way from the MONGO_* settings in
+config.py (environment, .env or a QUICKFIX_SETTINGS file):
+
+- client_options() turns the pool and timeout settings into MongoClient
+  keyword arguments
+- ConfiguredDatabase applies per-collection read preference and write
+  concern, so routes keep writing mongo.db.<collection>
+- PoolMetrics is a pymongo pool listener counting checked-out connections,
+  checkout wait time, failures and pool clears, for /health
+"""
+
+import json
+import threading
+
+from pymongo import monitoring
+from pymongo.database import Database
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from pymongo.write_concern import WriteConcern
+
+
+def client_options(settings):
+    """MongoClient keyword arguments from the MONGO_* settings"""
+    options = {
+        "maxPoolSize": settings["MONGO_MAX_POOL_SIZE"],
+        "minPoolSize": settings["MONGO_MIN_POOL_SIZE"],
+        "serverSelectionTimeoutMS": settings["MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+        "connectTimeoutMS": settings["MONGO_CONNECT_TIMEOUT_MS"],
+        "readPreference": settings["MONGO_READ_PREFERENCE"],
+    }
+    # 0 means wait for a free connection as long as it takes (pymongo's default)
+    if settings["MONGO_WAIT_QUEUE_TIMEOUT_MS"]:
+        options["waitQueueTimeoutMS"] = settings["MONGO_WAIT_QUEUE_TIMEOUT_MS"]
+    if settings["MONGO_WRITE_CONCERN"]:
+        options["w"] = _write_concern_w(settings["MONGO_WRITE_CONCERN"])
+    return options
+
+
+def _write_concern_w(value):
+    """Write concern w value: "majority" stays a string, "1" becomes 1"""
+    return int(value) if str(value).isdigit() else value
+
+
+def parse_collection_options(value):
+    """Per-collection options from a dict or its JSON text, e.g.
+
+        {"providers": {"read_preference": "secondaryPreferred"},
+         "service_requests": {"write_concern": "majority"}}
+    """
+    if not value:
+        return {}
+    options = json.loads(value) if isinstance(value, str) else dict(value)
+
+    parsed = {}
+    for collection, collection_options in options.items():
+        kwargs = {}
+        if collection_options.get("read_preference"):
+            mode = read_pref_mode_from_name(collection_options["read_preference"])
+            kwargs["read_preference"] = make_read_preference(mode, None)
+        if collection_options.get("write_concern") is not None:
+            kwargs["write_concern"] = WriteConcern(w=_write_concern_w(collection_options["write_concern"]))
+        parsed[collection] = kwargs
+    return parsed
+
+
+class ConfiguredDatabase(Database):
+    """Database whose collections pick up their configured read/write options"""
+
+    def __init__(self, client, name, collection_options=None, **kwargs):
+        super().__init__(client, name, **kwargs)
+        self._collection_options = collection_options or {}
+
+    def __getitem__(self, name):
+        return self.get_collection(name, **self._collection_options.get(name, {}))
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters, summed over every server the client uses"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = {}
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.pool_clears = 0
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(self.open - 1, 0)
+
+    def connection_checked_out(self, event):
+        waited = getattr(event, "duration", 0.0) or 0.0
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            reason = str(event.reason)
+            self.checkout_failures[reason] = self.checkout_failures.get(reason, 0) + 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    # Events the metrics don't need
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open_connections": self.open,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "wait_seconds_total": round(self.wait_seconds, 6),
+                "avg_wait_ms": round(1000 * self.wait_seconds / self.checkouts, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait_seconds, 3),
+                "pool_clears": self.pool_clears
+            }
@@ -0,0 +1,215 @@
+"""
+Stand-ins for the Overpass API, for offline runs and benchmarks
+
+OVERPASS_MODE picks what the Overpass UpstreamClient (see http_client.py)
+actually talks to. Each mode is a requests transport adapter mounted on the
+client's session, so retries, the circuit breaker and the concurrency limit
+behave exactly as they do against the real service:
+
+- "live":      the real OVERPASS_URL (default)
+- "record":    the real service, saving every successful answer as a
+               fixture in OVERPASS_FIXTURES_DIR
+- "replay":    answers only from those fixtures; a query without one fails
+               with FixtureMissing and never reaches the network
+- "synthetic": OVERPASS_SYNTHETIC_POIS named places scattered around the
+               queried point, the same ones for the same point every time,
+               after OVERPASS_SYNTHETIC_LATENCY_MS (plus up to
+               OVERPASS_SYNTHETIC_JITTER_MS); OVERPASS_SYNTHETIC_ERROR_RATE
+               of the calls fail with a 503, a 429 or a dropped connection
+
+Fixtures are keyed by the query, whitespace aside, so they survive
+reformatting build_overpass_query() but not changing what it asks for.
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from http import HTTPStatus
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+MODES = ("live", "record", "replay", "synthetic")
+
+# around:<radius>,<lat>,<lng> in an Overpass QL query
+AROUND = re.compile(r"around:([\d.]+),(-?[\d.]+),(-?[\d.]+)")
+METERS_PER_DEGREE = 111320.0
+
+
+class FixtureMissing(requests.exceptions.RequestException):
+    """Replay mode has no recorded answer for this query"""
+
+
+def _body_text(request):
+    body = request.body or ""
+    return body.decode() if isinstance(body, bytes) else body
+
+
+def fixture_key(request):
+    """Stable name for a request: method, URL and the query minus whitespace"""
+    query = " ".join(_body_text(request).split())
+    return hashlib.sha256(f"{request.method} {request.url}\n{query}".encode()).hexdigest()[:32]
+
+
+def build_response(request, status, content, headers=None):
+    """A requests.Response made up locally"""
+    response = requests.Response()
+    response.status_code = status
+    response._content = content
+    response.headers = CaseInsensitiveDict(headers or {"Content-Type": "application/json"})
+    response.encoding = "utf-8"
+    response.url = request.url
+    response.request = request
+    response.reason = HTTPStatus(status).phrase
+    return response
+
+
+class RecordingAdapter(HTTPAdapter):
+    """The real transport, keeping every 200 response as a fixture"""
+
+    def __init__(self, fixtures_dir, **kwargs):
+        super().__init__(**kwargs)
+        self.fixtures_dir = fixtures_dir
+        os.makedirs(fixtures_dir, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            path = os.path.join(self.fixtures_dir, f"{fixture_key(request)}.json")
+            with open(path + ".tmp", "w") as f:
+                json.dump({
+                    "method": request.method,
+                    "url": request.url,
+                    "query": _body_text(request),
+                    "status": response.status_code,
+                    "content_type": response.headers.get("Content-Type", "application/json"),
+                    "body": response.text
+                }, f)
+            os.replace(path + ".tmp", path)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answers from recorded fixtures only"""
+
+    def __init__(self, fixtures_dir):
+        super().__init__()
+        self.fixtures_dir = fixtures_dir
+        self._cache = {}
+
+    def send(self, request, **kwargs):
+        key = fixture_key(request)
+        fixture = self._cache.get(key)
+        if fixture is None:
+            try:
+                with open(os.path.join(self.fixtures_dir, f"{key}.json")) as f:
+                    fixture = self._cache[key] = json.load(f)
+            except FileNotFoundError:
+                raise FixtureMissing(f"No recorded Overpass response {key} in {self.fixtures_dir}",
+                                     request=request)
+        return build_response(request, fixture["status"], fixture["body"].encode(),
+                              {"Content-Type": fixture["content_type"]})
+
+    def close(self):
+        pass
+
+
+class SyntheticAdapter(BaseAdapter):
+    """Deterministic made-up places, with optional latency and failures"""
+
+    def __init__(self, pois=200, latency_seconds=0.0, jitter_seconds=0.0, error_rate=0.0, seed=0):
+        super().__init__()
+        self.pois = pois
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.error_rate = error_rate
+        self.seed = seed
+        # Latency and failures are random; the places themselves are not
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Encoded answers by query point, so the stand-in costs next to
+        # nothing next to the code being measured
+        self._bodies = {}
+
+    def places(self, lat, lng, radius):
+        """The same `pois` nodes within radius meters of a point every time"""
+        rng = random.Random(f"{self.seed}:{lat:.6f}:{lng:.6f}:{radius:.0f}")
+        meters_per_degree_lng = METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)
+        elements = []
+        for _ in range(self.pois):
+            # Uniform over the disc, not bunched up at the center
+            distance = radius * math.sqrt(rng.random())
+            bearing = rng.uniform(0, 2 * math.pi)
+            node_id = rng.getrandbits(40)
+            tags = {"name": f"Synthetic Place {node_id}"}
+            if rng.random() < 0.5:
+                tags["phone"] = f"+91 80{node_id % 10 ** 8:08d}"
+            elements.append({
+                "type": "node",
+                "id": node_id,
+                "lat": round(lat + distance * math.cos(bearing) / METERS_PER_DEGREE, 7),
+                "lon": round(lng + distance * math.sin(bearing) / meters_per_degree_lng, 7),
+                "tags": tags
+            })
+        return elements
+
+    def send(self, request, timeout=None, **kwargs):
+        with self._lock:
+            delay = self.latency_seconds + self._random.uniform(0, self.jitter_seconds)
+            failure = self._random.choice(("503", "429", "connection")) \
+                if self._random.random() < self.error_rate else None
+
+        # requests passes (connect, read) or a single number
+        limit = timeout[-1] if isinstance(timeout, tuple) else timeout
+        if limit is not None and delay > limit:
+            time.sleep(limit)
+            raise requests.exceptions.ReadTimeout(f"Synthetic Overpass took longer than {limit}s",
+                                                  request=request)
+        time.sleep(delay)
+
+        if failure == "connection":
+            raise requests.exceptions.ConnectionError("Synthetic Overpass dropped the connection",
+                                                      request=request)
+        if failure:
+            return build_response(request, int(failure), b'{"remark": "synthetic failure"}')
+
+        match = AROUND.search(_body_text(request))
+        key = match.groups() if match else None
+        body = self._bodies.get(key)
+        if body is None:
+            elements = self.places(float(match.group(2)), float(match.group(3)), float(match.group(1))) if match else []
+            body = json.dumps({"elements": elements}).encode()
+            if len(self._bodies) >= 1024:
+                self._bodies.clear()
+            self._bodies[key] = body
+        return build_response(request, 200, body)
+
+    def close(self):
+        pass
+
+
+def overpass_adapter(settings):
+    """Transport adapter for OVERPASS_MODE, or None for the live service"""
+    mode = settings["OVERPASS_MODE"]
+    if mode == "live":
+        return None
+    if mode == "record":
+        return RecordingAdapter(settings["OVERPASS_FIXTURES_DIR"], pool_maxsize=settings["UPSTREAM_MAX_CONNECTIONS"],
+                                max_retries=0)
+    if mode == "replay":
+        return ReplayAdapter(settings["OVERPASS_FIXTURES_DIR"])
+    if mode == "synthetic":
+        return SyntheticAdapter(
+            pois=settings["OVERPASS_SYNTHETIC_POIS"],
+            latency_seconds=settings["OVERPASS_SYNTHETIC_LATENCY_MS"] / 1000,
+            jitter_seconds=settings["OVERPASS_SYNTHETIC_JITTER_MS"] / 1000,
+            error_rate=settings["OVERPASS_SYNTHETIC_ERROR_RATE"],
+            seed=settings["OVERPASS_SYNTHETIC_SEED"]
+        )
+    raise ValueError(f"OVERPASS_MODE must be one of {', '.join(MODES)}, not {mode!r}")
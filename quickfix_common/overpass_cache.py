@@ -0,0 +1,124 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Size of a cache tile in degrees (0.01 deg is roughly 1.1 km of latitude)
+DEFAULT_TILE_DEGREES = 0.01
+METERS_PER_DEGREE = 111320
+
+
+def tile_for(lat, lng, tile_degrees=DEFAULT_TILE_DEGREES):
+    """Return the (row, col) index of the grid tile containing a point"""
+    return math.floor(lat / tile_degrees), math.floor(lng / tile_degrees)
+
+
+def tile_center(tile, tile_degrees=DEFAULT_TILE_DEGREES):
+    """Return the (lat, lng) centre of a grid tile"""
+    row, col = tile
+    return (row + 0.5) * tile_degrees, (col + 0.5) * tile_degrees
+
+
+def tile_padding(tile_degrees=DEFAULT_TILE_DEGREES):
+    """Distance in meters from a tile centre to its furthest corner.
+
+    Querying around the tile centre with `radius + tile_padding()` returns a
+    superset of what any point inside the tile would get with `radius`.
+    """
+    half = tile_degrees / 2 * METERS_PER_DEGREE
+    return math.ceil(half * math.sqrt(2))
+
+
+class TileCache:
+    """Thread-safe LRU cache with a per-entry TTL.
+
+    Used to share Overpass results between nearby requests that fall in the
+    same (service_type, tile). Concurrent misses on the same key are
+    collapsed so only one upstream call is made per tile.
+    """
+
+    def __init__(self, ttl_seconds=600, max_entries=512):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> threading.Event
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, wait_timeout=None):
+        """Return the cached value for key, calling loader() on a miss.
+
+        Errors raised by loader() propagate and nothing is cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+
+        if not leader:
+            # Another request is already loading this tile, wait for it
+            event.wait(wait_timeout)
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                return entry[1]
+            return loader()
+
+        try:
+            value = loader()
+            self.put(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,140 @@
+import datetime
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from flask import Response, current_app, stream_with_context
+from pymongo import DESCENDING
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Streamed listings (see stream_ndjson): documents fetched per round trip,
+# and how many encoded lines go out in one chunk
+STREAM_BATCH_SIZE = 500
+STREAM_CHUNK_LINES = 100
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Newest first, with _id as a tiebreaker so the order is total
+LIST_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+# Fields shown in request list views; the detail view loads the full document
+REQUEST_LIST_FIELDS = {
+    "_id": 1,
+    "provider_id": 1,
+    "service_type": 1,
+    "customer_name": 1,
+    "emergency_contact": 1,
+    "vehicle_type": 1,
+    "vehicle_model": 1,
+    "urgency_level": 1,
+    "status": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+
+def encode_cursor(doc):
+    """Cursor pointing just past `doc` in LIST_SORT order"""
+    created_at = doc['created_at']
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    millis = (created_at - datetime.datetime(1970, 1, 1)) // datetime.timedelta(milliseconds=1)
+    return f"{millis}_{doc['_id']}"
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into (created_at, _id); raises ValueError if malformed"""
+    try:
+        millis, object_id = cursor.split('_', 1)
+        created_at = datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=int(millis))
+        return created_at, ObjectId(object_id)
+    except (ValueError, InvalidId, OverflowError):
+        raise ValueError("Invalid cursor")
+
+
+def page_args(args):
+    """Read `limit` and `cursor` from request args; raises ValueError if invalid"""
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if limit is None or limit < 1:
+        raise ValueError("Limit must be a positive integer")
+    cursor = args.get('cursor')
+    return min(limit, MAX_PAGE_SIZE), decode_cursor(cursor) if cursor else None
+
+
+def _after(query, after):
+    """`query` restricted to documents past the (created_at, _id) cursor"""
+    if after is None:
+        return query
+    created_at, object_id = after
+    return {"$and": [query, {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": object_id}}
+    ]}]}
+
+
+def fetch_page(collection, query, limit, after=None, projection=REQUEST_LIST_FIELDS):
+    """One page of `query` results, newest first.
+
+    Uses keyset pagination on (created_at, _id): the sort and the "after the
+    cursor" condition both run in MongoDB against the (..., created_at, _id)
+    indexes, so every page costs the same no matter how deep it is.
+    Returns (documents, next_cursor) where next_cursor is None on the last page.
+    """
+    query = _after(query, after)
+
+    # Fetch one extra document to know whether there is a next page
+    docs = list(collection.find(query, projection).sort(LIST_SORT).limit(limit + 1))
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1])
+    return docs, None
+
+
+def wants_stream(request):
+    """True if the caller asked for NDJSON: ?format=ndjson or an Accept
+    header naming application/x-ndjson"""
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def stream_args(args):
+    """`limit` (optional, uncapped) and `cursor` for a streamed listing;
+    raises ValueError if invalid"""
+    limit = args.get('limit', type=int)
+    if 'limit' in args and (limit is None or limit < 1):
+        raise ValueError("Limit must be a positive integer")
+    cursor = args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def iter_query(collection, query, limit=None, after=None, projection=REQUEST_LIST_FIELDS):
+    """Every `query` result (or the first `limit`), newest first, as a
+    cursor read from MongoDB a batch at a time"""
+    cursor = collection.find(_after(query, after), projection).sort(LIST_SORT).batch_size(STREAM_BATCH_SIZE)
+    return cursor.limit(limit) if limit else cursor
+
+
+def stream_ndjson(documents, shape=None):
+    """Response writing one JSON document per line as `documents` is read.
+
+    Lines go out in chunks of STREAM_CHUNK_LINES, so memory stays flat however
+    many documents there are, and the first ones arrive before the last are
+    read. shape(doc) turns a document into what gets sent. A failure halfway
+    ends the response without its final chunk, which clients see as a
+    broken transfer rather than a short but complete list.
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        lines = []
+        for doc in documents:
+            lines.append(dumps(shape(doc) if shape else doc))
+            if len(lines) >= STREAM_CHUNK_LINES:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,171 @@
+"""
+Password hashing off the request threads
+
+bcrypt costs 100-300 ms of CPU per call, and run inline it holds the GIL for
+all of it, so a burst of logins stalls every other endpoint in the process.
+PasswordHasher runs hashing and verification in a small process pool instead.
+
+Admission is bounded: at most `workers + queue_depth` calls can be running or
+queued. Beyond that hash()/check() raise HasherBusy straight away, and the
+routes answer 503 with Retry-After rather than piling up behind the pool.
+
+Hashes are standard bcrypt ($2b$), the same format Flask-Bcrypt produced, so
+existing passwords keep working.
+"""
+
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import threading
+import time
+
+import bcrypt
+
+
+class HasherBusy(RuntimeError):
+    """Every worker is busy and the queue is full"""
+
+
+def _hash_password(password, log_rounds):
+    started = time.time()
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(log_rounds)).decode('utf-8')
+    return hashed, started, time.time() - started
+
+
+def _check_password(hashed, password):
+    started = time.time()
+    try:
+        ok = bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        # Not a bcrypt hash
+        ok = False
+    return ok, started, time.time() - started
+
+
+class PasswordHasher:
+    """bcrypt in a bounded process pool, with wait/hash time counters.
+
+    workers=0 runs everything inline on the calling thread (no pool), which
+    is handy for tests and one-off scripts.
+    """
+
+    def __init__(self, workers=2, queue_depth=16, log_rounds=12, timeout=10):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.log_rounds = log_rounds
+        self.timeout = timeout
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + queue_depth) if workers else None
+        self._stats_lock = threading.Lock()
+
+        self.calls = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.wait_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def start(self):
+        """Create the worker processes now rather than on the first login.
+
+        Best called from a server worker's startup hook, before it starts
+        handling requests, so the pool is forked from a quiet process.
+        """
+        if self.workers:
+            self._get_pool().submit(time.time).result()
+        return self
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            submitted = time.time()
+            result, started, elapsed = fn(*args)
+            self._record(started - submitted, elapsed)
+            return result
+
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise HasherBusy("Password hashing queue is full")
+
+        with self._stats_lock:
+            self.in_flight += 1
+        submitted = time.time()
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except BrokenProcessPool:
+            self._finished(None)
+            self.shutdown()
+            raise HasherBusy("Password hashing workers died, restarting")
+        except Exception:
+            self._finished(None)
+            raise
+        # The slot is held until the worker is really done, even if we stop
+        # waiting for it below
+        future.add_done_callback(self._finished)
+
+        try:
+            result, started, elapsed = future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            with self._stats_lock:
+                self.timeouts += 1
+            raise HasherBusy("Password hashing timed out")
+        except BrokenProcessPool:
+            # A worker was killed; start a fresh pool on the next call
+            self.shutdown()
+            raise HasherBusy("Password hashing workers died, restarting")
+        self._record(started - submitted, elapsed)
+        return result
+
+    def _finished(self, future):
+        with self._stats_lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _record(self, waited, elapsed):
+        waited = max(waited, 0.0)
+        with self._stats_lock:
+            self.calls += 1
+            self.wait_seconds += waited
+            self.hash_seconds += elapsed
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def hash(self, password):
+        """bcrypt hash of password, as a str"""
+        return self._run(_hash_password, password, self.log_rounds)
+
+    def check(self, hashed, password):
+        """True if password matches hashed"""
+        return self._run(_check_password, hashed, password)
+
+    def stats(self):
+        with self._stats_lock:
+            calls = self.calls
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "log_rounds": self.log_rounds,
+                "in_flight": self.in_flight,
+                "calls": calls,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds, 6),
+                "hash_seconds_total": round(self.hash_seconds, 6),
+                "avg_wait_ms": round(1000 * self.wait_seconds / calls, 3) if calls else 0.0,
+                "avg_hash_ms": round(1000 * self.hash_seconds / calls, 3) if calls else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait_seconds, 3)
+            }
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
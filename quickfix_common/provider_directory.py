@@ -0,0 +1,154 @@
+"""
+Registered-provider lookup shared by both backends
+
+The providers backend serves this at GET /api/providers/services/providers.
+Both backends read the same `quickfix` database, so the users backend can
+also run the lookup in-process (PROVIDER_DIRECTORY_MODE=local) instead of
+calling that endpoint over HTTP for every /nearby search. Either way the
+result is the same list of service entries.
+
+Lookup strategies, picked by PROVIDER_LOOKUP:
+
+- "geo": one $geoNear aggregation on the 2dsphere index (see provider_geo.py),
+  falling back to a scan if the index isn't there yet
+- "memory": the in-process grid index (see provider_index.py)
+- "scan": load the providers of the type (within the radius's bounding box,
+  if there is one) and rank them in Python with a partial sort
+"""
+
+import logging
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from .geo import bounding_box, haversine_many, nearest_indices
+from .provider_geo import iter_nearby_providers
+
+LOOKUPS = ("geo", "memory", "scan")
+
+logger = logging.getLogger(__name__)
+
+
+def provider_to_service(provider, distance, service_type):
+    """Shape a provider document as a service entry for the users app"""
+    return {
+        "id": str(provider['_id']),
+        "name": provider.get('business_name', provider.get('name', 'Unknown')),
+        "type": provider.get('provider_type', service_type),
+        "location": provider.get('location', {}),
+        "distance": distance,
+        "phone": provider.get('phone'),
+        "address": provider.get('address'),
+        "services": provider.get('services', ''),
+        "working_hours": provider.get('working_hours', ''),
+        "source": "registered_provider"
+    }
+
+
+class ProviderDirectory:
+    """Nearest-first provider search over the shared providers collection"""
+
+    def __init__(self, mongo, index=None, lookup="geo"):
+        self.mongo = mongo
+        self.index = index
+        self.lookup = lookup
+
+    def find(self, service_type, lat=None, lng=None, radius=None, limit=None, lookup=None):
+        """Service entries for the providers of a type, nearest first.
+
+        Without a location every provider of the type is returned, in
+        collection order, with distance 0. radius is in meters.
+        """
+        return list(self.iter_find(service_type, lat, lng, radius, limit, lookup))
+
+    def iter_find(self, service_type, lat=None, lng=None, radius=None, limit=None, lookup=None):
+        """find() as an iterator, for streaming responses.
+
+        Geo lookups and unranked listings are read from MongoDB a batch at a
+        time; the memory and scan lookups rank everything first. Query
+        errors are raised here, before anything is read.
+        """
+        lookup = lookup or self.lookup
+        if not (lat and lng):
+            providers = self.mongo.db.providers.find(self._scan_query(service_type), {"password": 0})
+            if limit:
+                providers = providers.limit(limit)
+            return (provider_to_service(provider, 0, service_type) for provider in providers)
+
+        if lookup == "memory" and self.index is not None:
+            return iter(self.indexed(service_type, lat, lng, radius, limit))
+        if lookup == "geo":
+            try:
+                # Radius, sort and limit are pushed down to the 2dsphere index
+                providers = iter_nearby_providers(self.mongo.db, service_type, lat, lng, radius, limit)
+                return (
+                    provider_to_service(provider, provider['distance'], service_type)
+                    for provider in providers
+                )
+            except OperationFailure as e:
+                # e.g. the 2dsphere index hasn't been created yet
+                logger.warning("Geo query failed, falling back to scan: %s", e)
+        return iter(self.scan(service_type, lat, lng, radius, limit))
+
+    @staticmethod
+    def _scan_query(service_type):
+        return {
+            "provider_type": service_type,
+            "location": {"$exists": True}
+        }
+
+    def scan(self, service_type, lat=None, lng=None, radius=None, limit=None):
+        """Fallback lookup: load the providers of a type and rank them in Python.
+
+        With a radius, only providers inside its bounding box are loaded, so
+        far-away ones cost neither transfer nor trigonometry.
+        """
+        query = self._scan_query(service_type)
+        if lat and lng and radius:
+            min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius)
+            query["location.lat"] = {"$gte": min_lat, "$lte": max_lat}
+            if min_lng is not None:
+                query["location.lng"] = {"$gte": min_lng, "$lte": max_lng}
+
+        providers = list(self.mongo.db.providers.find(query, {"password": 0}))
+
+        if not (lat and lng):
+            services = [provider_to_service(provider, 0, service_type) for provider in providers]
+            return services[:limit] if limit else services
+
+        # Rank by distance in one batch, skipping providers without coordinates
+        located = [
+            provider for provider in providers
+            if (provider.get('location') or {}).get('lat') is not None
+            and provider['location'].get('lng') is not None
+        ]
+
+        distances = haversine_many(
+            lng, lat,
+            [provider['location']['lng'] for provider in located],
+            [provider['location']['lat'] for provider in located]
+        )
+        return [
+            provider_to_service(located[i], distances[i], service_type)
+            for i in nearest_indices(distances, limit, radius)
+        ]
+
+    def indexed(self, service_type, lat, lng, radius=None, limit=None):
+        """Rank providers with the in-process grid index, then load just those"""
+        self.index.ensure_loaded(self.mongo.db)
+        if radius:
+            ranked = self.index.within(service_type, lat, lng, radius, limit)
+        else:
+            ranked = self.index.nearest(service_type, lat, lng, limit)
+
+        ids = [ObjectId(provider_id) for _, provider_id in ranked]
+        providers = {
+            str(provider['_id']): provider
+            for provider in self.mongo.db.providers.find({"_id": {"$in": ids}}, {"password": 0})
+        }
+
+        return [
+            provider_to_service(providers[provider_id], distance, service_type)
+            for distance, provider_id in ranked
+            if provider_id in providers
+        ]
@@ -0,0 +1,96 @@
+from pymongo import ASCENDING, GEOSPHERE, UpdateOne
+
+# Providers keep their human-readable `location` ({lat, lng, address}) for the
+# frontend, plus a GeoJSON copy in `geo` that MongoDB can index and query.
+GEO_FIELD = "geo"
+GEO_INDEX_NAME = "provider_type_1_geo_2dsphere"
+
+
+def geo_point(location):
+    """Build a GeoJSON point from a {lat, lng} location, or None if invalid"""
+    try:
+        lat = float(location['lat'])
+        lng = float(location['lng'])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+
+    # GeoJSON order is [longitude, latitude]
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+def ensure_geo_index(db):
+    """Create the (provider_type, geo) 2dsphere index used by nearby queries"""
+    return db.providers.create_index(
+        [("provider_type", ASCENDING), (GEO_FIELD, GEOSPHERE)],
+        name=GEO_INDEX_NAME
+    )
+
+
+def find_nearby_providers(db, provider_type, lat, lng, radius=None, limit=None):
+    """Providers of a type ordered by distance from (lat, lng).
+
+    Runs a single $geoNear aggregation, so filtering by radius (meters),
+    sorting and limiting all happen inside MongoDB. Each returned document
+    has its distance in meters under `distance`.
+    """
+    return list(iter_nearby_providers(db, provider_type, lat, lng, radius, limit))
+
+
+def iter_nearby_providers(db, provider_type, lat, lng, radius=None, limit=None):
+    """find_nearby_providers() as a cursor, for reading a batch at a time.
+
+    The aggregation starts right away, so a missing index fails here rather
+    than on the first read.
+    """
+    geo_near = {
+        "near": {"type": "Point", "coordinates": [lng, lat]},
+        "key": GEO_FIELD,
+        "distanceField": "distance",
+        "spherical": True,
+        "query": {"provider_type": provider_type}
+    }
+    if radius:
+        geo_near["maxDistance"] = radius
+
+    pipeline = [{"$geoNear": geo_near}]
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline.append({"$project": {"password": 0}})
+
+    return db.providers.aggregate(pipeline)
+
+
+def migrate_locations(db, batch_size=500):
+    """Backfill `geo` for providers that only have a {lat, lng} location.
+
+    Also removes `geo: null`, which older signups stored for providers
+    without a valid location: 2dsphere indexes reject it on some server
+    versions. Returns (updated, skipped) where skipped counts documents whose
+    location can't be turned into a valid point.
+    """
+    updated = skipped = 0
+    batch = []
+    # Matches a missing geo field as well as a null one
+    cursor = db.providers.find({GEO_FIELD: None}, {"location": 1, GEO_FIELD: 1})
+    for provider in cursor:
+        point = geo_point(provider.get('location'))
+        if point is not None:
+            batch.append(UpdateOne({"_id": provider['_id']}, {"$set": {GEO_FIELD: point}}))
+        else:
+            if provider.get('location') is not None:
+                skipped += 1
+            if GEO_FIELD not in provider:
+                continue
+            batch.append(UpdateOne({"_id": provider['_id']}, {"$unset": {GEO_FIELD: ""}}))
+
+        if len(batch) >= batch_size:
+            updated += db.providers.bulk_write(batch, ordered=False).modified_count
+            batch = []
+
+    if batch:
+        updated += db.providers.bulk_write(batch, ordered=False).modified_count
+
+    return updated, skipped
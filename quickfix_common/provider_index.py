@@ -0,0 +1,220 @@
+import heapq
+import math
+import threading
+import time
+from array import array
+from math import radians, cos
+
+from .geo import METERS_PER_DEGREE, bounding_box, haversine_many, nearest_indices
+
+
+class _Cell:
+    """Providers in one grid cell, stored as parallel compact arrays"""
+
+    __slots__ = ("ids", "lats", "lngs")
+
+    def __init__(self):
+        self.ids = []
+        self.lats = array('d')
+        self.lngs = array('d')
+
+    def add(self, provider_id, lat, lng):
+        self.ids.append(provider_id)
+        self.lats.append(lat)
+        self.lngs.append(lng)
+
+    def remove(self, provider_id):
+        # Swap with the last slot so the arrays stay dense
+        i = self.ids.index(provider_id)
+        last = len(self.ids) - 1
+        self.ids[i], self.lats[i], self.lngs[i] = self.ids[last], self.lats[last], self.lngs[last]
+        self.ids.pop()
+        self.lats.pop()
+        self.lngs.pop()
+
+
+class ProviderIndex:
+    """In-memory grid index of provider locations, one grid per provider_type.
+
+    Built once from MongoDB and then kept current with upsert()/remove()
+    calls from the routes that change a provider's type or location. Other
+    worker processes don't see those calls, so the whole index is also
+    rebuilt every `refresh_seconds`.
+    """
+
+    def __init__(self, cell_degrees=0.05, refresh_seconds=300):
+        self.cell_degrees = cell_degrees
+        self.refresh_seconds = refresh_seconds
+        self._grids = {}  # provider_type -> {(row, col): _Cell}
+        self._where = {}  # provider_id -> (provider_type, (row, col))
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+
+    # --- Building and incremental updates ---
+
+    def _cell_for(self, lat, lng):
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def _add(self, provider_id, provider_type, lat, lng):
+        key = self._cell_for(lat, lng)
+        grid = self._grids.setdefault(provider_type, {})
+        grid.setdefault(key, _Cell()).add(provider_id, lat, lng)
+        self._where[provider_id] = (provider_type, key)
+
+    def _discard(self, provider_id):
+        entry = self._where.pop(provider_id, None)
+        if entry is None:
+            return
+        provider_type, key = entry
+        grid = self._grids[provider_type]
+        cell = grid[key]
+        cell.remove(provider_id)
+        if not cell.ids:
+            del grid[key]
+
+    def load(self, db):
+        """(Re)build the whole index from the providers collection.
+
+        The new grids are built off to the side and swapped in, so queries
+        keep being served from the old ones while the load runs.
+        """
+        fresh = ProviderIndex(self.cell_degrees, self.refresh_seconds)
+        cursor = db.providers.find(
+            {"location": {"$ne": None}},
+            {"provider_type": 1, "location": 1}
+        )
+        for provider in cursor:
+            fresh._upsert(str(provider['_id']), provider.get('provider_type'), provider.get('location'))
+
+        with self._lock:
+            self._grids, self._where = fresh._grids, fresh._where
+            self._loaded_at = time.monotonic()
+
+    def _due(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds
+
+    def ensure_loaded(self, db):
+        """Load the index on first use and whenever it is due for a refresh"""
+        if self._due():
+            with self._load_lock:
+                if self._due():
+                    self.load(db)
+
+    def _upsert(self, provider_id, provider_type, location):
+        self._discard(provider_id)
+        try:
+            lat = float(location['lat'])
+            lng = float(location['lng'])
+        except (TypeError, KeyError, ValueError):
+            return
+        if provider_type:
+            self._add(provider_id, provider_type, lat, lng)
+
+    def upsert(self, provider_id, provider_type, location):
+        """Record a provider's current type and location.
+
+        No-op until the index has been loaded, the initial load picks up
+        whatever is in the database at that point.
+        """
+        with self._lock:
+            if self._loaded_at is not None:
+                self._upsert(str(provider_id), provider_type, location)
+
+    def remove(self, provider_id):
+        with self._lock:
+            self._discard(str(provider_id))
+
+    # --- Queries ---
+
+    def _cells_in_ring(self, grid, center, ring):
+        row0, col0 = center
+        if ring == 0:
+            cell = grid.get(center)
+            return [cell] if cell else []
+        cells = []
+        for col in range(col0 - ring, col0 + ring + 1):
+            for row in (row0 - ring, row0 + ring):
+                cell = grid.get((row, col))
+                if cell:
+                    cells.append(cell)
+        for row in range(row0 - ring + 1, row0 + ring):
+            for col in (col0 - ring, col0 + ring):
+                cell = grid.get((row, col))
+                if cell:
+                    cells.append(cell)
+        return cells
+
+    def _rank(self, cells, lat, lng, k=None, max_distance=None):
+        """Sorted (distance, id) pairs for the providers in some cells"""
+        ids, lats, lngs = [], array('d'), array('d')
+        for cell in cells:
+            if cell:
+                ids.extend(cell.ids)
+                lats.extend(cell.lats)
+                lngs.extend(cell.lngs)
+
+        distances = haversine_many(lng, lat, lngs, lats)
+        return [(distances[i], ids[i]) for i in nearest_indices(distances, k, max_distance)]
+
+    def within(self, provider_type, lat, lng, radius, limit=None):
+        """Providers within `radius` meters, as a sorted list of (distance, id)"""
+        with self._lock:
+            grid = self._grids.get(provider_type)
+            if not grid:
+                return []
+
+            min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius)
+            if min_lng is not None:
+                row_min, col_min = self._cell_for(min_lat, min_lng)
+                row_max, col_max = self._cell_for(max_lat, max_lng)
+
+            if min_lng is None or (row_max - row_min + 1) * (col_max - col_min + 1) > len(grid):
+                cells = grid.values()
+            else:
+                cells = (grid.get((row, col))
+                         for row in range(row_min, row_max + 1)
+                         for col in range(col_min, col_max + 1))
+            return self._rank(cells, lat, lng, limit, radius)
+
+    def nearest(self, provider_type, lat, lng, k=None):
+        """The k nearest providers (all of them if k is None), as a sorted list of (distance, id)"""
+        with self._lock:
+            grid = self._grids.get(provider_type)
+            if not grid:
+                return []
+
+            if k is None:
+                return self._rank(grid.values(), lat, lng)
+
+            center = self._cell_for(lat, lng)
+            rows = [key[0] for key in grid]
+            cols = [key[1] for key in grid]
+            max_ring = max(abs(center[0] - min(rows)), abs(center[0] - max(rows)),
+                           abs(center[1] - min(cols)), abs(center[1] - max(cols)))
+
+            # Smallest cell edge in meters (cells shrink east-west away from
+            # the equator), used as a lower bound for unvisited rings.
+            edge = self.cell_degrees * METERS_PER_DEGREE * max(
+                cos(radians(min(abs(lat) + self.cell_degrees * (max_ring + 1), 89.9))), 1e-6)
+
+            best = []
+            for ring in range(max_ring + 1):
+                cells = self._cells_in_ring(grid, center, ring)
+                if cells:
+                    best = list(heapq.merge(best, self._rank(cells, lat, lng, k)))[:k]
+
+                # Anything in a further ring is at least `ring * edge` away
+                if len(best) == k and best[-1][0] <= ring * edge:
+                    break
+
+        return best
+
+    def stats(self):
+        with self._lock:
+            return {
+                "providers": len(self._where),
+                "provider_types": {t: sum(len(c.ids) for c in grid.values()) for t, grid in self._grids.items()},
+                "cells": sum(len(grid) for grid in self._grids.values()),
+                "loaded": self._loaded_at is not None,
+            }
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Per-provider request counters for the dashboard stats
+
+Every status change of a provider's request goes through
+record_transition(), which bumps one counter document in provider_stats, so
+reading the stats is a single lookup. A provider without a counter document
+is seeded from one $group aggregation over service_requests on first read.
+
+Counters can drift if a write fails half way or a transition happens while
+a provider is being seeded. Run this file directly to compare every counter
+against the raw collection, and with --fix to overwrite the ones that drifted,
+from the providers backend's directory:
+
+    PYTHONPATH=../.. python -m quickfix_common.provider_stats [--fix]
+"""
+
+import datetime
+
+STATUSES = ("pending", "accepted", "completed", "rejected", "cancelled")
+
+
+def count_by_status(db, provider_id=None):
+    """{provider_id: {status: count}} from one aggregation over service_requests"""
+    match = {"provider_id": provider_id} if provider_id else {"provider_id": {"$nin": [None, ""]}}
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": {"provider_id": "$provider_id", "status": "$status"}, "count": {"$sum": 1}}},
+    ]
+
+    counts = {}
+    for row in db.service_requests.aggregate(pipeline):
+        key = row["_id"]
+        provider_counts = counts.setdefault(key["provider_id"], {})
+        provider_counts[key.get("status") or "unknown"] = row["count"]
+    return counts
+
+
+def stats_response(counts):
+    """Shape status counts as the /stats payload the dashboard expects"""
+    stats = {"total_requests": sum(counts.values())}
+    for status in STATUSES:
+        stats[f"{status}_requests"] = counts.get(status, 0)
+    return stats
+
+
+def get_counts(db, provider_id):
+    """Status counts for a provider, seeding the counter document if needed"""
+    doc = db.provider_stats.find_one({"_id": provider_id})
+    if doc:
+        return {status: count for status, count in doc.get("counts", {}).items() if count}
+
+    counts = count_by_status(db, provider_id).get(provider_id, {})
+    # $setOnInsert so a concurrent seed of the same provider can't double up
+    db.provider_stats.update_one(
+        {"_id": provider_id},
+        {"$setOnInsert": {"counts": counts, "updated_at": datetime.datetime.utcnow()}},
+        upsert=True
+    )
+    return counts
+
+
+def record_transition(db, provider_id, old_status, new_status):
+    """Move one request from old_status to new_status in a provider's counters.
+
+    old_status is None for a request that is new to the provider. Providers
+    that haven't been seeded yet are skipped; their first read counts them.
+    """
+    if not provider_id or old_status == new_status:
+        return
+
+    inc = {f"counts.{new_status}": 1}
+    if old_status:
+        inc[f"counts.{old_status}"] = -1
+
+    db.provider_stats.update_one(
+        {"_id": str(provider_id)},
+        {"$inc": inc, "$set": {"updated_at": datetime.datetime.utcnow()}}
+    )
+
+
+def reconcile(db, fix=False):
+    """Compare every counter document with the raw counts.
+
+    Returns [(provider_id, stored, actual)] for each one that differs and,
+    with fix=True, overwrites them with the actual counts.
+    """
+    actual = count_by_status(db)
+    drifted = []
+    for doc in db.provider_stats.find():
+        stored = {status: count for status, count in doc.get("counts", {}).items() if count}
+        expected = actual.get(doc["_id"], {})
+        if stored != expected:
+            drifted.append((doc["_id"], stored, expected))
+
+    if fix:
+        for provider_id, _, expected in drifted:
+            db.provider_stats.update_one(
+                {"_id": provider_id},
+                {"$set": {"counts": expected, "updated_at": datetime.datetime.utcnow()}}
+            )
+    return drifted
+
+
+if __name__ == "__main__":
+    import sys
+    from app import create_app
+    from config import mongo
+
+    create_app(ensure_indexes=False)
+
+    fix = "--fix" in sys.argv[1:]
+    drifted = reconcile(mongo.db, fix=fix)
+    for provider_id, stored, expected in drifted:
+        print(f"❌ {provider_id}: counters {stored}, actual {expected}")
+
+    if not drifted:
+        print("✅ All provider counters match service_requests")
+    elif fix:
+        print(f"✅ Fixed {len(drifted)} provider counter(s)")
+
+    sys.exit(1 if drifted and not fix else 0)
@@ -0,0 +1,125 @@
+"""
+JSON for API responses, shared by both backends
+
+install_json(app) replaces the JSON provider Flask-PyMongo puts on the app
+(bson.json_util, which writes ObjectIds as {"$oid": ...} and datetimes as
+{"$date": ...}) with one that writes MongoDB values the way the frontends
+read them:
+
+- ObjectId            -> its hex string
+- datetime            -> ISO 8601; naive datetimes are UTC, as stored, e.g.
+                         "2026-01-01T09:30:00Z"
+- date                -> "2026-01-01"
+- Decimal, Decimal128 -> the number as a string, so no precision is lost
+
+Handlers can return documents straight from MongoDB without converting
+their ids first. With orjson installed (`pip install orjson`, optional)
+encoding runs in orjson; the output is the same either way.
+
+project(doc, fields) trims a document to the fields an endpoint shows, for
+documents that were loaded whole.
+"""
+
+import datetime
+import decimal
+import json
+
+from bson import Decimal128, ObjectId
+from flask.json.provider import JSONProvider
+
+# orjson is optional: the standard library encoder is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
+def _datetime(value):
+    if value.tzinfo is None:
+        return value.isoformat() + "Z"
+    text = value.isoformat()
+    return text[:-6] + "Z" if text.endswith("+00:00") else text
+
+
+def default(value):
+    """JSON form of the non-JSON types MongoDB documents carry"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return _datetime(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps_std(obj):
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_bytes(obj):
+    """Encode obj as UTF-8 JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which only the standard encoder takes
+            pass
+    return _dumps_std(obj).encode()
+
+
+def dumps(obj):
+    """Encode obj as a JSON string"""
+    if orjson is not None:
+        return dumps_bytes(obj).decode()
+    return _dumps_std(obj)
+
+
+def loads(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def project(doc, fields):
+    """Top-level fields of doc picked by a MongoDB-style projection: either
+    {"name": 1, ...} to keep only those (plus _id unless {"_id": 0}) or
+    {"name": 0, ...} to drop those"""
+    if doc is None:
+        return None
+    inclusive = any(value for name, value in fields.items() if name != "_id")
+    if not inclusive:
+        return {name: value for name, value in doc.items() if not (name in fields and not fields[name])}
+    keep = {name for name, value in fields.items() if value}
+    if fields.get("_id", 1):
+        keep.add("_id")
+    return {name: value for name, value in doc.items() if name in keep}
+
+
+class MongoJSONProvider(JSONProvider):
+    """Flask JSON provider using the encoders above"""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        # Straight to bytes, skipping a str round trip on the orjson path
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def install_json(app):
+    """Make MongoJSONProvider app's JSON provider (jsonify, get_json)"""
+    app.json = MongoJSONProvider(app)
+    return app.json
@@ -1,18 +1,50 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
+from config import settings, init_mongo, bootstrap_indexes, mongo_health, metrics, metrics_gauges
+from quickfix_common.app_logging import configure_logging, init_request_logging, logging_stats
+from quickfix_common.metrics import init_metrics
 from routes.auth_routes import auth_bp
 from routes.profile_routes import profile_bp
 from routes.service_routes import service_bp
 from routes.request_routes import request_bp
 
-app = Flask(__name__)
-CORS(app)
+def create_app(ensure_indexes=None):
+    """Build the providers backend app.
 
-# Register blueprints
-app.register_blueprint(auth_bp, url_prefix='/api/providers/auth')
-app.register_blueprint(profile_bp, url_prefix='/api/providers/profile')
-app.register_blueprint(service_bp, url_prefix='/api/providers/services')
-app.register_blueprint(request_bp, url_prefix='/api/providers/requests')
+    The MongoDB client is created here, so a pre-forking server (see
+    gunicorn.conf.py) builds the app in each worker or re-runs init_mongo()
+    after the fork. ensure_indexes defaults to MONGO_ENSURE_INDEXES.
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(settings)
+    configure_logging(app.config, "providers")
+    init_request_logging(app)
+    if app.config["METRICS_ENABLED"]:
+        init_metrics(app, metrics, metrics_gauges)
+    CORS(app)
+
+    # Register blueprints
+    app.register_blueprint(auth_bp, url_prefix='/api/providers/auth')
+    app.register_blueprint(profile_bp, url_prefix='/api/providers/profile')
+    app.register_blueprint(service_bp, url_prefix='/api/providers/services')
+    app.register_blueprint(request_bp, url_prefix='/api/providers/requests')
+
+    @app.route('/health')
+    def health():
+        """Database reachability and connection pool counters"""
+        ok, details = mongo_health()
+        return jsonify({
+            "status": "ok" if ok else "unavailable",
+            "mongo": details,
+            "logging": logging_stats()
+        }), 200 if ok else 503
+
+    init_mongo(app)
+    if app.config["MONGO_ENSURE_INDEXES"] if ensure_indexes is None else ensure_indexes:
+        bootstrap_indexes()
+
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True, port=8002)
+    # Development server; see gunicorn.conf.py for production
+    create_app().run(debug=True, port=8002)
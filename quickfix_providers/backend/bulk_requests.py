@@ -0,0 +1,220 @@
+"""
+Batch accept / complete / reject for POST /api/providers/requests/bulk
+
+A batch is a list of {"request_id", "action", "payload"} items run for one
+provider. Every item is checked against the request's current state (one
+read for the whole batch) and the valid ones are written with a single
+bulk_write. Each write keeps its state guard in the filter, so a request
+that changes between the read and the write is left alone and reported as
+a conflict rather than moved through an invalid transition.
+
+ordered=True stops at the first item that can't be applied as planned (bad
+input, missing request, invalid transition) and reports the rest as
+skipped, as does a write error from MongoDB. A guard that no longer matches
+is not a write error, so it doesn't stop the writes after it: that item is
+reported as a conflict and later items still apply if their own guards
+match. ordered=False applies every valid item.
+"""
+
+import datetime
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from quickfix_common.provider_stats import record_transition
+
+# action -> (status the request must be in, status it moves to)
+TRANSITIONS = {
+    "accept": ("pending", "accepted"),
+    "complete": ("accepted", "completed"),
+    "reject": ("pending", "rejected"),
+}
+
+# Status a write leaves behind -> statuses that show it landed, as a later
+# write in the same batch may have moved the request on (accept, complete)
+REACHED = {
+    "accepted": ("accepted", "completed"),
+    "completed": ("completed",),
+    "rejected": ("rejected",),
+}
+
+
+def reject_filter(provider_id):
+    """Query part matching the requests provider_id may reject: pending ones
+    that are unassigned or assigned to it. Shared with the single /reject
+    route; provider_id None only matches unassigned requests."""
+    return {"status": "pending", "provider_id": {"$in": [None, "", provider_id]}}
+
+
+def lease_free(state, provider_id, now):
+    """True if no other provider holds a live /claim lease on the request"""
+    holder = state.get('lease_provider_id')
+    expires_at = state.get('lease_expires_at')
+    return holder in (None, provider_id) or (expires_at is not None and expires_at <= now)
+
+
+def check_transition(state, action, provider_id, now):
+    """Why provider_id can't apply action to a request in `state`, or None"""
+    required, _ = TRANSITIONS[action]
+    if state.get('status') != required:
+        return f"Cannot {action} a request that is {state.get('status')}"
+    if action in ("accept", "reject"):
+        if state.get('provider_id') not in (None, "", provider_id):
+            return "Request is assigned to another provider"
+        if action == "accept" and not lease_free(state, provider_id, now):
+            return "Request is reserved by another provider"
+    elif state.get('provider_id') != provider_id:
+        return "Request is not assigned to this provider"
+    return None
+
+
+def guarded_update(request_oid, action, provider_id, payload, now):
+    """UpdateOne whose filter only matches the state the transition starts from"""
+    required, new_status = TRANSITIONS[action]
+    update = {"$set": {"status": new_status, "updated_at": now}}
+
+    if action == "accept":
+        filter_query = {
+            "_id": request_oid,
+            "status": required,
+            "provider_id": {"$in": [None, "", provider_id]},
+            "$or": [
+                {"lease_provider_id": {"$in": [None, provider_id]}},
+                {"lease_expires_at": {"$lte": now}}
+            ]
+        }
+        update["$set"]["provider_id"] = provider_id
+        update["$unset"] = {"lease_provider_id": "", "lease_expires_at": ""}
+    elif action == "reject":
+        filter_query = dict(reject_filter(provider_id), _id=request_oid)
+        update["$set"]["rejection_reason"] = payload.get('rejection_reason') or 'No reason provided'
+    else:
+        filter_query = {"_id": request_oid, "status": required, "provider_id": provider_id}
+
+    return UpdateOne(filter_query, update)
+
+
+def run_batch(db, provider_id, operations, ordered=True):
+    """Apply a batch of operations for provider_id.
+
+    Returns one result dict per operation, in order, each with a `result`
+    of "ok", "invalid", "not_found", "conflict" or "skipped".
+    """
+    now = datetime.datetime.utcnow()
+    results = [
+        {"index": i, "request_id": op.get('request_id'), "action": op.get('action')}
+        if isinstance(op, dict) else {"index": i}
+        for i, op in enumerate(operations)
+    ]
+
+    # Parse everything first so one bad item doesn't cost a round trip
+    parsed = []
+    for result, op in zip(results, operations):
+        if not isinstance(op, dict) or op.get('action') not in TRANSITIONS:
+            parsed.append(None)
+            result.update(result="invalid", error=f"action must be one of {', '.join(TRANSITIONS)}")
+            continue
+        try:
+            parsed.append(ObjectId(op.get('request_id')))
+        except (InvalidId, TypeError):
+            parsed.append(None)
+            result.update(result="invalid", error="Invalid request_id")
+
+    ids = list({oid for oid in parsed if oid is not None})
+    states = {
+        doc['_id']: doc
+        for doc in db.service_requests.find(
+            {"_id": {"$in": ids}},
+            {"status": 1, "provider_id": 1, "lease_provider_id": 1, "lease_expires_at": 1}
+        )
+    }
+
+    # Walk the batch against the current states, so an item can build on an
+    # earlier one (accept then complete) and invalid ones never reach the write
+    writes, planned = [], []
+    stopped = False
+    for result, op, oid in zip(results, operations, parsed):
+        if stopped:
+            result.setdefault("result", "skipped")
+            continue
+        if "result" in result:
+            stopped = ordered
+            continue
+
+        state = states.get(oid)
+        if state is None:
+            result.update(result="not_found", error="Request not found")
+            stopped = ordered
+            continue
+
+        error = check_transition(state, op['action'], provider_id, now)
+        if error:
+            result.update(result="conflict", error=error, current_status=state.get('status'))
+            stopped = ordered
+            continue
+
+        # Whose request it is afterwards: rejecting doesn't assign it, so an
+        # unassigned request stays unassigned and counts for nobody
+        owner = (state.get('provider_id') or None) if op['action'] == "reject" else provider_id
+        old_status = state['status'] if state.get('provider_id') == owner else None
+        writes.append(guarded_update(oid, op['action'], provider_id, op.get('payload') or {}, now))
+        planned.append((result, oid, old_status, owner))
+
+        new_status = TRANSITIONS[op['action']][1]
+        states[oid] = dict(state, status=new_status, provider_id=owner,
+                           lease_provider_id=None, lease_expires_at=None)
+
+    # What each write expects to leave behind, one entry per write: states[]
+    # only holds the last status planned for each request
+    targets = [(oid, TRANSITIONS[result['action']][1], owner) for result, oid, _, owner in planned]
+    landed = write_batch(db, writes, targets, ordered) if writes else []
+    for (result, _, old_status, owner), outcome in zip(planned, landed):
+        result.update(outcome)
+        if outcome["result"] == "ok":
+            record_transition(db, owner, old_status, TRANSITIONS[result['action']][1])
+    return results
+
+
+def write_batch(db, writes, targets, ordered):
+    """One bulk_write for the planned updates; returns an outcome per write.
+
+    targets holds (request _id, status the write moves it to, provider_id it
+    leaves on the request) for each write.
+    """
+    errors = {}
+    try:
+        matched = db.service_requests.bulk_write(writes, ordered=ordered).matched_count
+    except BulkWriteError as e:
+        matched = e.details.get('nMatched', 0)
+        errors = {error['index']: error.get('errmsg', 'Write failed') for error in e.details.get('writeErrors', [])}
+
+    if matched == len(writes) and not errors:
+        return [{"result": "ok"} for _ in writes]
+
+    # Some guards didn't match: a request changed after we read it. Read the
+    # final states back and keep only the items that really landed.
+    final = {
+        doc['_id']: doc
+        for doc in db.service_requests.find({"_id": {"$in": list({oid for oid, _, _ in targets})}},
+                                            {"status": 1, "provider_id": 1})
+    }
+    outcomes = []
+    stopped = False
+    for i, (oid, target, owner) in enumerate(targets):
+        doc = final.get(oid) or {}
+        if stopped:
+            # An ordered bulk_write stops at the first write error
+            outcomes.append({"result": "skipped"})
+        elif i in errors:
+            outcomes.append({"result": "conflict", "error": errors[i]})
+            stopped = ordered
+        elif doc.get('status') in REACHED[target] and (doc.get('provider_id') or None) == owner:
+            outcomes.append({"result": "ok"})
+        else:
+            # The guard no longer matched. That isn't a write error, so
+            # MongoDB went on with the later writes and nothing is skipped
+            outcomes.append({"result": "conflict", "error": "Request changed while the batch was running",
+                             "current_status": doc.get('status')})
+    return outcomes
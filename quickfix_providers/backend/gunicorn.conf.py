@@ -0,0 +1,81 @@
+"""
+Gunicorn settings for the providers backend
+
+    cd quickfix_providers/backend
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment. Reload gracefully with
+`kill -HUP <master pid>`: workers are replaced one by one after finishing
+their in-flight requests. With preload on, HUP does not pick up code changes;
+for a code deploy start a new master (`kill -USR2`, then `-WINCH` and
+`-QUIT` the old one) or run with GUNICORN_PRELOAD=false.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8002")
+
+# (2 x cores) + 1 workers unless WEB_CONCURRENCY says otherwise
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# Threaded workers: every open /api/providers/requests/stream (SSE) holds a
+# thread for as long as the dashboard is open, so size GUNICORN_THREADS for
+# the number of concurrent dashboards per worker.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Import the app once in the master and fork workers from it. The MongoDB
+# client is recreated in each worker by post_fork below.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Keep idle client connections open a little longer than a reverse proxy
+# would reuse them, and recycle workers now and then to bound memory growth
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "500"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+# The default format, but with the path alone (%(U)s) instead of the request
+# line, which would log the dashboard stream's ?access_token=
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(m)s %(U)s %(H)s" %(s)s %(b)s "%(f)s" "%(a)s"'
+
+
+def on_starting(server):
+    """Empty METRICS_DIR before the first workers fork, so /metrics doesn't
+    add in snapshots left by an earlier run"""
+    from config import metrics
+
+    metrics.clear_directory()
+
+
+def post_fork(server, worker):
+    """Give each worker its own MongoDB client and password hashing pool"""
+    import wsgi
+    from quickfix_common.app_logging import configure_logging
+    from config import init_mongo, bootstrap_indexes, password_hasher, metrics, pool_metrics
+
+    # The log writer thread doesn't survive the fork
+    configure_logging(wsgi.app.config, "providers")
+    # Count from zero here rather than from what the master recorded, for
+    # the request metrics and for the pool of the client created below
+    metrics.reset()
+    pool_metrics.reset()
+    metrics.start_flusher(wsgi.app.config["METRICS_FLUSH_SECONDS"])
+    init_mongo(wsgi.app)
+    if wsgi.app.config["MONGO_ENSURE_INDEXES"]:
+        bootstrap_indexes()
+    password_hasher.start()
+
+
+def worker_exit(server, worker):
+    """Flush queued log records before the worker goes"""
+    from quickfix_common.app_logging import stop_logging
+    from config import metrics
+
+    if metrics.directory:
+        # Keep this worker's counts in the totals after it's gone
+        metrics.retire()
+    stop_logging()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Migration: store provider locations as GeoJSON points
+
+Older provider documents only have `location: {lat, lng, address}` as written
+by profile_routes.save_provider_location. This backfills the indexed `geo`
+field and creates the 2dsphere index used by /api/providers/services/providers.
+
+Safe to run more than once.
+"""
+
+from app import create_app
+from config import mongo
+from quickfix_common.provider_geo import ensure_geo_index, migrate_locations
+
+if __name__ == "__main__":
+    create_app(ensure_indexes=False)
+
+    print("Creating 2dsphere index on providers...")
+    print(f"Index ready: {ensure_geo_index(mongo.db)}")
+
+    print("Backfilling GeoJSON locations...")
+    updated, skipped = migrate_locations(mongo.db)
+    print(f"Updated {updated} providers, skipped {skipped} with invalid locations")
+
+    print("\nMigration completed!")
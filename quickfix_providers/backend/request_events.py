@@ -0,0 +1,257 @@
+import datetime
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from quickfix_common.geo import haversine
+
+logger = logging.getLogger(__name__)
+
+# What a provider dashboard needs to show or drop a request from its list
+EVENT_FIELDS = {
+    "_id": 1,
+    "provider_id": 1,
+    "service_type": 1,
+    "customer_name": 1,
+    "emergency_contact": 1,
+    "vehicle_type": 1,
+    "vehicle_model": 1,
+    "urgency_level": 1,
+    "location": 1,
+    "status": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+# Request status -> event name sent to dashboards
+EVENT_TYPES = {
+    "pending": "new",
+    "accepted": "accepted",
+    "completed": "completed",
+    "rejected": "rejected",
+    "cancelled": "cancelled",
+}
+
+# Statuses that take a request off every other dashboard's pending list
+REMOVED_STATUSES = ("accepted", "completed", "rejected", "cancelled")
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def event_id_for(doc):
+    """Event ids come from the document itself (updated_at + _id), so every
+    worker process gives the same change the same id."""
+    updated_at = doc.get('updated_at') or doc.get('created_at') or EPOCH
+    if updated_at.tzinfo is not None:
+        updated_at = updated_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    millis = (updated_at - EPOCH) // datetime.timedelta(milliseconds=1)
+    return f"{millis}-{doc['_id']}"
+
+
+def parse_event_id(event_id):
+    """(updated_at, _id) for an event id, or None if it is malformed"""
+    try:
+        millis, object_id = event_id.split('-', 1)
+        return EPOCH + datetime.timedelta(milliseconds=int(millis)), ObjectId(object_id)
+    except (AttributeError, ValueError, InvalidId, OverflowError):
+        return None
+
+
+def make_event(doc):
+    request = {key: doc[key] for key in EVENT_FIELDS if key in doc}
+    request['_id'] = str(request['_id'])
+    if request.get('provider_id'):
+        request['provider_id'] = str(request['provider_id'])
+    return {
+        "id": event_id_for(doc),
+        "type": EVENT_TYPES.get(doc.get('status'), "updated"),
+        "request": request,
+    }
+
+
+def removed_event(event):
+    """The id-only event telling a dashboard to drop a request from its
+    pending list, without any of the request's details"""
+    return {"id": event['id'], "type": "removed", "request": {"_id": event['request']['_id']}}
+
+
+def provider_view(provider, radius):
+    """What a provider's dashboard receives for an event, or None.
+
+    A dashboard lists unassigned pending requests and the provider's own
+    requests, and gets the same from the feed:
+    - every event for a request assigned to this provider
+    - unassigned pending requests for its provider_type and, when both sides
+      have a location, within `radius` meters of it
+    - when a request leaves the pending state for anyone else (another
+      provider accepts, rejects or completes it, or its user cancels it), a
+      "removed" event carrying only its id, so it leaves the pending list
+    Other providers' requests are never shown beyond that.
+    """
+    provider_id = str(provider['_id'])
+    provider_type = provider.get('provider_type')
+    location = provider.get('location') or {}
+    p_lat, p_lng = location.get('lat'), location.get('lng')
+
+    def nearby(request):
+        if provider_type and request.get('service_type') != provider_type:
+            return False
+        r_location = request.get('location') or {}
+        if radius and p_lat is not None and p_lng is not None \
+                and r_location.get('lat') is not None and r_location.get('lng') is not None:
+            return haversine(p_lng, p_lat, r_location['lng'], r_location['lat']) <= radius
+        return True
+
+    def view(event):
+        request = event['request']
+        if request.get('provider_id') == provider_id:
+            return event
+        if request.get('status') == "pending" and not request.get('provider_id'):
+            return event if nearby(request) else None
+        if request.get('status') in REMOVED_STATUSES:
+            return removed_event(event)
+        return None
+
+    return view
+
+
+class Subscription:
+    def __init__(self, view, queue_size):
+        self.view = view
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+
+
+class RequestEventBus:
+    """Fans service request changes out to connected dashboards.
+
+    One background thread per process follows service_requests, through a
+    change stream when MongoDB supports one (replica set) and otherwise by
+    polling on updated_at. Every event is then offered to each subscriber's
+    queue, so the database is read once per change instead of once per
+    dashboard poll.
+    """
+
+    def __init__(self, poll_seconds=2.0, queue_size=100, replay_limit=500):
+        self.poll_seconds = poll_seconds
+        self.queue_size = queue_size
+        self.replay_limit = replay_limit
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.mode = None  # "change_stream" or "polling" once started
+
+    # --- Subscribers ---
+
+    def subscribe(self, db, view):
+        self.start(db)
+        subscription = Subscription(view, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            shown = subscription.view(event)
+            if shown is None:
+                continue
+            try:
+                subscription.queue.put_nowait(shown)
+            except queue.Full:
+                # Too slow to keep up: drop it, the client reconnects with
+                # Last-Event-ID and catches up through replay()
+                self.unsubscribe(subscription)
+
+    def replay(self, db, last_event_id, view):
+        """(events after last_event_id read back from service_requests,
+        complete). complete is False when they can't all be replayed: the id
+        is malformed or more than replay_limit requests changed since."""
+        position = parse_event_id(last_event_id)
+        if position is None:
+            return [], False
+        updated_at, object_id = position
+        docs = list(db.service_requests.find(
+            {"$or": [
+                {"updated_at": {"$gt": updated_at}},
+                {"updated_at": updated_at, "_id": {"$gt": object_id}}
+            ]},
+            EVENT_FIELDS
+        ).sort([("updated_at", ASCENDING), ("_id", ASCENDING)]).limit(self.replay_limit + 1))
+        complete = len(docs) <= self.replay_limit
+        events = (view(make_event(doc)) for doc in docs[:self.replay_limit])
+        return [event for event in events if event is not None], complete
+
+    # --- Feed ---
+
+    def start(self, db):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(db,), name='request-events', daemon=True)
+                self._thread.start()
+
+    def _run(self, db):
+        while True:
+            try:
+                self._follow_change_stream(db)
+            except ConnectionFailure as e:
+                logger.warning("Request event change stream error: %s", e)
+                time.sleep(self.poll_seconds)
+            except Exception as e:
+                # Standalone servers (and in-memory stand-ins) have no change streams
+                logger.info("Change streams unavailable, polling for request events: %s", e)
+                break
+
+        self._poll(db)
+
+    def _follow_change_stream(self, db):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        with db.service_requests.watch(pipeline, full_document='updateLookup') as stream:
+            self.mode = "change_stream"
+            for change in stream:
+                doc = change.get('fullDocument')
+                if doc:
+                    self.publish(make_event(doc))
+
+    def _poll(self, db):
+        self.mode = "polling"
+        # Writers stamp updated_at before their write lands, so each poll
+        # re-reads a short overlap window and skips events already sent.
+        overlap = datetime.timedelta(seconds=max(self.poll_seconds, 1) * 2)
+        since = datetime.datetime.utcnow()
+        sent = OrderedDict()
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                cursor = db.service_requests.find(
+                    {"updated_at": {"$gte": since - overlap}},
+                    EVENT_FIELDS
+                ).sort([("updated_at", ASCENDING), ("_id", ASCENDING)])
+                for doc in cursor:
+                    event = make_event(doc)
+                    if event['id'] in sent:
+                        continue
+                    sent[event['id']] = True
+                    since = max(since, doc.get('updated_at') or since)
+                    self.publish(event)
+                while len(sent) > 10000:
+                    sent.popitem(last=False)
+            except PyMongoError as e:
+                logger.warning("Request event polling error: %s", e)
+
+    def stats(self):
+        with self._lock:
+            return {"mode": self.mode, "subscribers": len(self._subscribers)}
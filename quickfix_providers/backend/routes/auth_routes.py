@@ -1,10 +1,16 @@
-from flask import Blueprint, request, jsonify
-from config import mongo, bcrypt
+import logging
+from flask import Blueprint, request, jsonify, current_app
+from config import mongo, password_hasher, provider_index, provider_principals
 import jwt
 import datetime
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+from quickfix_common.provider_geo import geo_point
+from quickfix_common.password_hashing import HasherBusy
+from quickfix_common.serialization import project
 
 auth_bp = Blueprint('auth_bp', __name__)
+logger = logging.getLogger(__name__)
 
 @auth_bp.route('/signup', methods=['POST'])
 def signup():
@@ -26,7 +32,10 @@ def signup():
     if mongo.db.providers.find_one({"email": email}):
         return jsonify({"error": "Provider with this email already exists"}), 409
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    try:
+        hashed_password = password_hasher.hash(password)
+    except HasherBusy:
+        return jsonify({"error": "Server is busy, please try again shortly"}), 503, {"Retry-After": "1"}
 
     provider_data = {
         "name": name,
@@ -41,18 +50,26 @@ def signup():
         "location": location,  # Add location to provider data
         "created_at": datetime.datetime.utcnow()
     }
+    # Indexed GeoJSON copy of location, left out rather than null when
+    # there is no valid location (2dsphere indexes reject geo: null)
+    point = geo_point(location)
+    if point is not None:
+        provider_data["geo"] = point
 
-    provider_id = mongo.db.providers.insert_one(provider_data).inserted_id
+    try:
+        provider_id = mongo.db.providers.insert_one(provider_data).inserted_id
+    except DuplicateKeyError:
+        # Lost a race with a concurrent signup for the same email (email_unique index)
+        return jsonify({"error": "Provider with this email already exists"}), 409
+    provider_index.upsert(provider_id, provider_type, location)
 
-    new_provider = mongo.db.providers.find_one({"_id": provider_id})
-    new_provider.pop('password')
-    new_provider['_id'] = str(new_provider['_id'])
+    # No password, and no geo: the internal copy of location
+    new_provider = project(mongo.db.providers.find_one({"_id": provider_id}), {"password": 0, "geo": 0})
 
     return jsonify({"message": "Provider created successfully", "provider": new_provider}), 201
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
-    from config import app
     data = request.get_json()
     email = data.get('email')
     password = data.get('password')
@@ -62,11 +79,16 @@ def login():
 
     provider = mongo.db.providers.find_one({"email": email})
 
-    if provider and bcrypt.check_password_hash(provider['password'], password):
+    try:
+        password_ok = bool(provider) and password_hasher.check(provider['password'], password)
+    except HasherBusy:
+        return jsonify({"error": "Server is busy, please try again shortly"}), 503, {"Retry-After": "1"}
+
+    if password_ok:
         token = jwt.encode({
             'provider_id': str(provider['_id']),
             'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        }, app.config['SECRET_KEY'], algorithm="HS256")
+        }, current_app.config['SECRET_KEY'], algorithm="HS256")
 
         provider_data = {
             '_id': str(provider['_id']),
@@ -84,21 +106,14 @@ def get_profile():
     """Get provider profile data"""
     try:
         provider_id = request.args.get('provider_id')
-        print(f"DEBUG: Received request for provider_id: {provider_id}")
-        
         if not provider_id:
-            print("DEBUG: No provider_id provided")
             return jsonify({"error": "Provider ID is required"}), 400
         
-        print(f"DEBUG: Searching for provider with ObjectId: {ObjectId(provider_id)}")
         provider = mongo.db.providers.find_one({"_id": ObjectId(provider_id)})
         
         if not provider:
-            print(f"DEBUG: Provider not found for ID: {provider_id}")
             return jsonify({"error": "Provider not found"}), 404
         
-        print(f"DEBUG: Found provider: {provider['name']} ({provider['email']})")
-        
         # Remove password from response
         provider.pop('password', None)
         provider['_id'] = str(provider['_id'])
@@ -122,8 +137,8 @@ def get_profile():
             "provider": response_provider
         }), 200
         
-    except Exception as e:
-        print(f"Error getting provider profile: {e}")
+    except Exception:
+        logger.exception("Error getting provider profile")
         return jsonify({"error": "Failed to get profile"}), 500
 
 @auth_bp.route('/profile', methods=['PUT'])
@@ -154,14 +169,23 @@ def update_profile():
             "location": location,  # Add location to update data
             "updated_at": datetime.datetime.utcnow()
         }
+        update = {"$set": update_data}
+        point = geo_point(location)
+        if point is not None:
+            update_data["geo"] = point
+        else:
+            update["$unset"] = {"geo": ""}
         
         result = mongo.db.providers.update_one(
             {"_id": ObjectId(provider_id)},
-            {"$set": update_data}
+            update
         )
         
         if result.matched_count == 0:
             return jsonify({"error": "Provider not found"}), 404
+
+        provider_index.upsert(provider_id, provider_type, location)
+        provider_principals.invalidate(provider_id)
         
         # Get updated provider data
         updated_provider = mongo.db.providers.find_one({"_id": ObjectId(provider_id)})
@@ -188,6 +212,11 @@ def update_profile():
             "provider": response_provider
         }), 200
         
-    except Exception as e:
-        print(f"Error updating provider profile: {e}")
+    except Exception:
+        logger.exception("Error updating provider profile")
         return jsonify({"error": "Failed to update profile"}), 500
+
+@auth_bp.route('/hashing-stats', methods=['GET'])
+def get_hashing_stats():
+    """Queue, wait and hashing time counters for the password hashing pool"""
+    return jsonify({"password_hashing": password_hasher.stats()}), 200
@@ -1,51 +1,39 @@
+import logging
 from flask import Blueprint, request, jsonify
-from config import mongo, app
-import jwt
+from config import mongo, provider_index, provider_principals
 from functools import wraps
 from bson import ObjectId
+from quickfix_common.provider_geo import geo_point
 
 profile_bp = Blueprint('profile', __name__)
+logger = logging.getLogger(__name__)
 
-# JWT token verification decorator
+def authenticate_provider(token):
+    """Provider document for a JWT ('Bearer ' prefix optional), or None if
+    the token is invalid or its provider is gone"""
+    # Remove 'Bearer ' prefix if present
+    if token.startswith('Bearer '):
+        token = token[7:]
+
+    try:
+        return provider_principals.authenticate(token)
+    except Exception as e:
+        # The token itself is never logged
+        logger.info("Token verification failed: %s", type(e).__name__)
+        return None
+
+# JWT token verification decorator. The provider document comes from the
+# auth cache (one Mongo lookup at most) and is passed to the handler.
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('Authorization')
-        print(f"Token received: {token[:20]}..." if token else "No token")
         
         if not token:
             return jsonify({'message': 'Token is missing'}), 401
         
-        try:
-            # Remove 'Bearer ' prefix if present
-            if token.startswith('Bearer '):
-                token = token[7:]
-            
-            print(f"Token after Bearer removal: {token[:20]}...")
-            
-            # Decode token with correct secret key
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            print(f"Token decoded successfully: {data}")
-            
-            provider_id = data.get('provider_id')
-            print(f"Provider ID from token: {provider_id}")
-            
-            if not provider_id:
-                return jsonify({'message': 'Invalid token'}), 401
-            
-            try:
-                provider_obj_id = ObjectId(provider_id)
-            except Exception:
-                return jsonify({'message': 'Invalid token'}), 401
-            
-            current_provider = mongo.db.providers.find_one({'_id': provider_obj_id})
-            print(f"Provider found: {current_provider is not None}")
-            
-            if not current_provider:
-                return jsonify({'message': 'Invalid token'}), 401
-                
-        except Exception as e:
-            print(f"Token verification error: {str(e)}")
+        current_provider = authenticate_provider(token)
+        if not current_provider:
             return jsonify({'message': 'Invalid token'}), 401
             
         return f(current_provider, *args, **kwargs)
@@ -56,13 +44,10 @@ def token_required(f):
 def get_provider_location(current_provider):
     """Get provider's saved location"""
     try:
-        provider_id = str(current_provider['_id'])
-        provider = mongo.db.providers.find_one({'_id': current_provider['_id']})
-        
-        if provider and 'location' in provider:
+        if 'location' in current_provider:
             return jsonify({
                 'success': True,
-                'location': provider['location']
+                'location': current_provider['location']
             }), 200
         else:
             return jsonify({
@@ -86,17 +71,25 @@ def save_provider_location(current_provider):
         if not lat or not lng:
             return jsonify({'success': False, 'message': 'Latitude and longitude are required'}), 400
         
-        # Update provider with location
+        location = {
+            'lat': float(lat),
+            'lng': float(lng),
+            'address': address
+        }
+        point = geo_point(location)
+        if point is None:
+            return jsonify({'success': False, 'message': 'Invalid latitude or longitude'}), 400
+
+        # Update provider with location (and its indexed GeoJSON copy)
         mongo.db.providers.update_one(
             {'_id': current_provider['_id']},
             {'$set': {
-                'location': {
-                    'lat': float(lat),
-                    'lng': float(lng),
-                    'address': address
-                }
+                'location': location,
+                'geo': point
             }}
         )
+        provider_index.upsert(current_provider['_id'], current_provider.get('provider_type'), location)
+        provider_principals.invalidate(current_provider['_id'])
         
         return jsonify({
             'success': True,
@@ -111,7 +104,7 @@ def save_provider_location(current_provider):
 def get_provider_details(current_provider):
     """Get provider's business details"""
     try:
-        provider = mongo.db.providers.find_one({'_id': current_provider['_id']})
+        provider = current_provider
         
         if provider:
             # Return only the business details fields
@@ -160,6 +153,8 @@ def save_provider_details(current_provider):
             {'_id': current_provider['_id']},
             {'$set': update_data}
         )
+        provider_index.upsert(current_provider['_id'], update_data['provider_type'], current_provider.get('location'))
+        provider_principals.invalidate(current_provider['_id'])
         
         return jsonify({
             'success': True,
@@ -1,67 +1,134 @@
-from flask import Blueprint, request, jsonify
-from config import mongo
+import logging
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
+from config import mongo, request_events, metrics
 import datetime
+import queue
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from quickfix_common.pagination import page_args, fetch_page, iter_query, stream_args, stream_ndjson, wants_stream
+from request_events import provider_view, parse_event_id
+from quickfix_common.provider_stats import count_by_status, get_counts, record_transition, stats_response
+from bulk_requests import reject_filter, run_batch
+from routes.profile_routes import authenticate_provider
 
 request_bp = Blueprint('request_bp', __name__)
+logger = logging.getLogger(__name__)
+
+def list_requests(query):
+    """Response for a request listing: one page, or with ?format=ndjson every
+    match (up to an optional limit) streamed one per line"""
+    if wants_stream(request):
+        try:
+            limit, after = stream_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return stream_ndjson(iter_query(mongo.db.service_requests, query, limit, after))
+
+    try:
+        limit, after = page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    requests, next_cursor = fetch_page(mongo.db.service_requests, query, limit, after)
+    return jsonify({
+        "success": True,
+        "requests": requests,
+        "next_cursor": next_cursor
+    }), 200
+
 
 @request_bp.route('/pending-requests', methods=['GET'])
 def get_pending_requests():
-    """Get all pending requests that don't have a provider assigned yet"""
+    """Get pending requests that don't have a provider assigned yet, newest first, one page at a time"""
     try:
         # Find requests that are pending and don't have a provider_id assigned
-        requests = list(mongo.db.service_requests.find({
+        return list_requests({
             "status": "pending",
             "provider_id": {"$in": [None, ""]}  # No provider assigned yet
-        }))
-        
-        # Convert ObjectId to string for JSON serialization
-        for req in requests:
-            req['_id'] = str(req['_id'])
-            if req.get('provider_id'):
-                req['provider_id'] = str(req['provider_id'])
+        })
         
-        # Sort by creation date (newest first)
-        requests.sort(key=lambda x: x['created_at'], reverse=True)
-        
-        return jsonify({
-            "success": True,
-            "requests": requests
-        }), 200
-        
-    except Exception as e:
-        print(f"Error fetching pending requests: {e}")
+    except Exception:
+        logger.exception("Error fetching pending requests")
         return jsonify({"error": "Failed to fetch pending requests"}), 500
 
 @request_bp.route('/provider-requests', methods=['GET'])
 def get_provider_requests():
-    """Get all requests for a specific provider"""
+    """Get requests for a specific provider, newest first, one page at a time"""
     try:
         provider_id = request.args.get('provider_id')
         
         if not provider_id:
             return jsonify({"error": "Provider ID is required"}), 400
-        
+
         # Find requests for this provider
-        requests = list(mongo.db.service_requests.find({"provider_id": provider_id}))
-        
-        # Convert ObjectId to string for JSON serialization
-        for req in requests:
-            req['_id'] = str(req['_id'])
-            req['provider_id'] = str(req['provider_id'])
-        
-        # Sort by creation date (newest first)
-        requests.sort(key=lambda x: x['created_at'], reverse=True)
-        
-        return jsonify({
-            "success": True,
-            "requests": requests
-        }), 200
+        return list_requests({"provider_id": provider_id})
         
-    except Exception as e:
-        print(f"Error fetching provider requests: {e}")
+    except Exception:
+        logger.exception("Error fetching provider requests")
         return jsonify({"error": "Failed to fetch provider requests"}), 500
 
+@request_bp.route('/stream', methods=['GET'])
+def stream_requests():
+    """Server-Sent Events feed of request changes relevant to the signed-in provider"""
+    # EventSource can't send headers, so browsers pass the token as ?access_token=
+    token = request.headers.get('Authorization') or request.args.get('access_token')
+    if not token:
+        return jsonify({'message': 'Token is missing'}), 401
+
+    provider = authenticate_provider(token)
+    if not provider:
+        return jsonify({'message': 'Invalid token'}), 401
+
+    provider_id = request.args.get('provider_id')
+    if provider_id and provider_id != str(provider['_id']):
+        return jsonify({"error": "Not allowed to follow another provider's requests"}), 403
+
+    radius = request.args.get('radius', current_app.config["REQUEST_EVENTS_RADIUS_M"], type=float)
+    view = provider_view(provider, radius)
+
+    # Subscribe before replaying so nothing falls in between; anything seen
+    # in both is skipped by position below
+    subscription = request_events.subscribe(mongo.db, view)
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        backlog, complete = request_events.replay(mongo.db, last_event_id, view) if last_event_id else ([], True)
+    except Exception:
+        request_events.unsubscribe(subscription)
+        raise
+
+    def format_event(event):
+        data = current_app.json.dumps(event)
+        return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            if not complete:
+                # Too much was missed to replay: the dashboard reloads its lists
+                yield "event: reset\ndata: {}\n\n"
+            last_sent = parse_event_id(last_event_id) if last_event_id else None
+            for event in backlog:
+                yield format_event(event)
+                last_sent = parse_event_id(event['id'])
+
+            while not subscription.closed:
+                try:
+                    event = subscription.queue.get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if last_sent and parse_event_id(event['id']) <= last_sent:
+                    continue
+                yield format_event(event)
+        finally:
+            request_events.unsubscribe(subscription)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @request_bp.route('/<request_id>', methods=['GET'])
 def get_request_details(request_id):
     """Get details of a specific request"""
@@ -71,76 +138,184 @@ def get_request_details(request_id):
         if not request_obj:
             return jsonify({"error": "Request not found"}), 404
         
-        request_obj['_id'] = str(request_obj['_id'])
-        request_obj['provider_id'] = str(request_obj['provider_id'])
-        
         return jsonify({
             "success": True,
             "request": request_obj
         }), 200
         
-    except Exception as e:
-        print(f"Error fetching request details: {e}")
+    except Exception:
+        logger.exception("Error fetching request details")
         return jsonify({"error": "Failed to fetch request details"}), 500
 
+def claimable_by(provider_id, now):
+    """Filter for a request that provider_id may still take: pending, not
+    assigned to anyone else, and not leased to another provider"""
+    return {
+        "status": "pending",
+        "provider_id": {"$in": [None, "", provider_id]},
+        "$or": [
+            {"lease_provider_id": {"$in": [None, provider_id]}},
+            {"lease_expires_at": {"$lte": now}}
+        ]
+    }
+
+def unavailable_response(request_oid):
+    """404 if the request doesn't exist, otherwise 409 with its current state"""
+    current = mongo.db.service_requests.find_one(
+        {"_id": request_oid},
+        {"status": 1, "provider_id": 1, "lease_expires_at": 1}
+    )
+    if not current:
+        return jsonify({"error": "Request not found"}), 404
+
+    return jsonify({
+        "error": "Request is no longer available",
+        "status": current.get('status'),
+        "lease_expires_at": current.get('lease_expires_at')
+    }), 409
+
 @request_bp.route('/<request_id>/accept', methods=['PUT'])
 def accept_request(request_id):
-    """Accept a service request by assigning provider to it"""
+    """Accept a service request by assigning provider to it.
+
+    Compare-and-set: only one provider can win a pending request, everyone
+    else gets a 409.
+    """
     try:
         data = request.get_json()
         provider_id = data.get('provider_id')
         
         if not provider_id:
             return jsonify({"error": "Provider ID is required"}), 400
+
+        request_oid = ObjectId(request_id)
+        now = datetime.datetime.utcnow()
         
-        # Update the request to assign this provider
-        result = mongo.db.service_requests.update_one(
-            {"_id": ObjectId(request_id)},
+        # Assign this provider only if the request is still up for grabs
+        filter_query = claimable_by(provider_id, now)
+        filter_query["_id"] = request_oid
+        previous = mongo.db.service_requests.find_one_and_update(
+            filter_query,
             {
                 "$set": {
                     "provider_id": provider_id,
                     "status": "accepted",
-                    "updated_at": datetime.datetime.utcnow()
-                }
-            }
+                    "updated_at": now
+                },
+                "$unset": {"lease_provider_id": "", "lease_expires_at": ""}
+            },
+            projection={"provider_id": 1, "status": 1}
         )
         
-        if result.matched_count == 0:
-            return jsonify({"error": "Request not found"}), 404
+        if previous is None:
+            return unavailable_response(request_oid)
+
+        # A request sent straight to this provider was already counted as pending
+        old_status = previous['status'] if previous.get('provider_id') == provider_id else None
+        record_transition(mongo.db, provider_id, old_status, "accepted")
         
         return jsonify({
             "success": True,
             "message": "Request accepted successfully"
         }), 200
         
-    except Exception as e:
-        print(f"Error accepting request: {e}")
+    except Exception:
+        logger.exception("Error accepting request")
         return jsonify({"error": "Failed to accept request"}), 500
 
+@request_bp.route('/<request_id>/claim', methods=['PUT'])
+def claim_request(request_id):
+    """Reserve a pending request for a short time while a provider looks at it"""
+    try:
+        data = request.get_json()
+        provider_id = data.get('provider_id')
+
+        if not provider_id:
+            return jsonify({"error": "Provider ID is required"}), 400
+
+        max_seconds = current_app.config["REQUEST_LEASE_SECONDS"]
+        try:
+            seconds = min(float(data.get('seconds', max_seconds)), max_seconds)
+        except (TypeError, ValueError):
+            return jsonify({"error": "seconds must be a number"}), 400
+
+        request_oid = ObjectId(request_id)
+        now = datetime.datetime.utcnow()
+        expires_at = now + datetime.timedelta(seconds=seconds)
+
+        filter_query = claimable_by(provider_id, now)
+        filter_query["_id"] = request_oid
+        result = mongo.db.service_requests.update_one(
+            filter_query,
+            {"$set": {"lease_provider_id": provider_id, "lease_expires_at": expires_at}}
+        )
+
+        if result.matched_count == 0:
+            return unavailable_response(request_oid)
+
+        return jsonify({
+            "success": True,
+            "message": "Request reserved",
+            "lease_expires_at": expires_at
+        }), 200
+
+    except Exception:
+        logger.exception("Error claiming request")
+        return jsonify({"error": "Failed to claim request"}), 500
+
+@request_bp.route('/<request_id>/claim', methods=['DELETE'])
+def release_request(request_id):
+    """Give up a reservation made with /claim"""
+    try:
+        data = request.get_json(silent=True) or {}
+        provider_id = data.get('provider_id') or request.args.get('provider_id')
+
+        if not provider_id:
+            return jsonify({"error": "Provider ID is required"}), 400
+
+        mongo.db.service_requests.update_one(
+            {"_id": ObjectId(request_id), "lease_provider_id": provider_id},
+            {"$unset": {"lease_provider_id": "", "lease_expires_at": ""}}
+        )
+
+        return jsonify({
+            "success": True,
+            "message": "Reservation released"
+        }), 200
+
+    except Exception:
+        logger.exception("Error releasing request")
+        return jsonify({"error": "Failed to release request"}), 500
+
 @request_bp.route('/<request_id>/complete', methods=['PUT'])
 def complete_request(request_id):
     """Mark a service request as completed"""
     try:
-        result = mongo.db.service_requests.update_one(
-            {"_id": ObjectId(request_id)},
+        request_oid = ObjectId(request_id)
+        # Only an accepted request can be completed (see bulk_requests.TRANSITIONS)
+        previous = mongo.db.service_requests.find_one_and_update(
+            {"_id": request_oid, "status": "accepted"},
             {
                 "$set": {
                     "status": "completed",
                     "updated_at": datetime.datetime.utcnow()
                 }
-            }
+            },
+            projection={"provider_id": 1, "status": 1}
         )
         
-        if result.matched_count == 0:
-            return jsonify({"error": "Request not found"}), 404
+        if previous is None:
+            return unavailable_response(request_oid)
+
+        record_transition(mongo.db, previous.get('provider_id'), previous.get('status'), "completed")
         
         return jsonify({
             "success": True,
             "message": "Request marked as completed"
         }), 200
         
-    except Exception as e:
-        print(f"Error completing request: {e}")
+    except Exception:
+        logger.exception("Error completing request")
         return jsonify({"error": "Failed to complete request"}), 500
 
 @request_bp.route('/<request_id>/reject', methods=['PUT'])
@@ -149,30 +324,82 @@ def reject_request(request_id):
     try:
         data = request.get_json()
         rejection_reason = data.get('rejection_reason', 'No reason provided')
+        provider_id = data.get('provider_id')
         
-        result = mongo.db.service_requests.update_one(
-            {"_id": ObjectId(request_id)},
+        request_oid = ObjectId(request_id)
+        # Same rule as bulk rejects: a pending request that is unassigned or
+        # assigned to this provider; without a provider_id only unassigned ones
+        filter_query = reject_filter(provider_id)
+        filter_query["_id"] = request_oid
+        previous = mongo.db.service_requests.find_one_and_update(
+            filter_query,
             {
                 "$set": {
                     "status": "rejected",
                     "rejection_reason": rejection_reason,
                     "updated_at": datetime.datetime.utcnow()
                 }
-            }
+            },
+            projection={"provider_id": 1, "status": 1}
         )
         
-        if result.matched_count == 0:
-            return jsonify({"error": "Request not found"}), 404
+        if previous is None:
+            return unavailable_response(request_oid)
+
+        record_transition(mongo.db, previous.get('provider_id'), previous.get('status'), "rejected")
         
         return jsonify({
             "success": True,
             "message": "Request rejected successfully"
         }), 200
         
-    except Exception as e:
-        print(f"Error rejecting request: {e}")
+    except Exception:
+        logger.exception("Error rejecting request")
         return jsonify({"error": "Failed to reject request"}), 500
 
+@request_bp.route('/bulk', methods=['POST'])
+def bulk_update_requests():
+    """Accept, complete or reject many requests in one call.
+
+    Body: {"provider_id", "ordered": true, "operations": [{"request_id",
+    "action": "accept" | "complete" | "reject", "payload": {...}}]}.
+    Returns a result per operation; see bulk_requests.py.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        provider_id = data.get('provider_id')
+        operations = data.get('operations')
+        ordered = data.get('ordered', True)
+
+        if not provider_id:
+            return jsonify({"error": "Provider ID is required"}), 400
+
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"error": "operations must be a non-empty list"}), 400
+
+        max_operations = current_app.config["BULK_MAX_OPERATIONS"]
+        if len(operations) > max_operations:
+            return jsonify({"error": f"At most {max_operations} operations per call"}), 400
+
+        if not isinstance(ordered, bool):
+            return jsonify({"error": "ordered must be true or false"}), 400
+
+        with metrics.span("requests.bulk"):
+            results = run_batch(mongo.db, provider_id, operations, ordered)
+        succeeded = sum(1 for result in results if result['result'] == "ok")
+
+        return jsonify({
+            "success": succeeded == len(results),
+            "ordered": ordered,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results
+        }), 200
+
+    except Exception:
+        logger.exception("Error running bulk request update")
+        return jsonify({"error": "Failed to update requests"}), 500
+
 @request_bp.route('/stats', methods=['GET'])
 def get_provider_stats():
     """Get statistics for a provider"""
@@ -182,26 +409,19 @@ def get_provider_stats():
         if not provider_id:
             return jsonify({"error": "Provider ID is required"}), 400
         
-        # Get counts for different statuses
-        total_requests = mongo.db.service_requests.count_documents({"provider_id": provider_id})
-        pending_requests = mongo.db.service_requests.count_documents({"provider_id": provider_id, "status": "pending"})
-        accepted_requests = mongo.db.service_requests.count_documents({"provider_id": provider_id, "status": "accepted"})
-        completed_requests = mongo.db.service_requests.count_documents({"provider_id": provider_id, "status": "completed"})
-        rejected_requests = mongo.db.service_requests.count_documents({"provider_id": provider_id, "status": "rejected"})
-        
-        stats = {
-            "total_requests": total_requests,
-            "pending_requests": pending_requests,
-            "accepted_requests": accepted_requests,
-            "completed_requests": completed_requests,
-            "rejected_requests": rejected_requests
-        }
+        # One counter document per provider, kept up to date on every status
+        # change; otherwise one $group over the provider's requests
+        if current_app.config["PROVIDER_STATS_COUNTERS"]:
+            counts = get_counts(mongo.db, provider_id)
+        else:
+            counts = count_by_status(mongo.db, provider_id).get(provider_id, {})
+        stats = stats_response(counts)
         
         return jsonify({
             "success": True,
             "stats": stats
         }), 200
         
-    except Exception as e:
-        print(f"Error fetching provider stats: {e}")
+    except Exception:
+        logger.exception("Error fetching provider stats")
         return jsonify({"error": "Failed to fetch provider stats"}), 500 
\ No newline at end of file
@@ -1,151 +1,180 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, request, jsonify, current_app
 import requests
-from math import radians, cos, sin, asin, sqrt
-from config import mongo
+from config import settings, overpass_api, provider_directory, metrics
+from quickfix_common.pagination import stream_ndjson, wants_stream
+from quickfix_common.http_client import UpstreamUnavailable
+from quickfix_common.geo import haversine_many, nearest_indices
+from quickfix_common.overpass_cache import TileCache, tile_for, tile_center, tile_padding
 
 service_bp = Blueprint('service_bp', __name__)
+logger = logging.getLogger(__name__)
 
-# Haversine formula to calculate distance in meters
-def haversine(lon1, lat1, lon2, lat2):
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1 
-    dlat = lat2 - lat1 
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a)) 
-    r = 6371 # Radius of earth in kilometers
-    return c * r * 1000
+# Search radius for OpenStreetMap services, in meters
+SEARCH_RADIUS_M = 5000
 
-@service_bp.route('/nearby', methods=['GET'])
-def get_nearby_services():
-    lat = request.args.get('lat', type=float)
-    lng = request.args.get('lng', type=float)
-    service_type = request.args.get('service_type')
-
-    if not all([lat, lng, service_type]):
-        return jsonify({"error": "Missing required parameters"}), 400
+# Overpass results are cached per (service_type, tile). Each tile is fetched
+# once with a padded radius and re-filtered by exact distance per request.
+TILE_DEGREES = settings["OVERPASS_TILE_DEGREES"]
+tile_cache = TileCache(
+    ttl_seconds=settings["OVERPASS_CACHE_TTL_SECONDS"],
+    max_entries=settings["OVERPASS_CACHE_MAX_TILES"]
+)
 
+def build_overpass_query(service_type, lat, lng, radius=SEARCH_RADIUS_M):
+    """Build the Overpass QL query for a service type around a point"""
     query_map = {
         "fuel": f'''
-            node["amenity"="fuel"](around:5000,{lat},{lng});
-            node["shop"="fuel"](around:5000,{lat},{lng});
+            node["amenity"="fuel"](around:{radius},{lat},{lng});
+            node["shop"="fuel"](around:{radius},{lat},{lng});
         ''',
         "garage": f'''
-            node["shop"~"car|car_repair|tyres"](around:5000,{lat},{lng});
-            node["craft"="auto_mechanic"](around:5000,{lat},{lng});
-            node["shop"="car_repair"](around:5000,{lat},{lng});
-            node["shop"="tyres"](around:5000,{lat},{lng});
+            node["shop"~"car|car_repair|tyres"](around:{radius},{lat},{lng});
+            node["craft"="auto_mechanic"](around:{radius},{lat},{lng});
+            node["shop"="car_repair"](around:{radius},{lat},{lng});
+            node["shop"="tyres"](around:{radius},{lat},{lng});
         ''',
         "towing": f'''
-            node["shop"~"car|car_repair"](around:5000,{lat},{lng});
-            node["amenity"="towing"](around:5000,{lat},{lng});
-            node["shop"="towing"](around:5000,{lat},{lng});
+            node["shop"~"car|car_repair"](around:{radius},{lat},{lng});
+            node["amenity"="towing"](around:{radius},{lat},{lng});
+            node["shop"="towing"](around:{radius},{lat},{lng});
         '''
     }
-    
-    overpass_query = f"""
+
+    return f"""
     [out:json][timeout:25];
     (
       {query_map.get(service_type, '')}
     );
     out center;
     """
-    
-    try:
-        response = requests.post(
-            "https://overpass-api.de/api/interpreter", 
-            data=overpass_query,
+
+def load_osm_tile(service_type, tile):
+    """Fetch every named OpenStreetMap place that any point in a tile could see"""
+    center_lat, center_lng = tile_center(tile, TILE_DEGREES)
+    # Overpass queries are read-only, so they are safe to retry
+    with metrics.span("overpass.fetch"):
+        response = overpass_api.post(
+            settings["OVERPASS_URL"],
+            data=build_overpass_query(service_type, center_lat, center_lng,
+                                      SEARCH_RADIUS_M + tile_padding(TILE_DEGREES)),
             timeout=30,  # 30 second timeout
-            headers={'User-Agent': 'QuickFix/1.0'}
+            idempotent=True
         )
         response.raise_for_status()
         data = response.json()
-        
-        services = []
-        for element in data.get('elements', []):
-            tags = element.get('tags', {})
-            service_lat = element.get('lat')
-            service_lon = element.get('lon')
-            
-            if service_lat is None or service_lon is None:
-                continue
-
-            service_name = tags.get('name')
-            if not service_name or service_name == 'N/A':
-                continue
 
+    places = []
+    for element in data.get('elements', []):
+        tags = element.get('tags', {})
+        service_lat = element.get('lat')
+        service_lon = element.get('lon')
+
+        if service_lat is None or service_lon is None:
+            continue
+
+        service_name = tags.get('name')
+        if not service_name or service_name == 'N/A':
+            continue
+
+        places.append({
+            "id": element.get('id'),
+            "name": service_name,
+            "lat": service_lat,
+            "lng": service_lon,
+            "phone": tags.get('phone') or tags.get('contact:phone') or None
+        })
+
+    # Coordinate columns are kept next to the places for batch distance math
+    return places, [p['lng'] for p in places], [p['lat'] for p in places]
+
+@service_bp.route('/nearby', methods=['GET'])
+def get_nearby_services():
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    service_type = request.args.get('service_type')
+
+    if not all([lat, lng, service_type]):
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    try:
+        tile = tile_for(lat, lng, TILE_DEGREES)
+        places, lngs, lats = tile_cache.get_or_load(
+            (service_type, tile),
+            lambda: load_osm_tile(service_type, tile),
+            wait_timeout=30
+        )
+
+        # The cached tile is a superset, keep only what is within range,
+        # nearest first, using one batch distance computation
+        distances = haversine_many(lng, lat, lngs, lats)
+        services = []
+        for i in nearest_indices(distances, max_distance=SEARCH_RADIUS_M):
+            place = places[i]
             service = {
-                "id": element.get('id'),
-                "name": service_name,
+                "id": place['id'],
+                "name": place['name'],
                 "type": service_type,
-                "location": { "lat": service_lat, "lng": service_lon },
-                "distance": haversine(lng, lat, service_lon, service_lat),
-                "phone": tags.get('phone') or tags.get('contact:phone') or None
+                "location": { "lat": place['lat'], "lng": place['lng'] },
+                "distance": distances[i],
+                "phone": place['phone']
             }
             services.append(service)
 
-        services.sort(key=lambda x: x['distance'])
-
         return jsonify({"services": services}), 200
         
+    except UpstreamUnavailable as e:
+        logger.warning("Overpass API skipped: %s", e)
+        return jsonify({"error": "Service temporarily unavailable. Please try again later."}), 503
+        
     except requests.exceptions.Timeout:
-        print("Overpass API timeout")
+        logger.warning("Overpass API timeout")
         return jsonify({"error": "Service temporarily unavailable. Please try again later."}), 503
         
     except requests.exceptions.RequestException as e:
-        print(f"Overpass API error: {e}")
+        logger.warning("Overpass API error: %s", e)
         return jsonify({"error": "Unable to fetch services at this time. Please try again later."}), 503
         
     except Exception as e:
-        print(f"An error occurred: {e}")
+        logger.exception("Error fetching nearby services")
         return jsonify({"error": "Failed to fetch services", "details": str(e)}), 500
 
+@service_bp.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss counters for the Overpass tile cache"""
+    return jsonify({"overpass_cache": tile_cache.stats()}), 200
+
+@service_bp.route('/upstream-stats', methods=['GET'])
+def get_upstream_stats():
+    """Circuit state and call counters for the Overpass client"""
+    return jsonify({"overpass": overpass_api.stats()}), 200
+
 @service_bp.route('/providers', methods=['GET'])
 def get_providers_by_service():
-    """Get all registered providers by service type"""
+    """Get registered providers by service type, nearest first (NDJSON with ?format=ndjson)"""
     service_type = request.args.get('service_type')
     lat = request.args.get('lat', type=float)
     lng = request.args.get('lng', type=float)
+    radius = request.args.get('radius', type=float)  # meters
+    limit = request.args.get('limit', type=int)
     
     if not service_type:
         return jsonify({"error": "Service type is required"}), 400
+
+    if limit is not None and limit < 1:
+        return jsonify({"error": "Limit must be a positive integer"}), 400
     
     try:
-        # Find providers with the specified service type and location
-        query = {
-            "provider_type": service_type,
-            "location": {"$exists": True}
-        }
-        
-        providers = list(mongo.db.providers.find(query))
-        
-        services = []
-        for provider in providers:
-            if 'location' in provider and lat and lng:
-                # Calculate distance if user location is provided
-                distance = haversine(lng, lat, provider['location']['lng'], provider['location']['lat'])
-            else:
-                distance = 0
-            
-            service = {
-                "id": str(provider['_id']),
-                "name": provider.get('business_name', provider.get('name', 'Unknown')),
-                "type": provider.get('provider_type', service_type),
-                "location": provider.get('location', {}),
-                "distance": distance,
-                "phone": provider.get('phone'),
-                "address": provider.get('address'),
-                "services": provider.get('services', ''),
-                "working_hours": provider.get('working_hours', ''),
-                "source": "registered_provider"
-            }
-            services.append(service)
-        
-        # Sort by distance if user location is provided
-        if lat and lng:
-            services.sort(key=lambda x: x['distance'])
+        lookup = current_app.config["PROVIDER_LOOKUP"]
+        if wants_stream(request):
+            # One service per line, written as the lookup yields them
+            return stream_ndjson(provider_directory.iter_find(service_type, lat, lng, radius, limit, lookup=lookup))
+
+        with metrics.span(f"provider_directory.{lookup}"):
+            services = provider_directory.find(service_type, lat, lng, radius, limit, lookup=lookup)
         
         return jsonify({"services": services}), 200
         
-    except Exception as e:
-        print(f"Error fetching providers: {e}")
+    except Exception:
+        logger.exception("Error fetching providers")
         return jsonify({"error": "Failed to fetch providers"}), 500
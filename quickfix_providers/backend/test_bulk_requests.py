@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Bulk actions against a request that changes between the batch's read and
+its bulk_write: the guard must leave it alone, report a conflict and keep
+it out of the provider's counters
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from bson.objectid import ObjectId
+
+from bulk_requests import run_batch
+
+
+class Result:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class FakeRequests:
+    """service_requests with just enough of find/bulk_write for run_batch.
+
+    changes are applied right before the bulk_write, as if another provider
+    got there first.
+    """
+
+    def __init__(self, docs, changes):
+        self.docs = {doc['_id']: dict(doc) for doc in docs}
+        self.changes = changes
+
+    def find(self, query, projection=None):
+        ids = query["_id"]["$in"]
+        return [dict(self.docs[oid]) for oid in ids if oid in self.docs]
+
+    def bulk_write(self, writes, ordered=True):
+        for oid, change in self.changes.items():
+            self.docs[oid].update(change)
+
+        matched = 0
+        for write in writes:
+            doc = self.docs.get(write._filter["_id"])
+            if doc is not None and all(matches(doc.get(key), want)
+                                       for key, want in write._filter.items() if key != "$or"):
+                doc.update(write._doc["$set"])
+                matched += 1
+        return Result(matched)
+
+
+def matches(value, want):
+    if isinstance(want, dict):
+        return value in want["$in"]
+    return value == want
+
+
+class FakeStats:
+    def __init__(self):
+        self.updates = []
+
+    def update_one(self, query, update):
+        self.updates.append((query["_id"], update["$inc"]))
+
+
+class FakeDB:
+    def __init__(self, docs, changes):
+        self.service_requests = FakeRequests(docs, changes)
+        self.provider_stats = FakeStats()
+
+
+def test_request_changed_before_write():
+    """A guard miss is a conflict and doesn't stop the ordered batch"""
+    taken, mine = ObjectId(), ObjectId()
+    db = FakeDB(
+        [{"_id": taken, "status": "pending", "provider_id": None},
+         {"_id": mine, "status": "accepted", "provider_id": "p1"}],
+        {taken: {"status": "accepted", "provider_id": "p2"}}
+    )
+
+    results = run_batch(db, "p1", [
+        {"request_id": str(taken), "action": "reject"},
+        {"request_id": str(mine), "action": "complete"},
+    ], ordered=True)
+
+    assert results[0]["result"] == "conflict"
+    assert results[0]["current_status"] == "accepted"
+    assert results[1]["result"] == "ok"
+    assert db.service_requests.docs[taken]["status"] == "accepted"
+    assert db.service_requests.docs[taken]["provider_id"] == "p2"
+    assert db.service_requests.docs[mine]["status"] == "completed"
+    # Only the write that landed is counted
+    assert db.provider_stats.updates == [("p1", {"counts.completed": 1, "counts.accepted": -1})]
+
+
+def test_planning_conflict_skips_the_rest():
+    """An item rejected while planning stops an ordered batch before the write"""
+    other, mine = ObjectId(), ObjectId()
+    db = FakeDB(
+        [{"_id": other, "status": "pending", "provider_id": "p2"},
+         {"_id": mine, "status": "accepted", "provider_id": "p1"}],
+        {}
+    )
+
+    results = run_batch(db, "p1", [
+        {"request_id": str(other), "action": "reject"},
+        {"request_id": str(mine), "action": "complete"},
+    ], ordered=True)
+
+    assert [result["result"] for result in results] == ["conflict", "skipped"]
+    assert db.service_requests.docs[mine]["status"] == "accepted"
+    assert db.provider_stats.updates == []
+
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting bulk request tests...\n")
+
+    for test in (test_request_changed_before_write, test_planning_conflict_skips_the_rest):
+        try:
+            test()
+            print(f"✅ {test.__name__} passed!")
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed! {e}")
+
+    print("\n🏁 Bulk request tests completed!")
+
+if __name__ == "__main__":
+    main()
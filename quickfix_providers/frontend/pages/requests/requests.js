@@ -1,6 +1,20 @@
 // Provider Requests Management
 const API_URL = 'http://localhost:8002/api/providers';
 
+// The list endpoints return one page at a time plus a cursor for the next one
+let loadedRequests = [];
+let nextCursors = { pending: null, assigned: null };
+
+function requestListUrl(source, cursor) {
+    const params = new URLSearchParams();
+    if (source === 'assigned') params.set('provider_id', localStorage.getItem('providerId'));
+    if (cursor) params.set('cursor', cursor);
+
+    const path = source === 'pending' ? 'pending-requests' : 'provider-requests';
+    const query = params.toString();
+    return `${API_URL}/requests/${path}${query ? '?' + query : ''}`;
+}
+
 document.addEventListener('DOMContentLoaded', () => {
     const token = localStorage.getItem('providerToken'); // Changed from authToken to providerToken
     const providerName = localStorage.getItem('providerName');
@@ -30,6 +44,10 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Load requests
     loadProviderRequests();
+    document.getElementById('load-more-btn').addEventListener('click', loadMoreRequests);
+
+    // Live updates instead of manual reloads
+    subscribeToRequestEvents();
 
     // Setup filter event listeners
     setupFilters();
@@ -39,7 +57,6 @@ async function loadProviderRequests() {
     const loadingSpinner = document.getElementById('loading-spinner');
     const noRequests = document.getElementById('no-requests');
     const requestsList = document.getElementById('requests-list');
-    const providerId = localStorage.getItem('providerId');
 
     try {
         loadingSpinner.style.display = 'flex';
@@ -47,11 +64,11 @@ async function loadProviderRequests() {
         requestsList.innerHTML = '';
 
         // First, get pending requests that don't have a provider assigned yet
-        const pendingResponse = await fetch(`${API_URL}/requests/pending-requests`);
+        const pendingResponse = await fetch(requestListUrl('pending'));
         const pendingData = await pendingResponse.json();
 
         // Then, get requests that are already assigned to this provider
-        const assignedResponse = await fetch(`${API_URL}/requests/provider-requests?provider_id=${providerId}`);
+        const assignedResponse = await fetch(requestListUrl('assigned'));
         const assignedData = await assignedResponse.json();
 
         let allRequests = [];
@@ -64,6 +81,12 @@ async function loadProviderRequests() {
             allRequests = allRequests.concat(assignedData.requests);
         }
 
+        loadedRequests = allRequests;
+        setNextCursors({
+            pending: pendingData.success ? pendingData.next_cursor : null,
+            assigned: assignedData.success ? assignedData.next_cursor : null
+        });
+
         if (allRequests.length === 0) {
             loadingSpinner.style.display = 'none';
             noRequests.classList.remove('hidden');
@@ -84,6 +107,98 @@ async function loadProviderRequests() {
     }
 }
 
+// The backend pushes request changes over Server-Sent Events. EventSource
+// reconnects on its own and resumes from the last event id it received.
+// Each event carries the request's list fields, so the lists are updated in
+// place rather than fetched again.
+function subscribeToRequestEvents() {
+    const token = localStorage.getItem('providerToken');
+    if (!window.EventSource || !token) return;
+
+    // EventSource can't send an Authorization header
+    const source = new EventSource(`${API_URL}/requests/stream?access_token=${encodeURIComponent(token)}`);
+
+    source.addEventListener('new', event => {
+        applyRequestEvent(JSON.parse(event.data));
+        showToast('New service request received!', false);
+    });
+    ['accepted', 'completed', 'rejected', 'cancelled', 'updated', 'removed'].forEach(type => {
+        source.addEventListener(type, event => applyRequestEvent(JSON.parse(event.data)));
+    });
+    // Sent after a reconnect when too much was missed to replay
+    source.addEventListener('reset', loadProviderRequests);
+}
+
+function applyRequestEvent(event) {
+    const request = event.request;
+    const index = loadedRequests.findIndex(r => r._id === request._id);
+
+    if (event.type === 'removed') {
+        // Taken by another provider or cancelled: only the id is sent
+        if (index === -1) return;
+        loadedRequests.splice(index, 1);
+    } else if (index === -1) {
+        loadedRequests.unshift(request);
+    } else {
+        loadedRequests[index] = { ...loadedRequests[index], ...request };
+    }
+
+    renderRequests();
+}
+
+function renderRequests() {
+    const noRequests = document.getElementById('no-requests');
+    const requestsList = document.getElementById('requests-list');
+
+    requestsList.innerHTML = '';
+    noRequests.classList.toggle('hidden', loadedRequests.length > 0);
+    updateStats(loadedRequests);
+    displayRequests(loadedRequests);
+    filterRequests();
+}
+
+function setNextCursors(cursors) {
+    nextCursors = cursors;
+    const hasMore = Boolean(nextCursors.pending || nextCursors.assigned);
+    document.getElementById('load-more-btn').classList.toggle('hidden', !hasMore);
+}
+
+async function loadMoreRequests() {
+    const loadMoreBtn = document.getElementById('load-more-btn');
+    loadMoreBtn.disabled = true;
+
+    try {
+        const cursors = { pending: null, assigned: null };
+        let newRequests = [];
+
+        for (const source of ['pending', 'assigned']) {
+            if (!nextCursors[source]) continue;
+
+            const response = await fetch(requestListUrl(source, nextCursors[source]));
+            const data = await response.json();
+
+            if (data.success) {
+                newRequests = newRequests.concat(data.requests);
+                cursors[source] = data.next_cursor;
+            } else {
+                cursors[source] = nextCursors[source];
+                showToast('Failed to load more requests', true);
+            }
+        }
+
+        loadedRequests = loadedRequests.concat(newRequests);
+        updateStats(loadedRequests);
+        displayRequests(newRequests);
+        filterRequests();
+        setNextCursors(cursors);
+    } catch (error) {
+        console.error('Error loading more requests:', error);
+        showToast('Network error. Please try again.', true);
+    } finally {
+        loadMoreBtn.disabled = false;
+    }
+}
+
 function updateStats(requests) {
     const stats = {
         pending: requests.filter(r => r.status === 'pending').length,
@@ -417,6 +532,11 @@ async function acceptRequest(requestId) {
             showToast('Request accepted successfully', false);
             closeModal();
             loadProviderRequests(); // Reload the list
+        } else if (response.status === 409) {
+            // Another provider got there first
+            showToast('This request was already taken by another provider', true);
+            closeModal();
+            loadProviderRequests();
         } else {
             showToast(data.error || 'Failed to accept request', true);
         }
@@ -441,6 +561,11 @@ async function completeRequest(requestId) {
             showToast('Request marked as completed', false);
             closeModal();
             loadProviderRequests(); // Reload the list
+        } else if (response.status === 409) {
+            // Only accepted requests can be completed
+            showToast(`This request can't be completed, it is ${data.status}`, true);
+            closeModal();
+            loadProviderRequests();
         } else {
             showToast(data.error || 'Failed to complete request', true);
         }
@@ -459,13 +584,16 @@ async function rejectRequest(requestId) {
     }
 
     try {
+        const providerId = localStorage.getItem('providerId');
+
         const response = await fetch(`${API_URL}/requests/${requestId}/reject`, {
             method: 'PUT',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                rejection_reason: rejectionReason
+                rejection_reason: rejectionReason,
+                provider_id: providerId
             })
         });
 
@@ -476,6 +604,12 @@ async function rejectRequest(requestId) {
             closeRejectionModal();
             closeModal();
             loadProviderRequests(); // Reload the list
+        } else if (response.status === 409) {
+            // Only pending requests can be rejected
+            showToast(`This request can't be rejected, it is ${data.status}`, true);
+            closeRejectionModal();
+            closeModal();
+            loadProviderRequests();
         } else {
             showToast(data.error || 'Failed to reject request', true);
         }
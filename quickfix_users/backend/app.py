@@ -1,27 +1,60 @@
-from config import app
+from flask import Flask, jsonify
+from flask_cors import CORS
+from config import settings, init_mongo, bootstrap_indexes, mongo_health, metrics, metrics_gauges
+from quickfix_common.app_logging import configure_logging, init_request_logging, logging_stats
+from quickfix_common.metrics import init_metrics
 from routes.auth_routes import auth_bp
-from routes.service_routes import service_bp  # <-- IMPORT the new service routes
+from routes.service_routes import service_bp
 from routes.request_routes import request_bp
-from flask_cors import CORS
 
-# Enable Cross-Origin Resource Sharing (CORS)
-# This allows your frontend (on a different port) to communicate with this backend
-CORS(app)
+def create_app(ensure_indexes=None):
+    """Build the users backend app.
+
+    The MongoDB client is created here, so a pre-forking server (see
+    gunicorn.conf.py) builds the app in each worker or re-runs init_mongo()
+    after the fork. ensure_indexes defaults to MONGO_ENSURE_INDEXES.
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(settings)
+    configure_logging(app.config, "users")
+    init_request_logging(app)
+    if app.config["METRICS_ENABLED"]:
+        init_metrics(app, metrics, metrics_gauges)
+
+    # Enable Cross-Origin Resource Sharing (CORS)
+    # This allows your frontend (on a different port) to communicate with this backend
+    CORS(app)
+
+    # Register the authentication blueprint with a URL prefix
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+
+    # Register the service blueprint with a URL prefix
+    app.register_blueprint(service_bp, url_prefix='/api/services')
+
+    # Register the request blueprint
+    app.register_blueprint(request_bp, url_prefix='/api/requests')
 
-# Register the authentication blueprint with a URL prefix
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    @app.route('/')
+    def index():
+        return "QuickFix Backend Server is running!"
 
-# Register the new service blueprint with a URL prefix
-app.register_blueprint(service_bp, url_prefix='/api/services') # <-- REGISTER the new routes
+    @app.route('/health')
+    def health():
+        """Database reachability and connection pool counters"""
+        ok, details = mongo_health()
+        return jsonify({
+            "status": "ok" if ok else "unavailable",
+            "mongo": details,
+            "logging": logging_stats()
+        }), 200 if ok else 503
 
-# Register the request blueprint
-app.register_blueprint(request_bp, url_prefix='/api/requests')
+    init_mongo(app)
+    if app.config["MONGO_ENSURE_INDEXES"] if ensure_indexes is None else ensure_indexes:
+        bootstrap_indexes()
 
-@app.route('/')
-def index():
-    return "QuickFix Backend Server is running!"
+    return app
 
 if __name__ == '__main__':
-    # Run the Flask app
+    # Development server; see gunicorn.conf.py for production
     # debug=True will auto-reload the server when you make changes
-    app.run(port=8001, debug=True)
+    create_app().run(port=8001, debug=True)
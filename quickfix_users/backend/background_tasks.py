@@ -0,0 +1,206 @@
+"""
+Follow-up work for request routes, off the request thread
+
+A route does the writes its caller needs and hands everything else
+(audit log, analytics) to a TaskQueue:
+
+- tasks go on a bounded in-memory queue served by a worker thread
+- when the queue is full, or a task fails, it is written to the
+  `task_outbox` collection instead, and the worker retries it from there
+  once the queue is quiet again
+- tasks still queued when the process shuts down are moved to the outbox
+- a task that fails max_attempts times stays in the outbox as dead (with
+  `dead_at` set) for inspection, and a TTL index removes it a week later
+
+Tasks run at least once, so handlers should be safe to repeat or at least
+harmless if they are. Each handler is called as handler(db, payload) with
+a JSON/BSON-friendly payload dict.
+"""
+
+import datetime
+import logging
+import queue
+import threading
+
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+OUTBOX = "task_outbox"
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue:
+    """Bounded in-memory task queue that spills to a Mongo outbox"""
+
+    def __init__(self, mongo, max_queued=1000, outbox_poll_seconds=5,
+                 outbox_lease_seconds=60, max_attempts=5):
+        self.mongo = mongo
+        self.max_queued = max_queued
+        self.outbox_poll_seconds = outbox_poll_seconds
+        self.outbox_lease_seconds = outbox_lease_seconds
+        self.max_attempts = max_attempts
+
+        self.handlers = {}
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+
+        self.queued = 0
+        self.done = 0
+        self.failed = 0
+        self.spilled = 0
+        self.from_outbox = 0
+
+    def task(self, name):
+        """Decorator registering handler(db, payload) under a task name"""
+        def register(handler):
+            self.handlers[name] = handler
+            return handler
+        return register
+
+    def _count(self, field):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def start(self):
+        """Start the worker thread if it isn't running in this process.
+
+        submit() does this on demand; it only needs calling early to start
+        draining the outbox before the first request.
+        """
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._work, name="background-tasks", daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, name, payload):
+        """Queue a task; never blocks on the worker"""
+        if name not in self.handlers:
+            raise KeyError(f"Unknown background task: {name}")
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        try:
+            self._queue.put_nowait((name, payload))
+            self._count('queued')
+        except queue.Full:
+            self._spill(name, payload)
+
+    def _spill(self, name, payload, attempts=0, error=None):
+        """Write a task to the outbox for the worker to pick up later"""
+        doc = {
+            "task": name,
+            "payload": payload,
+            "attempts": attempts,
+            "available_at": datetime.datetime.utcnow(),
+            "created_at": datetime.datetime.utcnow()
+        }
+        if error:
+            doc["last_error"] = error
+        if attempts >= self.max_attempts:
+            doc["dead_at"] = doc["available_at"]
+        try:
+            self.mongo.db[OUTBOX].insert_one(doc)
+            self._count('spilled')
+        except PyMongoError as e:
+            self._count('failed')
+            logger.error("Could not write %s task to the outbox: %s", name, e)
+
+    def _run(self, name, payload):
+        self.handlers[name](self.mongo.db, payload)
+        self._count('done')
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                name, payload = self._queue.get(timeout=self.outbox_poll_seconds)
+            except queue.Empty:
+                # Quiet moment: work through whatever spilled to the outbox
+                self._drain_outbox()
+                continue
+            try:
+                self._run(name, payload)
+            except Exception as e:
+                logger.warning("Background task %s failed, retrying from the outbox: %s", name, e)
+                self._spill(name, payload, attempts=1, error=str(e))
+            finally:
+                self._queue.task_done()
+
+    def _drain_outbox(self, limit=100):
+        """Run up to `limit` due outbox tasks; returns how many were claimed"""
+        claimed = 0
+        while claimed < limit and self._queue.empty() and not self._stopping.is_set():
+            now = datetime.datetime.utcnow()
+            try:
+                # Lease the task so another worker process doesn't run it too
+                doc = self.mongo.db[OUTBOX].find_one_and_update(
+                    {"available_at": {"$lte": now}, "attempts": {"$lt": self.max_attempts},
+                     "dead_at": {"$exists": False}},
+                    {
+                        "$set": {"available_at": now + datetime.timedelta(seconds=self.outbox_lease_seconds)},
+                        "$inc": {"attempts": 1}
+                    },
+                    sort=[("available_at", ASCENDING)]
+                )
+            except PyMongoError as e:
+                logger.error("Could not read the task outbox: %s", e)
+                return claimed
+            if doc is None:
+                return claimed
+
+            claimed += 1
+            self._count('from_outbox')
+            try:
+                if doc["task"] not in self.handlers:
+                    raise KeyError(f"Unknown background task: {doc['task']}")
+                self._run(doc["task"], doc.get("payload") or {})
+            except Exception as e:
+                # Left in place; retried when the lease runs out, or marked
+                # dead once it has used up its attempts
+                self._count('failed')
+                update = {"last_error": str(e)}
+                if doc['attempts'] + 1 >= self.max_attempts:
+                    update["dead_at"] = now
+                    logger.error("Outbox task %s failed %d times, giving up: %s", doc['task'], doc['attempts'] + 1, e)
+                else:
+                    logger.warning("Outbox task %s failed (attempt %d): %s", doc['task'], doc['attempts'] + 1, e)
+                self.mongo.db[OUTBOX].update_one({"_id": doc["_id"]}, {"$set": update})
+                continue
+            self.mongo.db[OUTBOX].delete_one({"_id": doc["_id"]})
+        return claimed
+
+    def shutdown(self, timeout=5):
+        """Stop the worker and move anything still queued to the outbox"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        while True:
+            try:
+                name, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._spill(name, payload)
+            self._queue.task_done()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = {
+                "queue_size": self._queue.qsize(),
+                "max_queued": self.max_queued,
+                "worker_alive": self._thread is not None and self._thread.is_alive(),
+                "queued": self.queued,
+                "done": self.done,
+                "failed": self.failed,
+                "spilled": self.spilled,
+                "from_outbox": self.from_outbox
+            }
+        try:
+            stats["outbox_pending"] = self.mongo.db[OUTBOX].count_documents({"dead_at": {"$exists": False}})
+            stats["outbox_dead"] = self.mongo.db[OUTBOX].count_documents({"dead_at": {"$exists": True}})
+        except PyMongoError:
+            stats["outbox_pending"] = stats["outbox_dead"] = None
+        return stats
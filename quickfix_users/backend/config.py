@@ -1,20 +1,264 @@
-from flask import Flask
-from flask_pymongo import PyMongo
-from flask_bcrypt import Bcrypt
 import os
+import sys
+
+# Code both backends share lives in quickfix_common/ at the repository root.
+# Every entry point (app.py, wsgi.py, scripts) imports this module first.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from flask import Config
+from flask_pymongo import PyMongo
+from quickfix_common.db_indexes import ensure_indexes, missing_indexes
+from quickfix_common.auth import PrincipalCache
+from quickfix_common.password_hashing import PasswordHasher
+from background_tasks import TaskQueue
+from quickfix_common.http_client import UpstreamClient
+from quickfix_common.overpass_adapters import overpass_adapter
+from quickfix_common.provider_index import ProviderIndex
+from quickfix_common.provider_directory import ProviderDirectory
+from quickfix_common.metrics import Metrics, CommandMetrics
+from quickfix_common.serialization import install_json
+from quickfix_common.mongo_pool import PoolMetrics, ConfiguredDatabase, client_options, parse_collection_options
+import logging
+import time
 
-app = Flask(__name__)
+try:
+    from dotenv import load_dotenv
+except ImportError:  # python-dotenv is optional
+    load_dotenv = None
+
+# Settings for every app create_app() builds (see app.py). Module-level
+# objects below read them at import time, routes read current_app.config.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+settings = Config(BASE_DIR)
+
+# Settings come from the environment; a .env file next to this one fills in
+# anything that isn't set. QUICKFIX_SETTINGS can point at a Python file that
+# overrides the result (see the end of the configuration section).
+if load_dotenv:
+    load_dotenv(os.path.join(BASE_DIR, ".env"))
 
 # --- Configuration ---
 # mongo db connection 
-MONGO_URI = "mongodb://localhost:27017/quickfix"
-app.config["MONGO_URI"] = MONGO_URI
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/quickfix")
+settings["MONGO_URI"] = MONGO_URI
+# Create the indexes the hot queries rely on at startup (see db_indexes.py)
+settings["MONGO_ENSURE_INDEXES"] = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() == "true"
+
+# MongoDB connection pool, per server process. Checkouts that wait longer
+# than MONGO_WAIT_QUEUE_TIMEOUT_MS fail instead of stalling (0 = wait forever).
+settings["MONGO_MAX_POOL_SIZE"] = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+settings["MONGO_MIN_POOL_SIZE"] = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+settings["MONGO_WAIT_QUEUE_TIMEOUT_MS"] = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+settings["MONGO_SERVER_SELECTION_TIMEOUT_MS"] = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+settings["MONGO_CONNECT_TIMEOUT_MS"] = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+# Client-wide defaults, and per-collection overrides as JSON, e.g.
+# {"providers": {"read_preference": "secondaryPreferred"}, "service_requests": {"write_concern": "majority"}}
+settings["MONGO_READ_PREFERENCE"] = os.getenv("MONGO_READ_PREFERENCE", "primary")
+settings["MONGO_WRITE_CONCERN"] = os.getenv("MONGO_WRITE_CONCERN", "")
+settings["MONGO_COLLECTION_OPTIONS"] = os.getenv("MONGO_COLLECTION_OPTIONS", "")
+
+# Logging (see app_logging.py): LOG_LEVEL, json or text lines, and the share
+# of DEBUG records kept (0-1). Records wait in a queue of LOG_QUEUE_SIZE for
+# the writer thread; beyond that they are dropped rather than block a request.
+settings["LOG_LEVEL"] = os.getenv("LOG_LEVEL", "INFO")
+settings["LOG_FORMAT"] = os.getenv("LOG_FORMAT", "json")
+settings["LOG_DEBUG_SAMPLE_RATE"] = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+settings["LOG_QUEUE_SIZE"] = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Prometheus-style metrics at GET /metrics (see metrics.py). Under gunicorn
+# point METRICS_DIR at a directory the workers share so every scrape reports
+# all of them; each worker writes its numbers there every N seconds.
+settings["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+settings["METRICS_DIR"] = os.getenv("METRICS_DIR", "")
+settings["METRICS_FLUSH_SECONDS"] = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
 
 # This is used for signing JWTs, change it to a random secret string
-app.config["SECRET_KEY"] = "your_super_secret_key_change_me" 
+settings["SECRET_KEY"] = "your_super_secret_key_change_me" 
+
+# Overall time budget (seconds) for /api/services/nearby. Overpass and the
+# providers backend are queried in parallel; whatever hasn't answered by then
+# is dropped and the response is marked partial.
+settings["NEARBY_DEADLINE_SECONDS"] = float(os.getenv("NEARBY_DEADLINE_SECONDS", "15"))
+
+# Overpass tile cache: results are shared by every nearby search that falls
+# in the same tile for the same service type.
+settings["OVERPASS_TILE_DEGREES"] = float(os.getenv("OVERPASS_TILE_DEGREES", "0.01"))
+settings["OVERPASS_CACHE_TTL_SECONDS"] = int(os.getenv("OVERPASS_CACHE_TTL_SECONDS", "600"))
+settings["OVERPASS_CACHE_MAX_TILES"] = int(os.getenv("OVERPASS_CACHE_MAX_TILES", "512"))
+
+# Outgoing HTTP calls (see http_client.py): keep-alive pool per upstream,
+# at most N concurrent calls each, jittered retries, and a circuit breaker
+# that skips an upstream for a while after repeated failures.
+settings["UPSTREAM_MAX_CONNECTIONS"] = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "20"))
+settings["UPSTREAM_RETRIES"] = int(os.getenv("UPSTREAM_RETRIES", "2"))
+settings["UPSTREAM_BACKOFF_SECONDS"] = float(os.getenv("UPSTREAM_BACKOFF_SECONDS", "0.2"))
+settings["UPSTREAM_BREAKER_FAILURES"] = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+settings["UPSTREAM_BREAKER_RESET_SECONDS"] = float(os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "30"))
+# Overpass only gives each client IP a couple of query slots
+settings["OVERPASS_URL"] = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+settings["OVERPASS_MAX_CONCURRENT"] = int(os.getenv("OVERPASS_MAX_CONCURRENT", "4"))
+# What the Overpass client talks to (see overpass_adapters.py): "live",
+# "record" (live, saving fixtures), "replay" (fixtures only) or "synthetic"
+# (made-up places with configurable latency and failure rate, for benchmarks)
+settings["OVERPASS_MODE"] = os.getenv("OVERPASS_MODE", "live")
+settings["OVERPASS_FIXTURES_DIR"] = os.getenv("OVERPASS_FIXTURES_DIR", os.path.join(BASE_DIR, "overpass_fixtures"))
+settings["OVERPASS_SYNTHETIC_POIS"] = int(os.getenv("OVERPASS_SYNTHETIC_POIS", "200"))
+settings["OVERPASS_SYNTHETIC_LATENCY_MS"] = float(os.getenv("OVERPASS_SYNTHETIC_LATENCY_MS", "0"))
+settings["OVERPASS_SYNTHETIC_JITTER_MS"] = float(os.getenv("OVERPASS_SYNTHETIC_JITTER_MS", "0"))
+settings["OVERPASS_SYNTHETIC_ERROR_RATE"] = float(os.getenv("OVERPASS_SYNTHETIC_ERROR_RATE", "0"))
+settings["OVERPASS_SYNTHETIC_SEED"] = int(os.getenv("OVERPASS_SYNTHETIC_SEED", "0"))
+settings["PROVIDERS_API_URL"] = os.getenv("PROVIDERS_API_URL", "http://localhost:8002")
+settings["PROVIDERS_API_MAX_CONCURRENT"] = int(os.getenv("PROVIDERS_API_MAX_CONCURRENT", "32"))
+
+# Where /nearby gets registered providers from:
+#   "http"  - GET /api/providers/services/providers on the providers backend
+#   "local" - the same lookup run in this process against the shared
+#             database (see provider_directory.py), no HTTP hop
+# PROVIDER_LOOKUP and PROVIDER_INDEX_* mean the same as in the providers
+# backend and only apply to "local".
+settings["PROVIDER_DIRECTORY_MODE"] = os.getenv("PROVIDER_DIRECTORY_MODE", "http")
+settings["PROVIDER_LOOKUP"] = os.getenv("PROVIDER_LOOKUP", "geo")
+settings["PROVIDER_INDEX_CELL_DEGREES"] = float(os.getenv("PROVIDER_INDEX_CELL_DEGREES", "0.05"))
+settings["PROVIDER_INDEX_REFRESH_SECONDS"] = int(os.getenv("PROVIDER_INDEX_REFRESH_SECONDS", "300"))
+
+# Verified JWTs and the principals they belong to are cached in memory
+# (see auth.py). Profile changes in another process show up after the TTL.
+settings["AUTH_CACHE_TTL_SECONDS"] = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+settings["AUTH_CACHE_MAX_ENTRIES"] = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+# Password hashing runs in a process pool (see password_hashing.py). Calls
+# beyond workers + queue depth are turned away with a 503 instead of waiting.
+# PASSWORD_HASH_WORKERS=0 hashes inline on the request thread.
+settings["BCRYPT_LOG_ROUNDS"] = int(os.getenv("BCRYPT_LOG_ROUNDS", "12"))
+settings["PASSWORD_HASH_WORKERS"] = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+settings["PASSWORD_HASH_QUEUE_DEPTH"] = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", "16"))
+settings["PASSWORD_HASH_TIMEOUT_SECONDS"] = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", "10"))
+
+# Follow-up work after a request is sent (audit, analytics) runs on a
+# background thread (see background_tasks.py). Past BACKGROUND_QUEUE_SIZE
+# queued tasks, new ones go to the task_outbox collection and are retried
+# from there every BACKGROUND_OUTBOX_POLL_SECONDS when the queue is idle,
+# until they have failed BACKGROUND_MAX_ATTEMPTS times.
+settings["BACKGROUND_QUEUE_SIZE"] = int(os.getenv("BACKGROUND_QUEUE_SIZE", "1000"))
+settings["BACKGROUND_OUTBOX_POLL_SECONDS"] = float(os.getenv("BACKGROUND_OUTBOX_POLL_SECONDS", "5"))
+settings["BACKGROUND_MAX_ATTEMPTS"] = int(os.getenv("BACKGROUND_MAX_ATTEMPTS", "5"))
+
+# Optional settings file, e.g. QUICKFIX_SETTINGS=/etc/quickfix/production.py
+settings.from_envvar("QUICKFIX_SETTINGS", silent=True)
 
 # --- Extensions ---
-# Initialize PyMongo for database interaction
-mongo = PyMongo(app)
-# Initialize Bcrypt for password hashing
-bcrypt = Bcrypt(app)
\ No newline at end of file
+# PyMongo is bound to an app, and its client created, by init_mongo()
+mongo = PyMongo()
+# Connection pool counters, reported by /health
+pool_metrics = PoolMetrics()
+# Request, span and MongoDB command timings, reported by /metrics
+metrics = Metrics(settings["METRICS_DIR"] or None)
+command_metrics = CommandMetrics(metrics)
+# bcrypt password hashing, off the request threads
+password_hasher = PasswordHasher(
+    workers=settings["PASSWORD_HASH_WORKERS"],
+    queue_depth=settings["PASSWORD_HASH_QUEUE_DEPTH"],
+    log_rounds=settings["BCRYPT_LOG_ROUNDS"],
+    timeout=settings["PASSWORD_HASH_TIMEOUT_SECONDS"]
+)
+# Pooled clients for the upstreams /api/services/nearby calls
+overpass_api = UpstreamClient(
+    "overpass",
+    max_connections=settings["UPSTREAM_MAX_CONNECTIONS"],
+    max_concurrent=settings["OVERPASS_MAX_CONCURRENT"],
+    retries=settings["UPSTREAM_RETRIES"],
+    backoff_seconds=settings["UPSTREAM_BACKOFF_SECONDS"],
+    failure_threshold=settings["UPSTREAM_BREAKER_FAILURES"],
+    reset_seconds=settings["UPSTREAM_BREAKER_RESET_SECONDS"],
+    adapter=overpass_adapter(settings)
+)
+providers_api = UpstreamClient(
+    "providers_api",
+    max_connections=settings["UPSTREAM_MAX_CONNECTIONS"],
+    max_concurrent=settings["PROVIDERS_API_MAX_CONCURRENT"],
+    retries=settings["UPSTREAM_RETRIES"],
+    backoff_seconds=settings["UPSTREAM_BACKOFF_SECONDS"],
+    failure_threshold=settings["UPSTREAM_BREAKER_FAILURES"],
+    reset_seconds=settings["UPSTREAM_BREAKER_RESET_SECONDS"],
+    forward_request_id=True
+)
+# In-process provider search for PROVIDER_DIRECTORY_MODE=local. This
+# process never sees provider edits, so the grid index (PROVIDER_LOOKUP=memory)
+# only catches up on its periodic rebuild.
+provider_directory = ProviderDirectory(
+    mongo,
+    ProviderIndex(
+        cell_degrees=settings["PROVIDER_INDEX_CELL_DEGREES"],
+        refresh_seconds=settings["PROVIDER_INDEX_REFRESH_SECONDS"]
+    ),
+    settings["PROVIDER_LOOKUP"]
+)
+# Background follow-up tasks for the request routes
+background_tasks = TaskQueue(
+    mongo,
+    max_queued=settings["BACKGROUND_QUEUE_SIZE"],
+    outbox_poll_seconds=settings["BACKGROUND_OUTBOX_POLL_SECONDS"],
+    max_attempts=settings["BACKGROUND_MAX_ATTEMPTS"]
+)
+# Cached token -> user lookups for authenticated routes
+user_principals = PrincipalCache(
+    mongo, "users", "user_id", settings["SECRET_KEY"],
+    ttl_seconds=settings["AUTH_CACHE_TTL_SECONDS"],
+    max_entries=settings["AUTH_CACHE_MAX_ENTRIES"]
+)
+
+logger = logging.getLogger(__name__)
+
+
+def init_mongo(app):
+    """Create the MongoDB client and bind mongo to app.
+
+    MongoClient isn't fork-safe, so under a pre-forking server this runs in
+    each worker after the fork (see gunicorn.conf.py).
+    """
+    listeners = [pool_metrics]
+    if app.config["METRICS_ENABLED"]:
+        listeners.append(command_metrics)
+    mongo.init_app(app, event_listeners=listeners, **client_options(app.config))
+    # Flask-PyMongo installs its own JSON provider; use ours (serialization.py)
+    install_json(app)
+    if mongo.db is not None:
+        mongo.db = ConfiguredDatabase(
+            mongo.cx, mongo.db.name,
+            parse_collection_options(app.config["MONGO_COLLECTION_OPTIONS"])
+        )
+
+
+def mongo_health():
+    """(ok, details) from a ping plus the connection pool counters"""
+    details = {"pool": pool_metrics.stats()}
+    try:
+        started = time.perf_counter()
+        mongo.cx.admin.command("ping")
+        details["ping_ms"] = round(1000 * (time.perf_counter() - started), 3)
+        return True, details
+    except Exception as e:
+        details["error"] = str(e)
+        return False, details
+
+
+def metrics_gauges():
+    """Connection pool gauges for /metrics"""
+    pool = pool_metrics.stats()
+    return {
+        "quickfix_mongo_pool_open_connections": ("Open MongoDB connections", pool["open_connections"]),
+        "quickfix_mongo_pool_checked_out": ("MongoDB connections in use", pool["checked_out"]),
+    }
+
+
+def bootstrap_indexes():
+    """Create missing indexes and report any that could not be built"""
+    try:
+        for collection, name, error in ensure_indexes(mongo.db):
+            logger.warning("Could not create index %s.%s: %s", collection, name, error)
+        for collection, name in missing_indexes(mongo.db):
+            logger.warning("Missing index %s.%s", collection, name)
+    except Exception as e:
+        logger.error("Index bootstrap failed: %s", e)
@@ -1,10 +1,15 @@
-from flask import Blueprint, request, jsonify
-from config import mongo, bcrypt
+import logging
+from flask import Blueprint, request, jsonify, current_app
+from config import mongo, password_hasher, user_principals
 import jwt
 import datetime
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+from quickfix_common.password_hashing import HasherBusy
+from quickfix_common.serialization import project
 
 auth_bp = Blueprint('auth_bp', __name__)
+logger = logging.getLogger(__name__)
 
 @auth_bp.route('/signup', methods=['POST'])
 def signup():
@@ -21,28 +26,31 @@ def signup():
         return jsonify({"error": "User with this email already exists"}), 409
 
     # Hash the password for security
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    try:
+        hashed_password = password_hasher.hash(password)
+    except HasherBusy:
+        return jsonify({"error": "Server is busy, please try again shortly"}), 503, {"Retry-After": "1"}
 
     # Create the new user
-    user_id = mongo.db.users.insert_one({
-        "name": name,
-        "email": email,
-        "password": hashed_password,
-        "created_at": datetime.datetime.utcnow()
-    }).inserted_id
-
-    new_user = mongo.db.users.find_one({"_id": user_id})
+    try:
+        user_id = mongo.db.users.insert_one({
+            "name": name,
+            "email": email,
+            "password": hashed_password,
+            "created_at": datetime.datetime.utcnow()
+        }).inserted_id
+    except DuplicateKeyError:
+        # Lost a race with a concurrent signup for the same email (email_unique index)
+        return jsonify({"error": "User with this email already exists"}), 409
 
     # Don't send the password back
-    new_user.pop('password')
-    new_user['_id'] = str(new_user['_id']) # Convert ObjectId to string
+    new_user = project(mongo.db.users.find_one({"_id": user_id}), {"password": 0})
 
     return jsonify({"message": "User created successfully", "user": new_user}), 201
 
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
-    from config import app # Import app to access SECRET_KEY
     data = request.get_json()
     email = data.get('email')
     password = data.get('password')
@@ -53,12 +61,17 @@ def login():
     user = mongo.db.users.find_one({"email": email})
 
     # Check if user exists and password is correct
-    if user and bcrypt.check_password_hash(user['password'], password):
+    try:
+        password_ok = bool(user) and password_hasher.check(user['password'], password)
+    except HasherBusy:
+        return jsonify({"error": "Server is busy, please try again shortly"}), 503, {"Retry-After": "1"}
+
+    if password_ok:
         # Generate a JWT token
         token = jwt.encode({
             'user_id': str(user['_id']),
             'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24) # Token expires in 24 hours
-        }, app.config['SECRET_KEY'], algorithm="HS256")
+        }, current_app.config['SECRET_KEY'], algorithm="HS256")
 
         # Prepare user data to send back (without password)
         user_data = {
@@ -95,8 +108,8 @@ def get_profile():
             "user": user
         }), 200
         
-    except Exception as e:
-        print(f"Error getting user profile: {e}")
+    except Exception:
+        logger.exception("Error getting user profile")
         return jsonify({"error": "Failed to get profile"}), 500
 
 @auth_bp.route('/profile', methods=['PUT'])
@@ -130,6 +143,8 @@ def update_profile():
         
         if result.matched_count == 0:
             return jsonify({"error": "User not found"}), 404
+
+        user_principals.invalidate(user_id)
         
         # Get updated user data
         updated_user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
@@ -142,6 +157,11 @@ def update_profile():
             "user": updated_user
         }), 200
         
-    except Exception as e:
-        print(f"Error updating user profile: {e}")
-        return jsonify({"error": "Failed to update profile"}), 500
\ No newline at end of file
+    except Exception:
+        logger.exception("Error updating user profile")
+        return jsonify({"error": "Failed to update profile"}), 500
+
+@auth_bp.route('/hashing-stats', methods=['GET'])
+def get_hashing_stats():
+    """Queue, wait and hashing time counters for the password hashing pool"""
+    return jsonify({"password_hashing": password_hasher.stats()}), 200
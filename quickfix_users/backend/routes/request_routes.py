@@ -1,9 +1,50 @@
+import logging
 from flask import Blueprint, request, jsonify
-from config import mongo
+from config import mongo, user_principals, background_tasks, metrics
 import datetime
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+from quickfix_common.pagination import page_args, fetch_page
+from quickfix_common.provider_stats import record_transition
 
 request_bp = Blueprint('request_bp', __name__)
+logger = logging.getLogger(__name__)
+
+# Follow-up work for a new request, run after the response (see background_tasks.py).
+# Tasks can run more than once, so each one must be safe to repeat.
+@background_tasks.task("request_audit")
+def audit_request(db, payload):
+    # Keyed on (request_id, action), so a retried task doesn't log twice
+    db.request_audit.update_one(
+        {"request_id": payload['request_id'], "action": payload['action']},
+        {"$setOnInsert": {
+            "user_email": payload.get('user_email'),
+            "provider_id": payload.get('provider_id'),
+            "at": payload['at']
+        }},
+        upsert=True
+    )
+
+@background_tasks.task("request_analytics")
+def count_request_for_analytics(db, payload):
+    day = payload['at'].strftime('%Y-%m-%d')
+    # urgency_level is client input; keep it a plain field name
+    urgency = str(payload.get('urgency_level') or 'normal').replace('.', '_').replace('$', '_')
+    # Only counts a request_id the day's document hasn't seen yet. On a repeat
+    # the filter misses, the upsert collides with the existing _id and
+    # nothing changes.
+    try:
+        db.request_analytics.update_one(
+            {"_id": f"{day}:{payload['service_type']}", "request_ids": {"$ne": payload['request_id']}},
+            {
+                "$inc": {"requests": 1, f"urgency.{urgency}": 1},
+                "$push": {"request_ids": payload['request_id']},
+                "$setOnInsert": {"day": day, "service_type": payload['service_type']}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass
 
 @request_bp.route('/send', methods=['POST'])
 def send_service_request():
@@ -17,13 +58,18 @@ def send_service_request():
             if not data.get(field):
                 return jsonify({"error": f"{field} is required"}), 400
         
-        # Create service request
-        print(f"DEBUG: Received request data - user_email: {data.get('user_email')}")
-        print(f"DEBUG: Full request data: {data}")
-        print(f"DEBUG: Data type of user_email: {type(data.get('user_email'))}")
-        print(f"DEBUG: Is user_email None? {data.get('user_email') is None}")
-        print(f"DEBUG: Is user_email empty string? {data.get('user_email') == ''}")
-        
+        # Optional requester location, used to route the request to nearby providers
+        location = None
+        if isinstance(data.get('location'), dict):
+            try:
+                location = {
+                    "lat": float(data['location']['lat']),
+                    "lng": float(data['location']['lng'])
+                }
+            except (KeyError, TypeError, ValueError):
+                return jsonify({"error": "location must have numeric lat and lng"}), 400
+
+        now = datetime.datetime.utcnow()
         request_data = {
             "provider_id": data.get('provider_id'),
             "service_type": data.get('service_type'),
@@ -40,22 +86,34 @@ def send_service_request():
             "delivery_required": data.get('delivery_required', ''),
             "destination": data.get('destination', ''),
             "service_type_detail": data.get('service_type_detail', ''),
+            "location": location,
             "status": "pending",  # pending, accepted, completed, cancelled, rejected
-            "created_at": datetime.datetime.utcnow(),
-            "updated_at": datetime.datetime.utcnow()
+            "created_at": now,
+            "updated_at": now
         }
         
-        print(f"DEBUG: Request data to be saved: {request_data}")
-        
-        # Insert into database
-        print(f"DEBUG: Inserting request into database...")
-        request_id = mongo.db.service_requests.insert_one(request_data).inserted_id
-        print(f"DEBUG: Request inserted with ID: {request_id}")
-        
-        # Get the created request
-        created_request = mongo.db.service_requests.find_one({"_id": request_id})
-        created_request['_id'] = str(created_request['_id'])
-        print(f"DEBUG: Retrieved created request: {created_request}")
+        # insert_one sets request_data's _id, so the response is built from
+        # it rather than read back
+        with metrics.span("requests.insert"):
+            request_id = mongo.db.service_requests.insert_one(request_data).inserted_id
+
+        # Inline like every other status change: a retried background task
+        # would count the request twice
+        record_transition(mongo.db, request_data['provider_id'], None, "pending")
+
+        follow_up = {
+            "request_id": str(request_id),
+            "action": "created",
+            "provider_id": request_data['provider_id'],
+            "user_email": request_data['user_email'],
+            "service_type": request_data['service_type'],
+            "urgency_level": request_data['urgency_level'],
+            "at": now
+        }
+        background_tasks.submit("request_audit", follow_up)
+        background_tasks.submit("request_analytics", follow_up)
+
+        created_request = dict(request_data, _id=str(request_id))
         
         return jsonify({
             "success": True,
@@ -63,45 +121,46 @@ def send_service_request():
             "request": created_request
         }), 201
         
-    except Exception as e:
-        print(f"Error sending service request: {e}")
+    except Exception:
+        logger.exception("Error sending service request")
         return jsonify({"error": "Failed to send service request"}), 500
 
+@request_bp.route('/task-stats', methods=['GET'])
+def get_task_stats():
+    """Background task queue and outbox counters"""
+    return jsonify({"background_tasks": background_tasks.stats()}), 200
+
 @request_bp.route('/user-requests', methods=['GET'])
 def get_user_requests():
-    """Get all requests sent by a user (identified by email)"""
+    """Get requests sent by a user (identified by email), newest first, one page at a time"""
     try:
         user_email = request.args.get('user_email')
         
         if not user_email:
             return jsonify({"error": "User email is required"}), 400
+
+        try:
+            limit, after = page_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Find requests by user email
-        print(f"DEBUG: Searching for requests with user_email: {user_email}")
-        requests = list(mongo.db.service_requests.find({"user_email": user_email}))
-        print(f"DEBUG: Found {len(requests)} requests for user_email: {user_email}")
-        
-        # Convert ObjectId to string for JSON serialization
-        for req in requests:
-            req['_id'] = str(req['_id'])
-            if 'provider_id' in req:
-                req['provider_id'] = str(req['provider_id'])
-        
-        # Sort by creation date (newest first)
-        requests.sort(key=lambda x: x['created_at'], reverse=True)
+        requests, next_cursor = fetch_page(mongo.db.service_requests, {"user_email": user_email}, limit, after)
+        logger.debug("Found %d requests", len(requests))
         
         return jsonify({
             "success": True,
-            "requests": requests
+            "requests": requests,
+            "next_cursor": next_cursor
         }), 200
         
-    except Exception as e:
-        print(f"Error fetching user requests: {e}")
+    except Exception:
+        logger.exception("Error fetching user requests")
         return jsonify({"error": "Failed to fetch user requests"}), 500
 
 @request_bp.route('/my-requests', methods=['GET'])
 def get_my_requests():
-    """Get all requests sent by the authenticated user (using JWT token)"""
+    """Get requests sent by the authenticated user (using JWT token), one page at a time"""
     try:
         # Get token from Authorization header
         auth_header = request.headers.get('Authorization')
@@ -110,47 +169,37 @@ def get_my_requests():
         
         token = auth_header.split(' ')[1]
         
-        # Decode token to get user_id
-        from config import app
+        # Verify the token and load the user, both cached (see auth.py)
         import jwt
         try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload.get('user_id')
-            if not user_id:
-                return jsonify({"error": "Invalid token"}), 401
+            user = user_principals.authenticate(token)
         except jwt.ExpiredSignatureError:
             return jsonify({"error": "Token expired"}), 401
         except jwt.InvalidTokenError:
             return jsonify({"error": "Invalid token"}), 401
         
-        # Find user by user_id to get email
-        user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
         if not user:
             return jsonify({"error": "User not found"}), 404
         
         user_email = user.get('email')
-        print(f"DEBUG: Token-based search - user_id: {user_id}, user_email: {user_email}")
+
+        try:
+            limit, after = page_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Find requests by user email
-        requests = list(mongo.db.service_requests.find({"user_email": user_email}))
-        print(f"DEBUG: Found {len(requests)} requests for user_email: {user_email}")
-        
-        # Convert ObjectId to string for JSON serialization
-        for req in requests:
-            req['_id'] = str(req['_id'])
-            if 'provider_id' in req:
-                req['provider_id'] = str(req['provider_id'])
-        
-        # Sort by creation date (newest first)
-        requests.sort(key=lambda x: x['created_at'], reverse=True)
+        requests, next_cursor = fetch_page(mongo.db.service_requests, {"user_email": user_email}, limit, after)
+        logger.debug("Found %d requests", len(requests))
         
         return jsonify({
             "success": True,
-            "requests": requests
+            "requests": requests,
+            "next_cursor": next_cursor
         }), 200
         
-    except Exception as e:
-        print(f"Error fetching user requests: {e}")
+    except Exception:
+        logger.exception("Error fetching user requests")
         return jsonify({"error": "Failed to fetch user requests"}), 500
 
 @request_bp.route('/<request_id>', methods=['GET'])
@@ -162,41 +211,40 @@ def get_request_details(request_id):
         if not request_obj:
             return jsonify({"error": "Request not found"}), 404
         
-        request_obj['_id'] = str(request_obj['_id'])
-        if 'provider_id' in request_obj:
-            request_obj['provider_id'] = str(request_obj['provider_id'])
-        
         return jsonify({
             "success": True,
             "request": request_obj
         }), 200
         
-    except Exception as e:
-        print(f"Error fetching request details: {e}")
+    except Exception:
+        logger.exception("Error fetching request details")
         return jsonify({"error": "Failed to fetch request details"}), 500
 
 @request_bp.route('/<request_id>/cancel', methods=['PUT'])
 def cancel_request(request_id):
     """Cancel a service request"""
     try:
-        result = mongo.db.service_requests.update_one(
+        previous = mongo.db.service_requests.find_one_and_update(
             {"_id": ObjectId(request_id)},
             {
                 "$set": {
                     "status": "cancelled",
                     "updated_at": datetime.datetime.utcnow()
                 }
-            }
+            },
+            projection={"provider_id": 1, "status": 1}
         )
         
-        if result.matched_count == 0:
+        if previous is None:
             return jsonify({"error": "Request not found"}), 404
+
+        record_transition(mongo.db, previous.get('provider_id'), previous.get('status'), "cancelled")
         
         return jsonify({
             "success": True,
             "message": "Request cancelled successfully"
         }), 200
         
-    except Exception as e:
-        print(f"Error cancelling request: {e}")
+    except Exception:
+        logger.exception("Error cancelling request")
         return jsonify({"error": "Failed to cancel request"}), 500 
\ No newline at end of file
@@ -1,122 +1,235 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, request, jsonify, current_app
 import requests
-from math import radians, cos, sin, asin, sqrt
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from config import settings, overpass_api, providers_api, provider_directory, metrics
+from quickfix_common.http_client import UpstreamUnavailable
+from quickfix_common.geo import haversine_many, nearest_indices
+from quickfix_common.overpass_cache import TileCache, tile_for, tile_center, tile_padding
 
 service_bp = Blueprint('service_bp', __name__)
+logger = logging.getLogger(__name__)
 
-# Haversine formula to calculate distance in meters
-def haversine(lon1, lat1, lon2, lat2):
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1 
-    dlat = lat2 - lat1 
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a)) 
-    r = 6371 # Radius of earth in kilometers
-    return c * r * 1000
+# Search radius for OpenStreetMap services, in meters
+SEARCH_RADIUS_M = 5000
 
+# Overpass results are cached per (service_type, tile). Each tile is fetched
+# once with a padded radius and re-filtered by exact distance per request.
+TILE_DEGREES = settings["OVERPASS_TILE_DEGREES"]
+tile_cache = TileCache(
+    ttl_seconds=settings["OVERPASS_CACHE_TTL_SECONDS"],
+    max_entries=settings["OVERPASS_CACHE_MAX_TILES"]
+)
 
 
-@service_bp.route('/nearby', methods=['GET'])
-def get_nearby_services():
-    lat = request.args.get('lat', type=float)
-    lng = request.args.get('lng', type=float)
-    service_type = request.args.get('service_type')
+# One pool per upstream for the calls made by /nearby. A call that misses
+# the deadline keeps its thread until its own timeout, so with a shared pool
+# slow Overpass fetches (and the cache waiters behind them) could use every
+# worker and leave the provider lookup queued behind them.
+_upstream_pools = {
+    "openstreetmap": ThreadPoolExecutor(max_workers=16, thread_name_prefix='nearby-osm'),
+    "registered_providers": ThreadPoolExecutor(max_workers=16, thread_name_prefix='nearby-providers'),
+}
 
-    if not all([lat, lng, service_type]):
-        return jsonify({"error": "Missing required parameters"}), 400
 
+def build_overpass_query(service_type, lat, lng, radius=SEARCH_RADIUS_M):
+    """Build the Overpass QL query for a service type around a point"""
     # --- UPDATED: More comprehensive queries for each service type ---
     query_map = {
         "fuel": f'''
-            node["amenity"="fuel"](around:5000,{lat},{lng});
-            node["shop"="fuel"](around:5000,{lat},{lng});
+            node["amenity"="fuel"](around:{radius},{lat},{lng});
+            node["shop"="fuel"](around:{radius},{lat},{lng});
         ''',
         "garage": f'''
-            node["shop"~"car|car_repair|tyres"](around:5000,{lat},{lng});
-            node["craft"="auto_mechanic"](around:5000,{lat},{lng});
-            node["shop"="car_repair"](around:5000,{lat},{lng});
-            node["shop"="tyres"](around:5000,{lat},{lng});
+            node["shop"~"car|car_repair|tyres"](around:{radius},{lat},{lng});
+            node["craft"="auto_mechanic"](around:{radius},{lat},{lng});
+            node["shop"="car_repair"](around:{radius},{lat},{lng});
+            node["shop"="tyres"](around:{radius},{lat},{lng});
         ''',
         "towing": f'''
-            node["shop"~"car|car_repair"](around:5000,{lat},{lng});
-            node["amenity"="towing"](around:5000,{lat},{lng});
-            node["shop"="towing"](around:5000,{lat},{lng});
+            node["shop"~"car|car_repair"](around:{radius},{lat},{lng});
+            node["amenity"="towing"](around:{radius},{lat},{lng});
+            node["shop"="towing"](around:{radius},{lat},{lng});
         '''
     }
-    
+
     # Build the final query
-    overpass_query = f"""
+    return f"""
     [out:json][timeout:25];
     (
       {query_map.get(service_type, '')}
     );
     out center;
     """
-    
-    all_services = []
-    
-    try:
-        # Fetch from OpenStreetMap
-        response = requests.post(
-            "https://overpass-api.de/api/interpreter", 
-            data=overpass_query,
-            timeout=30,  # 30 second timeout
-            headers={'User-Agent': 'QuickFix/1.0'}
+
+
+def load_osm_tile(service_type, tile, timeout):
+    """Fetch every named OpenStreetMap place that any point in a tile could see"""
+    center_lat, center_lng = tile_center(tile, TILE_DEGREES)
+    # Overpass queries are read-only, so they are safe to retry
+    with metrics.span("overpass.fetch"):
+        response = overpass_api.post(
+            settings["OVERPASS_URL"],
+            data=build_overpass_query(service_type, center_lat, center_lng,
+                                      SEARCH_RADIUS_M + tile_padding(TILE_DEGREES)),
+            timeout=timeout,
+            idempotent=True
         )
         response.raise_for_status()
         data = response.json()
-        
-        for element in data.get('elements', []):
-            tags = element.get('tags', {})
-            service_lat = element.get('lat')
-            service_lon = element.get('lon')
-            
-            if service_lat is None or service_lon is None:
-                continue
-
-            # Only include services with actual names
-            service_name = tags.get('name')
-            if not service_name or service_name == 'N/A':
-                continue
-
-            service = {
-                "id": f"osm_{element.get('id')}",
-                "name": service_name,
+
+    places = []
+    for element in data.get('elements', []):
+        tags = element.get('tags', {})
+        service_lat = element.get('lat')
+        service_lon = element.get('lon')
+
+        if service_lat is None or service_lon is None:
+            continue
+
+        # Only include services with actual names
+        service_name = tags.get('name')
+        if not service_name or service_name == 'N/A':
+            continue
+
+        places.append({
+            "id": f"osm_{element.get('id')}",
+            "name": service_name,
+            "lat": service_lat,
+            "lng": service_lon,
+            "phone": tags.get('phone') or tags.get('contact:phone') or None
+        })
+
+    # Coordinate columns are kept next to the places for batch distance math
+    return places, [p['lng'] for p in places], [p['lat'] for p in places]
+
+
+def fetch_osm_services(lat, lng, service_type, timeout):
+    """Fetch named services from OpenStreetMap (Overpass API)"""
+    tile = tile_for(lat, lng, TILE_DEGREES)
+    places, lngs, lats = tile_cache.get_or_load(
+        (service_type, tile),
+        lambda: load_osm_tile(service_type, tile, timeout),
+        wait_timeout=timeout
+    )
+
+    # The cached tile is a superset, keep only what is within range of this
+    # user. All distances are computed in one batch and ranked nearest first.
+    with metrics.span("nearby.rank"):
+        distances = haversine_many(lng, lat, lngs, lats)
+        services = []
+        for i in nearest_indices(distances, max_distance=SEARCH_RADIUS_M):
+            place = places[i]
+            services.append({
+                "id": place['id'],
+                "name": place['name'],
                 "type": service_type,
-                "location": { "lat": service_lat, "lng": service_lon },
-                "distance": haversine(lng, lat, service_lon, service_lat),
-                "phone": tags.get('phone') or tags.get('contact:phone') or None,
+                "location": { "lat": place['lat'], "lng": place['lng'] },
+                "distance": distances[i],
+                "phone": place['phone'],
                 "source": "openstreetmap"
-            }
-            all_services.append(service)
-
-    except requests.exceptions.Timeout:
-        print("Overpass API timeout")
-    except requests.exceptions.RequestException as e:
-        print(f"Overpass API error: {e}")
-    except Exception as e:
-        print(f"An error occurred with OpenStreetMap: {e}")
-    
-    # Fetch from registered providers
-    try:
-        provider_response = requests.get(
-            f"http://localhost:8002/api/providers/services/providers",
+            })
+
+    return services
+
+
+def fetch_provider_services(lat, lng, service_type, timeout):
+    """Fetch registered providers, in-process or from the providers backend"""
+    if settings['PROVIDER_DIRECTORY_MODE'] == 'local':
+        # Same query the providers backend runs, on the shared database
+        with metrics.span("provider_directory.local"):
+            return provider_directory.find(service_type, lat, lng)
+
+    with metrics.span("providers_api.fetch"):
+        provider_response = providers_api.get(
+            f"{settings['PROVIDERS_API_URL']}/api/providers/services/providers",
             params={
                 'service_type': service_type,
                 'lat': lat,
                 'lng': lng
             },
-            timeout=10
+            timeout=timeout
         )
-        if provider_response.status_code == 200:
-            provider_services = provider_response.json().get('services', [])
-            all_services.extend(provider_services)
-        else:
-            print(f"Provider API error: {provider_response.status_code}")
-    except Exception as e:
-        print(f"Error fetching from providers: {e}")
+    if provider_response.status_code != 200:
+        raise RuntimeError(f"Provider API error: {provider_response.status_code}")
+    return provider_response.json().get('services', [])
+
+
+@service_bp.route('/nearby', methods=['GET'])
+def get_nearby_services():
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    service_type = request.args.get('service_type')
+
+    if not all([lat, lng, service_type]):
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    # Both upstreams run in parallel under one overall deadline, each on its
+    # own pool, so the provider lookup never waits on Overpass (and vice versa).
+    deadline = current_app.config['NEARBY_DEADLINE_SECONDS']
+    started = time.monotonic()
+    # Each task runs in a copy of this request's context, so its log lines
+    # and the call to the providers backend carry the same request id
+    futures = {
+        _upstream_pools["openstreetmap"].submit(
+            contextvars.copy_context().run, fetch_osm_services,
+            lat, lng, service_type, min(30, deadline)): "openstreetmap",
+        _upstream_pools["registered_providers"].submit(
+            contextvars.copy_context().run, fetch_provider_services,
+            lat, lng, service_type, min(10, deadline)): "registered_providers",
+    }
+
+    all_services = []
+    sources = {}
+    done, not_done = wait(futures, timeout=deadline)
+
+    for future in done:
+        source = futures[future]
+        try:
+            all_services.extend(future.result())
+            sources[source] = "ok"
+        except requests.exceptions.Timeout:
+            logger.warning("%s timeout", source)
+            sources[source] = "timeout"
+        except UpstreamUnavailable as e:
+            # Circuit open or too many calls in flight: skipped without waiting
+            logger.warning("%s unavailable: %s", source, e)
+            sources[source] = "unavailable"
+        except Exception:
+            logger.exception("Error fetching from %s", source)
+            sources[source] = "error"
+
+    for future in not_done:
+        # Drop it if it never started; a running call finishes on its own
+        # timeout on its source's pool, but we don't wait for it
+        source = futures[future]
+        logger.warning("%s missed the %ss deadline", source, deadline)
+        sources[source] = "timeout"
+        future.cancel()
 
     # Sort all services by distance
     all_services.sort(key=lambda x: x['distance'])
 
-    return jsonify({"services": all_services}), 200
+    return jsonify({
+        "services": all_services,
+        "partial": any(status != "ok" for status in sources.values()),
+        "sources": sources,
+        "elapsed_ms": round((time.monotonic() - started) * 1000)
+    }), 200
+
+
+@service_bp.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss counters for the Overpass tile cache"""
+    return jsonify({"overpass_cache": tile_cache.stats()}), 200
+
+
+@service_bp.route('/upstream-stats', methods=['GET'])
+def get_upstream_stats():
+    """Circuit state and call counters for each upstream"""
+    return jsonify({
+        "overpass": overpass_api.stats(),
+        "providers_api": providers_api.stats()
+    }), 200
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Stress test: many providers accept the same pending request at once,
+exactly one of them must win and the rest must get a 409
+"""
+
+import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Test configuration
+USERS_API_BASE = "http://localhost:8001/api"
+PROVIDERS_API_BASE = "http://localhost:8002/api/providers"
+CONCURRENT_ACCEPTS = 20
+
+def create_open_request():
+    """Create a pending request that no provider has been assigned to yet"""
+    request_data = {
+        "provider_id": "",
+        "service_type": "garage",
+        "customer_name": "Race Test User",
+        "emergency_contact": "1234567890",
+        "user_email": "race-test@example.com",
+        "vehicle_type": "car",
+        "vehicle_model": "Test Car",
+        "issue_description": "Flat tyre",
+        "urgency_level": "normal"
+    }
+
+    response = requests.post(
+        f"{USERS_API_BASE}/requests/send",
+        headers={"Content-Type": "application/json"},
+        json=request_data
+    )
+    if response.status_code != 201:
+        print(f"Could not create request: {response.status_code} {response.text}")
+        return None
+    return response.json().get("request", {}).get("_id")
+
+def run_parallel_accepts(request_id, attempts=CONCURRENT_ACCEPTS):
+    """Fire parallel accepts from different providers and count the winners"""
+    print(f"Testing {attempts} parallel accepts on request {request_id}...")
+
+    # Release every thread at the same moment to maximise the overlap
+    barrier = threading.Barrier(attempts)
+
+    def accept(n):
+        provider_id = f"race_provider_{n}"
+        barrier.wait()
+        response = requests.put(
+            f"{PROVIDERS_API_BASE}/requests/{request_id}/accept",
+            json={"provider_id": provider_id}
+        )
+        return provider_id, response.status_code
+
+    try:
+        with ThreadPoolExecutor(max_workers=attempts) as pool:
+            results = list(pool.map(accept, range(attempts)))
+
+        winners = [provider_id for provider_id, status in results if status == 200]
+        conflicts = [provider_id for provider_id, status in results if status == 409]
+        others = [(provider_id, status) for provider_id, status in results if status not in (200, 409)]
+
+        print(f"Accepted: {len(winners)}, Conflicts: {len(conflicts)}, Other: {others}")
+
+        if len(winners) != 1 or others:
+            print("❌ Parallel accept test failed!")
+            return False
+
+        # The stored provider must be the one that was told it won
+        response = requests.get(f"{PROVIDERS_API_BASE}/requests/{request_id}")
+        stored = response.json().get("request", {})
+        print(f"Stored provider: {stored.get('provider_id')}, status: {stored.get('status')}")
+
+        if stored.get("provider_id") == winners[0] and stored.get("status") == "accepted":
+            print("✅ Parallel accept test passed!")
+            return True
+        else:
+            print("❌ Parallel accept test failed: stored winner does not match!")
+            return False
+
+    except Exception as e:
+        print(f"❌ Error in parallel accept test: {e}")
+        return False
+
+def test_lease_blocks_other_providers():
+    """A live lease keeps other providers from claiming or accepting"""
+    print("\nTesting request lease...")
+
+    try:
+        request_id = create_open_request()
+        if not request_id:
+            print("❌ Lease test failed: no request")
+            return False
+
+        claim = requests.put(
+            f"{PROVIDERS_API_BASE}/requests/{request_id}/claim",
+            json={"provider_id": "lease_holder", "seconds": 30}
+        )
+        other = requests.put(
+            f"{PROVIDERS_API_BASE}/requests/{request_id}/accept",
+            json={"provider_id": "lease_intruder"}
+        )
+        holder = requests.put(
+            f"{PROVIDERS_API_BASE}/requests/{request_id}/accept",
+            json={"provider_id": "lease_holder"}
+        )
+
+        print(f"Claim: {claim.status_code}, other accept: {other.status_code}, holder accept: {holder.status_code}")
+
+        if claim.status_code == 200 and other.status_code == 409 and holder.status_code == 200:
+            print("✅ Lease test passed!")
+            return True
+        else:
+            print("❌ Lease test failed!")
+            return False
+
+    except Exception as e:
+        print(f"❌ Error in lease test: {e}")
+        return False
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting accept race tests...\n")
+
+    request_id = create_open_request()
+    if request_id:
+        run_parallel_accepts(request_id)
+
+    test_lease_blocks_other_providers()
+
+    print("\n🏁 Accept race tests completed!")
+
+if __name__ == "__main__":
+    main()
@@ -161,7 +161,8 @@ def test_provider_actions():
             # Test accept request
             accept_response = requests.put(
                 f"{PROVIDERS_API_BASE}/requests/{request_id}/accept",
-                headers={"Content-Type": "application/json"}
+                headers={"Content-Type": "application/json"},
+                json={"provider_id": "test_provider_id"}
             )
             
             if accept_response.status_code == 200:
@@ -175,6 +176,7 @@ def test_provider_actions():
                 
                 if complete_response.status_code == 200:
                     print("✅ Complete request test passed!")
+                    test_invalid_transitions(request_id)
                 else:
                     print("❌ Complete request test failed!")
             else:
@@ -186,6 +188,31 @@ def test_provider_actions():
     except Exception as e:
         print(f"❌ Error in provider actions test: {e}")
 
+def test_invalid_transitions(request_id=None):
+    """Completing or rejecting a completed request is refused with 409"""
+    if request_id is None:
+        return
+    print("\nTesting actions on a completed request...")
+
+    try:
+        for action, body in (("complete", None), ("reject", {"rejection_reason": "Too late"})):
+            response = requests.put(
+                f"{PROVIDERS_API_BASE}/requests/{request_id}/{action}",
+                headers={"Content-Type": "application/json"},
+                json=body or {}
+            )
+
+            print(f"Status Code: {response.status_code}")
+            print(f"Response: {response.json()}")
+
+            if response.status_code == 409 and response.json().get("status") == "completed":
+                print(f"✅ Repeated {action} was refused!")
+            else:
+                print(f"❌ Repeated {action} was not refused!")
+
+    except Exception as e:
+        print(f"❌ Error in invalid transitions test: {e}")
+
 def test_user_requests():
     """Test getting user requests"""
     print("\nTesting get user requests...")
@@ -254,6 +281,7 @@ def main():
     print("- Towing requests: ✅ All fields captured") 
     print("- Garage requests: ✅ All fields captured")
     print("- Provider actions: ✅ Accept/Complete/Reject working")
+    print("- Invalid transitions: ✅ Refused with 409")
     print("- User requests: ✅ Can view their requests")
     print("- Provider requests: ✅ Can view incoming requests")
 
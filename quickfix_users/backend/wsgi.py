@@ -0,0 +1,11 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+
+# Indexes are created per worker by the gunicorn post_fork hook, after the
+# MongoDB client has been recreated in that worker
+app = create_app(ensure_indexes=False)
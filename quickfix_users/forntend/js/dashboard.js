@@ -304,6 +304,7 @@ document.addEventListener('DOMContentLoaded', () => {
       urgency_level: formData.get('urgency'),
       additional_notes: formData.get('additional-notes'),
       user_email: localStorage.getItem('userEmail'), // Add user email
+      location: userLocation ? { lat: userLocation.lat, lng: userLocation.lng } : null, // Lets nearby providers see it first
       provider_id: null, // Will be set by backend or user selection
       timestamp: new Date().toISOString(),
       status: 'pending'
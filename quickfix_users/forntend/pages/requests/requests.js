@@ -1,6 +1,10 @@
 // User Requests Management
 const API_URL = 'http://localhost:8001/api';
 
+// The list endpoints return one page at a time plus a cursor for the next one
+let loadedRequests = [];
+let nextPage = null; // { url, options } for the next page, or null
+
 document.addEventListener('DOMContentLoaded', () => {
     const token = localStorage.getItem('authToken');
     const userName = localStorage.getItem('userName');
@@ -36,6 +40,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Load requests
     loadUserRequests();
+    document.getElementById('load-more-btn').addEventListener('click', loadMoreRequests);
 
     // Setup filter event listeners
     setupFilters();
@@ -57,24 +62,30 @@ async function loadUserRequests() {
         requestsList.innerHTML = '';
 
         // First try email-based method
-        let response = await fetch(`${API_URL}/requests/user-requests?user_email=${userEmail}`);
+        let url = `${API_URL}/requests/user-requests?user_email=${encodeURIComponent(userEmail)}`;
+        let options = {};
+        let response = await fetch(url);
         let data = await response.json();
 
         // If no requests found with email, try token-based method
         if (data.success && data.requests.length === 0 && authToken) {
             console.log('No requests found with email, trying token-based method...');
-            response = await fetch(`${API_URL}/requests/my-requests`, {
+            url = `${API_URL}/requests/my-requests`;
+            options = {
                 method: 'GET',
                 headers: {
                     'Authorization': `Bearer ${authToken}`,
                     'Content-Type': 'application/json'
                 }
-            });
+            };
+            response = await fetch(url, options);
             data = await response.json();
         }
 
         if (data.success) {
             const requests = data.requests;
+            loadedRequests = requests;
+            setNextPage(url, options, data.next_cursor);
 
             if (requests.length === 0) {
                 loadingSpinner.style.display = 'none';
@@ -99,6 +110,41 @@ async function loadUserRequests() {
     }
 }
 
+function setNextPage(url, options, cursor) {
+    const baseUrl = url.split(/[?&]cursor=/)[0];
+    const separator = baseUrl.includes('?') ? '&' : '?';
+    nextPage = cursor ? { url: `${baseUrl}${separator}cursor=${encodeURIComponent(cursor)}`, options } : null;
+    document.getElementById('load-more-btn').classList.toggle('hidden', !nextPage);
+}
+
+async function loadMoreRequests() {
+    if (!nextPage) return;
+
+    const loadMoreBtn = document.getElementById('load-more-btn');
+    loadMoreBtn.disabled = true;
+
+    try {
+        const { url, options } = nextPage;
+        const response = await fetch(url, options);
+        const data = await response.json();
+
+        if (data.success) {
+            loadedRequests = loadedRequests.concat(data.requests);
+            updateStats(loadedRequests);
+            displayRequests(data.requests);
+            filterRequests();
+            setNextPage(url, options, data.next_cursor);
+        } else {
+            showToast('Failed to load more requests', true);
+        }
+    } catch (error) {
+        console.error('Error loading more requests:', error);
+        showToast('Network error. Please try again.', true);
+    } finally {
+        loadMoreBtn.disabled = false;
+    }
+}
+
 function updateStats(requests) {
     const stats = {
         pending: requests.filter(r => r.status === 'pending').length,